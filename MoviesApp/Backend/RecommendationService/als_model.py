@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Matrix-factorization collaborative engine (implicit-feedback ALS).
+
+Ratings are treated as implicit feedback: a rating of `liked_rating` or
+more is a positive preference, anything lower a negative one, and every
+rating's confidence grows with its value (1 + alpha * rating). Alternating
+least squares learns a rank-`factors` vector for every user and title, so
+recommending is one dot product per title, independent of the number of
+users:
+
+    python als_model.py --output als_model.npz --factors 32 --iterations 10
+
+Users who have rated something since the model was trained (or who are not
+in it at all) are folded in from their current ratings with a single
+least-squares solve against the fixed title factors.
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger('recommendation_service')
+
+
+def _solve_rows(ratings, fixed, regularization, alpha, liked_rating):
+    """
+    One ALS half-step: solve every row of `ratings` against the fixed factors.
+
+    Args:
+        ratings (scipy.sparse.csr_matrix): rows x columns ratings.
+        fixed (array): columns x factors matrix held constant.
+
+    Returns:
+        array: rows x factors solution.
+    """
+    factors = fixed.shape[1]
+    gram = fixed.T @ fixed
+    ridge = regularization * np.eye(factors, dtype=np.float64)
+    solved = np.zeros((ratings.shape[0], factors), dtype=np.float32)
+    for row in range(ratings.shape[0]):
+        start, end = ratings.indptr[row], ratings.indptr[row + 1]
+        if start == end:
+            continue
+        solved[row] = _solve_one(
+            fixed[ratings.indices[start:end]], ratings.data[start:end], gram, ridge, alpha, liked_rating
+        )
+    return solved
+
+
+def _solve_one(rated_factors, values, gram, ridge, alpha, liked_rating):
+    """Least-squares vector for one row given the factors of the columns it rated"""
+    confidence = 1 + alpha * values.astype(np.float64)
+    preference = (values >= liked_rating).astype(np.float64)
+    a = gram + (rated_factors.T * (confidence - 1)) @ rated_factors + ridge
+    b = rated_factors.T @ (confidence * preference)
+    return np.linalg.solve(a, b)
+
+
+def train_als(ratings, user_keys, item_keys, factors=32, iterations=10, regularization=0.1,
+              alpha=2.0, liked_rating=3.5, seed=0):
+    """
+    Train user and title factors on a ratings matrix.
+
+    Args:
+        ratings (scipy.sparse matrix): users x titles rating matrix.
+        user_keys (sequence): user_id of each row.
+        item_keys (sequence): show_id of each column.
+        factors (int): Rank of the factorization.
+        iterations (int): Alternating passes over users and titles.
+        regularization (float): L2 penalty on the factors.
+        alpha (float): Confidence gained per rating point.
+        liked_rating (float): Ratings at or above this count as a positive preference.
+        seed (int): Seed of the random initial title factors.
+
+    Returns:
+        ALSModel: The trained model.
+    """
+    started = time.perf_counter()
+    by_user = sparse.csr_matrix(ratings, dtype=np.float32)
+    by_item = by_user.T.tocsr()
+
+    rng = np.random.default_rng(seed)
+    item_factors = rng.normal(0, 0.01, (by_user.shape[1], factors)).astype(np.float32)
+    user_factors = np.zeros((by_user.shape[0], factors), dtype=np.float32)
+    for iteration in range(iterations):
+        user_factors = _solve_rows(by_user, item_factors.astype(np.float64), regularization, alpha, liked_rating)
+        item_factors = _solve_rows(by_item, user_factors.astype(np.float64), regularization, alpha, liked_rating)
+        logger.info(f"ALS iteration {iteration + 1}/{iterations} done")
+
+    model = ALSModel(user_keys, item_keys, user_factors, item_factors,
+                     regularization=regularization, alpha=alpha, liked_rating=liked_rating)
+    logger.info(
+        f"Trained ALS model with {factors} factors for {by_user.shape[0]} users and {by_user.shape[1]} titles "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+    return model
+
+
+class ALSModel:
+    """
+    User and title factor matrices with top-k serving by dot product.
+    """
+
+    def __init__(self, user_keys, item_keys, user_factors, item_factors, regularization=0.1,
+                 alpha=2.0, liked_rating=3.5, built_at=None):
+        self.user_keys = np.asarray([str(key) for key in user_keys], dtype=str)
+        self.item_keys = np.asarray([str(key) for key in item_keys], dtype=str)
+        self.user_lookup = {key: idx for idx, key in enumerate(self.user_keys.tolist())}
+        self.item_lookup = {key: idx for idx, key in enumerate(self.item_keys.tolist())}
+        self.user_factors = np.asarray(user_factors, dtype=np.float32)
+        self.item_factors = np.asarray(item_factors, dtype=np.float32)
+        self.regularization = float(regularization)
+        self.alpha = float(alpha)
+        self.liked_rating = float(liked_rating)
+        self.built_at = built_at if built_at is not None else time.time()
+
+        # Used to fold in users from their ratings without touching other users
+        item_factors64 = self.item_factors.astype(np.float64)
+        self._gram = item_factors64.T @ item_factors64
+        self._ridge = self.regularization * np.eye(self.item_factors.shape[1])
+
+    @property
+    def factors(self):
+        return self.item_factors.shape[1]
+
+    def stats(self):
+        """Return a summary of the model for health and debugging output"""
+        return {
+            "users": int(len(self.user_keys)),
+            "titles": int(len(self.item_keys)),
+            "factors": int(self.factors),
+            "builtAt": self.built_at,
+        }
+
+    def fold_in(self, user_ratings):
+        """
+        Compute a user vector from ratings with the title factors held fixed.
+
+        Args:
+            user_ratings (dict): {show_id: rating} for the user.
+
+        Returns:
+            array: The user's factor vector (zeros if no rated title is known).
+        """
+        items, values = [], []
+        for show_id, rating in user_ratings.items():
+            item = self.item_lookup.get(str(show_id))
+            if item is not None:
+                items.append(item)
+                values.append(float(rating))
+        if not items:
+            return np.zeros(self.factors, dtype=np.float32)
+        vector = _solve_one(
+            self.item_factors[items].astype(np.float64), np.asarray(values), self._gram, self._ridge,
+            self.alpha, self.liked_rating
+        )
+        return vector.astype(np.float32)
+
+    def recommend(self, user_ratings, limit=20, offset=0, user_id=None):
+        """
+        Rank unrated titles for a user by predicted preference.
+
+        Args:
+            user_ratings (dict): {show_id: rating} for the user; rated titles are excluded.
+            limit (int): Page size.
+            offset (int): Number of ranked titles to skip.
+            user_id (str): Use the trained vector of this user instead of folding
+                them in from user_ratings (pass None if they rated since training).
+
+        Returns:
+            list: Show IDs ordered by score (ties by show_id).
+        """
+        return self.recommend_many([user_ratings], limit, offset, [user_id])[0]
+
+    def recommend_many(self, users_ratings, limit=20, offset=0, user_ids=None):
+        """
+        Rank unrated titles for several users with one matrix-matrix product.
+
+        Args:
+            users_ratings (list): {show_id: rating} dict of each user.
+            limit (int): Page size.
+            offset (int): Number of ranked titles to skip.
+            user_ids (list): Optional user ID (or None to fold in) of each user,
+                as for recommend().
+
+        Returns:
+            list: Show ID list of each user, as returned by recommend().
+        """
+        if user_ids is None:
+            user_ids = [None] * len(users_ratings)
+        vectors = np.zeros((len(users_ratings), self.factors), dtype=np.float32)
+        for row, (user_ratings, user_id) in enumerate(zip(users_ratings, user_ids)):
+            idx = self.user_lookup.get(str(user_id)) if user_id is not None else None
+            vectors[row] = self.user_factors[idx] if idx is not None else self.fold_in(user_ratings)
+
+        scores = vectors @ self.item_factors.T
+        results = []
+        for row, user_ratings in enumerate(users_ratings):
+            if not vectors[row].any():
+                results.append([])
+                continue
+            user_scores = scores[row]
+            rated = [self.item_lookup[key] for key in map(str, user_ratings) if key in self.item_lookup]
+            user_scores[rated] = -np.inf
+
+            k = min(offset + limit, len(user_scores) - len(rated))
+            if k <= 0:
+                results.append([])
+                continue
+            top = np.argpartition(-user_scores, k - 1)[:k]
+            top = top[np.lexsort((top, -user_scores[top]))]
+            results.append(self.item_keys[top[offset:offset + limit]].tolist())
+        return results
+
+    def save(self, path):
+        """Write the model to an .npz file, replacing any existing file atomically"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                user_keys=self.user_keys,
+                item_keys=self.item_keys,
+                user_factors=self.user_factors,
+                item_factors=self.item_factors,
+                params=np.asarray([self.regularization, self.alpha, self.liked_rating], dtype=np.float64),
+                built_at=np.float64(self.built_at),
+            )
+        os.replace(tmp_path, path)
+        logger.info(f"Saved ALS model to {path}")
+
+    @classmethod
+    def load(cls, path):
+        """Load a model written by save()"""
+        with np.load(path, allow_pickle=False) as data:
+            regularization, alpha, liked_rating = data['params'].tolist()
+            return cls(
+                data['user_keys'],
+                data['item_keys'],
+                data['user_factors'],
+                data['item_factors'],
+                regularization=regularization,
+                alpha=alpha,
+                liked_rating=liked_rating,
+                built_at=float(data['built_at']),
+            )
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    parser = argparse.ArgumentParser(description='Train the ALS collaborative model from movies_ratings')
+    parser.add_argument('--output', default=os.getenv('ALS_MODEL_PATH', 'als_model.npz'),
+                        help='Path of the .npz file to write (default: als_model.npz)')
+    parser.add_argument('--factors', type=int, default=32, help='Rank of the factorization (default: 32)')
+    parser.add_argument('--iterations', type=int, default=10, help='ALS iterations (default: 10)')
+    parser.add_argument('--regularization', type=float, default=0.1, help='L2 penalty (default: 0.1)')
+    parser.add_argument('--alpha', type=float, default=2.0, help='Confidence per rating point (default: 2.0)')
+    args = parser.parse_args()
+
+    from notebook_recommendation_service import get_connection
+    from ratings_store import RatingsStore
+
+    conn = get_connection()
+    if not conn:
+        logger.error("Could not connect to the database")
+        return 1
+    try:
+        store = RatingsStore.from_connection(conn)
+    finally:
+        conn.close()
+
+    model = train_als(store.csr, store.user_keys, store.item_keys, factors=args.factors,
+                      iterations=args.iterations, regularization=args.regularization, alpha=args.alpha)
+    model.save(args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
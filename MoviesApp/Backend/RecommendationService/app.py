@@ -7,9 +7,18 @@ with SQL database connectivity
 import os
 import sys
 import logging
-import json
-from flask import Flask, jsonify, request
-from notebook_recommendation_service import NotebookRecommendationService
+import time
+import hashlib
+import hmac
+import threading
+from flask import Flask, jsonify, request, g
+from notebook_recommendation_service import NotebookRecommendationService, BATCH_SECTIONS
+from batch_generation import BatchProgress
+from recommendations_writer import open_writer, LAYOUTS
+from scroll_cursors import InvalidCursorError
+from response_codec import EncodedResponseCache, encode_response, negotiate
+from metrics import REGISTRY
+from query_log import QUERY_LOG, SORT_KEYS
 
 # Configure logging
 logging.basicConfig(
@@ -26,27 +35,144 @@ app = Flask(__name__)
 # Note: Database connection parameters are handled in the recommendation service
 RECOMMENDATION_DATA_PATH = os.getenv('RECOMMENDATION_DATA_PATH', 'recommendations.json')
 DEFAULT_OUTPUT_PATH = os.getenv('DEFAULT_OUTPUT_PATH', '../Frontend/movies-client/public/homeRecommendations.json')
+# Directory written by the per-user and sharded layouts of generate-file
+DEFAULT_OUTPUT_DIR = os.getenv('DEFAULT_OUTPUT_DIR', '../Frontend/movies-client/public/recommendations')
+# /admin endpoints require it in the X-Admin-Token header, and are not served at all without it
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+# Most users a single /recommendations/batch request may ask for
+BATCH_MAX_USERS = int(os.getenv('BATCH_MAX_USERS', 500))
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'recommendation_http_request_duration_seconds', 'Duration of API requests', ('endpoint', 'status')
+)
+
+def collect_encoded_cache_metrics():
+    stats = encoded_cache.stats()
+    return [
+        ('recommendation_encoded_cache_hits_total', 'counter', 'Responses served from stored encoded bytes', stats["hits"]),
+        ('recommendation_encoded_cache_bytes', 'gauge', 'Size of the stored encoded bodies', stats["bytes"]),
+        ('recommendation_slow_queries_total', 'counter', 'Statements over SLOW_QUERY_SECONDS', QUERY_LOG.slow_queries),
+    ]
+
+REGISTRY.add_collector('encoded_cache', collect_encoded_cache_metrics)
 
 # Initialize recommendation service
 # The service will automatically try to connect to the database or fall back to sample data
 recommendation_service = NotebookRecommendationService()
 
+# Encoded, compressed bodies of recommendation responses, keyed by ETag; they
+# expire with the result cache so a body is never older than a cached result
+encoded_cache = EncodedResponseCache(
+    max_entries=int(os.getenv('ENCODED_CACHE_SIZE', 10000)),
+    ttl=recommendation_service.result_cache.ttl
+)
+
 # Log connection status
-if hasattr(recommendation_service, 'conn') and recommendation_service.conn:
-    logger.info("Recommendation service initialized with database connection")
+if recommendation_service.pool:
+    logger.info("Recommendation service initialized with database connection pool")
 else:
     logger.warning("Recommendation service initialized with fallback sample data (no database connection)")
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                endpoint=request.endpoint or 'unknown', status=response.status_code)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics; ?format=json returns p50/p95/p99 of every timer instead."""
+    if request.args.get('format') == 'json':
+        return jsonify(REGISTRY.quantiles())
+    return app.response_class(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/queries', methods=['GET', 'DELETE'])
+def admin_queries():
+    """Most expensive query fingerprints (?top=20&sort=totalSeconds); DELETE resets them."""
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Not found"}), 404
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+        return jsonify({"error": "Forbidden"}), 403
+    if request.method == 'DELETE':
+        QUERY_LOG.reset()
+        return jsonify({"success": True})
+    
+    top = request.args.get('top', default=20, type=int)
+    sort = request.args.get('sort', default='totalSeconds')
+    if sort not in SORT_KEYS:
+        return jsonify({"error": f"sort must be one of {', '.join(SORT_KEYS)}"}), 400
+    return jsonify({**QUERY_LOG.stats(), "queries": QUERY_LOG.top(top, sort)})
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
-    db_status = "connected" if hasattr(recommendation_service, 'conn') and recommendation_service.conn else "disconnected"
+    db_status = "connected" if recommendation_service.pool else "disconnected"
     return jsonify({
         "status": "healthy", 
         "service": "recommendation-service",
-        "database": db_status
+        "database": db_status,
+        "engine": "memory" if recommendation_service.ratings_store is not None else "sql",
+        "pool": recommendation_service.pool.stats() if recommendation_service.pool else None,
+        "cache": recommendation_service.result_cache.stats(),
+        "scrollCursors": recommendation_service.scroll_cursors.stats(),
+        "singleFlight": recommendation_service.single_flight.stats(),
+        "encodedCache": encoded_cache.stats(),
+        "alsModel": recommendation_service.als_model.stats() if recommendation_service.als_model else None
     })
 
+def recommendations_etag(user_id, *params):
+    """Strong ETag of a user's response: their data version plus the request parameters."""
+    version = recommendation_service.response_version(user_id)
+    return hashlib.sha256(repr((version, str(user_id)) + params).encode()).hexdigest()[:32]
+
+def not_modified(etag):
+    """Return a 304 response if the client already has the response with this ETag, else None."""
+    if not request.if_none_match.contains(etag):
+        return None
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def encoded_json(body, content_encoding):
+    """Response for a body produced by encode_response."""
+    response = app.response_class(body, mimetype='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+    return response
+
+def serve_versioned(etag, compute):
+    """
+    Answer a versioned GET with a 304, the stored encoded body, or compute().
+    
+    Each content encoding is a separate representation with its own ETag.
+    """
+    encoding = negotiate(request.headers.get('Accept-Encoding'))
+    if encoding:
+        etag = f"{etag}-{encoding}"
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    
+    entry = encoded_cache.get(etag, encoding)
+    if entry is None:
+        payload = compute()
+        entry = encode_response(payload, encoding)
+        # Degraded responses are retried on the next request, so their bytes are not kept
+        if not payload.get("degradedSections"):
+            encoded_cache.put(etag, encoding, *entry)
+    response = encoded_json(*entry)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @app.route('/recommendations/<user_id>', methods=['GET'])
 def get_recommendations(user_id):
     """Get recommendations for a specific user."""
@@ -57,10 +183,14 @@ def get_recommendations(user_id):
         page = request.args.get('page', default=0, type=int)
         limit = request.args.get('limit', default=10, type=int)
         
-        # Generate recommendations with pagination
-        recommendations = recommendation_service.generate_recommendations(user_id, page=page, limit=limit)
+        # Clients that already have this version get a 304, and repeat requests the
+        # stored bytes, without anything being computed
+        etag = recommendations_etag(user_id, 'all', page, limit)
         
-        return jsonify(recommendations)
+        # Generate recommendations with pagination
+        return serve_versioned(
+            etag, lambda: recommendation_service.generate_recommendations(user_id, page=page, limit=limit)
+        )
     except Exception as e:
         logger.error(f"Error generating recommendations for user {user_id}: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -72,60 +202,141 @@ def get_more_recommendations(user_id):
         section = request.args.get('section', default='collaborative', type=str)
         page = request.args.get('page', default=1, type=int)
         limit = request.args.get('limit', default=10, type=int)
+        cursor = request.args.get('cursor', default=None, type=str)
         
-        logger.info(f"Generating more {section} recommendations for user {user_id}, page {page}")
+        etag = recommendations_etag(user_id, 'more', section, page, limit, cursor)
         
-        # Generate more recommendations for the specified section
-        recommendations = recommendation_service.generate_more_recommendations(user_id, section, page, limit)
+        logger.info(f"Generating more {section} recommendations for user {user_id}, page {page}")
         
-        return jsonify(recommendations)
+        # Generate more recommendations for the specified section; a cursor from
+        # the previous response continues the same server-held list
+        return serve_versioned(
+            etag, lambda: recommendation_service.generate_more_recommendations(user_id, section, page, limit, cursor=cursor)
+        )
+    except InvalidCursorError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error generating more recommendations for user {user_id}: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/recommendations/batch', methods=['POST'])
+def get_batch_recommendations():
+    """Get recommendations for many users in one request."""
+    try:
+        data = request.json or {}
+        user_ids = data.get('userIds', data.get('user_ids'))
+        sections = data.get('sections') or list(BATCH_SECTIONS)
+        try:
+            page = int(data.get('page', 0))
+            limit = int(data.get('limit', 10))
+        except (TypeError, ValueError):
+            return jsonify({"error": "page and limit must be integers"}), 400
+
+        if page < 0 or limit < 1:
+            return jsonify({"error": "page must be at least 0 and limit at least 1"}), 400
+        if not isinstance(user_ids, list) or not user_ids:
+            return jsonify({"error": "userIds must be a non-empty list"}), 400
+        if len(user_ids) > BATCH_MAX_USERS:
+            return jsonify({"error": f"At most {BATCH_MAX_USERS} userIds are allowed per request"}), 400
+        unknown = [section for section in sections if section not in BATCH_SECTIONS]
+        if unknown:
+            return jsonify({"error": f"sections must be among {', '.join(BATCH_SECTIONS)}"}), 400
+        
+        logger.info(f"Generating batch recommendations for {len(user_ids)} users")
+        recommendations = recommendation_service.generate_batch_recommendations(
+            user_ids, sections=sections, page=page, limit=limit
+        )
+        
+        body = {"users": len(recommendations), "recommendations": recommendations}
+        return encoded_json(*encode_response(body, negotiate(request.headers.get('Accept-Encoding'))))
+    except Exception as e:
+        logger.error(f"Error generating batch recommendations: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/recommendations/update-after-rating', methods=['POST'])
 def update_after_rating():
     """Update recommendations after a user rates a movie."""
     try:
-        data = request.json
-        user_id = data.get('userId')
-        show_id = data.get('showId')
-        rating = data.get('ratingValue')
+        data = request.json or {}
+        # The API forwards camelCase from the frontend and snake_case from RatingsController
+        user_id = data.get('userId', data.get('user_id'))
+        show_id = data.get('showId', data.get('show_id'))
+        rating = data.get('ratingValue', data.get('rating_value'))
+        
+        if user_id is None or show_id is None or rating is None:
+            return jsonify({"error": "userId, showId and ratingValue are required"}), 400
         
         logger.info(f"Updating recommendations after user {user_id} rated show {show_id} with {rating}")
         
-        # Update model with new rating (in a real system)
-        # This would update the recommendation model, but for now we'll just log it
+        # Apply the rating to the in-memory model and rankings and drop the user's cached results
+        updated = recommendation_service.record_rating(str(user_id), str(show_id), float(rating))
         
-        return jsonify({"success": True, "message": "Rating recorded for future recommendations"})
+        return jsonify({"success": True, "message": "Rating applied to recommendations", **updated})
     except Exception as e:
         logger.error(f"Error updating recommendations after rating: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+# Progress of the current (or last) recommendations file run
+generation_progress = None
+generation_lock = threading.Lock()
+
+def write_recommendations_file(output_path, progress, file_format=None, layout='single'):
+    """Generate recommendations for all users and stream them to output_path."""
+    # Users are written as their results arrive; the output replaces the old one only when complete
+    with open_writer(output_path, file_format, layout) as writer:
+        recommendation_service.generate_all_recommendations(on_result=writer.write, progress=progress)
+    return writer.summary()
+
 @app.route('/recommendations/generate-file', methods=['POST'])
 def generate_recommendations_file():
     """Generate recommendations file for all users."""
+    global generation_progress
+    if not generation_lock.acquire(blocking=False):
+        return jsonify({"error": "A recommendations file is already being generated",
+                        "progress": generation_progress.stats()}), 409
+    handed_off = False
     try:
-        output_path = request.args.get('output_path', DEFAULT_OUTPUT_PATH)
+        # 'single' writes one file; 'users' and 'shards' write a directory of small files
+        layout = request.args.get('layout', default='single')
+        if layout not in LAYOUTS:
+            return jsonify({"error": f"layout must be one of {', '.join(LAYOUTS)}"}), 400
+        default_path = DEFAULT_OUTPUT_PATH if layout == 'single' else DEFAULT_OUTPUT_DIR
+        output_path = request.args.get('output_path', default_path)
+        background = request.args.get('background', default='false').lower() == 'true'
+        file_format = request.args.get('format')  # 'json' or 'ndjson'; guessed from the path if omitted
         logger.info(f"Generating recommendations file at {output_path}")
+        progress = generation_progress = BatchProgress()
         
-        # Generate recommendations for all users (sample implementation)
-        all_recommendations = recommendation_service.generate_all_recommendations()
+        if background:
+            # Return right away; progress is reported by /recommendations/generate-file/status
+            def run():
+                try:
+                    write_recommendations_file(output_path, progress, file_format, layout)
+                except Exception as e:
+                    logger.error(f"Error generating recommendations file: {str(e)}")
+                finally:
+                    generation_lock.release()
+            threading.Thread(target=run, name='generate-file', daemon=True).start()
+            handed_off = True
+            return jsonify({"success": True, "message": "Recommendations file generation started"}), 202
         
-        # Save to file
-        directory = os.path.dirname(output_path)
-        if directory and not os.path.exists(directory):
-            os.makedirs(directory)
-            
-        with open(output_path, 'w') as f:
-            json.dump(all_recommendations, f)
-            
-        logger.info(f"Saved recommendations for {len(all_recommendations)} users to {output_path}")
+        summary = write_recommendations_file(output_path, progress, file_format, layout)
         
-        return jsonify({"success": True, "message": "Successfully generated recommendations file"})
+        return jsonify({"success": True, "message": "Successfully generated recommendations file",
+                        "file": summary, "progress": progress.stats()})
     except Exception as e:
         logger.error(f"Error generating recommendations file: {str(e)}")
         return jsonify({"error": str(e)}), 500
+    finally:
+        if not handed_off:
+            generation_lock.release()
+
+@app.route('/recommendations/generate-file/status', methods=['GET'])
+def generate_recommendations_file_status():
+    """Report progress and throughput of the current or last file generation."""
+    if generation_progress is None:
+        return jsonify({"running": False, "progress": None})
+    return jsonify({"running": generation_lock.locked(), "progress": generation_progress.stats()})
 
 if __name__ == '__main__':
     import argparse
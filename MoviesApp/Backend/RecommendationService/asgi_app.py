@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Async (ASGI) serving entry point for the recommendation API.
+
+Serves the same routes as app.py, but requests are accepted on an asyncio
+event loop instead of one blocking thread each. The Flask handlers (and the
+pyodbc work inside them) run on a bounded thread pool, so a process can hold
+thousands of requests waiting for a slot while only `ASGI_WORKER_THREADS`
+of them touch the database at once:
+
+    python asgi_app.py --port 8000
+    uvicorn asgi_app:app --port 8000
+
+- Requests beyond the worker threads wait on the event loop; once
+  `ASGI_MAX_PENDING` are waiting, further requests get 503 straight away.
+- A request whose client disconnects is dropped: if it is still waiting it
+  never runs, if it is running its result is discarded.
+- /health is answered on the event loop itself, so health checks never
+  queue behind slow queries.
+- On shutdown new requests get 503 while those in flight get up to
+  `ASGI_SHUTDOWN_TIMEOUT` seconds to finish.
+"""
+
+import io
+import os
+import sys
+import json
+import asyncio
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app as flask_app
+
+logger = logging.getLogger('recommendation_service')
+
+# uvicorn is only needed to run this module directly; any ASGI server can serve `app`
+try:
+    import uvicorn
+    UVICORN_AVAILABLE = True
+except ImportError:
+    UVICORN_AVAILABLE = False
+
+# Paths answered on the event loop instead of the worker threads (must never block)
+INLINE_PATHS = ('/health',)
+
+
+class AsyncServer:
+    """
+    ASGI application running a WSGI app on a bounded thread pool.
+    """
+
+    def __init__(self, wsgi_app, threads=16, max_pending=1000, shutdown_timeout=30):
+        """
+        Args:
+            wsgi_app (callable): The WSGI application to serve.
+            threads (int): Requests handled at once on worker threads.
+            max_pending (int): Requests allowed to wait for a thread before 503s are returned.
+            shutdown_timeout (float): Seconds in-flight requests get to finish on shutdown.
+        """
+        self.wsgi_app = wsgi_app
+        self.threads = threads
+        self.max_pending = max_pending
+        self.shutdown_timeout = shutdown_timeout
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi-worker')
+
+        # Created on first use so they belong to the server's event loop
+        self._slots = None
+        self._idle = None
+        self.active = 0
+        self.pending = 0
+        self.draining = False
+        self._stats = {
+            "requests": 0,
+            "rejected": 0,
+            "disconnected": 0,
+        }
+
+    def stats(self):
+        """Return queue depth and counters for the health response"""
+        return {
+            "threads": self.threads,
+            "active": self.active,
+            "pending": self.pending,
+            "maxPending": self.max_pending,
+            "draining": self.draining,
+            **self._stats,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def shutdown(self):
+        """Stop taking requests and give the ones in flight time to finish"""
+        self.draining = True
+        logger.info(f"Shutting down, waiting for {self.active + self.pending} requests in flight")
+        if self._idle is not None and (self.active or self.pending):
+            try:
+                await asyncio.wait_for(self._idle.wait(), self.shutdown_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"{self.active + self.pending} requests still running after {self.shutdown_timeout}s, shutting down anyway")
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _http(self, scope, receive, send):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.threads)
+            self._idle = asyncio.Event()
+            self._idle.set()
+        self._stats["requests"] += 1
+
+        if self.draining:
+            await self._send_error(send, 503, "Service is shutting down")
+            return
+        if self.pending >= self.max_pending:
+            self._stats["rejected"] += 1
+            await self._send_error(send, 503, "Too many requests waiting, try again shortly")
+            return
+
+        body, connected = await self._read_body(receive)
+        if not connected:
+            self._stats["disconnected"] += 1
+            return
+        environ = self._environ(scope, body)
+
+        if scope['path'] in INLINE_PATHS:
+            status, headers, content = self._call_wsgi(environ)
+            if scope['path'] == '/health' and status.startswith('200'):
+                content = json.dumps({**json.loads(content), "server": self.stats()}).encode()
+            await self._send_response(send, status, headers, content)
+            return
+
+        # Wait for a worker thread, or for the client to give up
+        disconnect = asyncio.ensure_future(self._wait_for_disconnect(receive))
+        self.pending += 1
+        self._idle.clear()
+        try:
+            acquire = asyncio.ensure_future(self._slots.acquire())
+            await asyncio.wait({acquire, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.pending -= 1
+        if not acquire.done() or acquire.cancelled():
+            acquire.cancel()
+            self._stats["disconnected"] += 1
+            self._release_idle()
+            return
+        if disconnect.done():
+            self._slots.release()
+            self._stats["disconnected"] += 1
+            self._release_idle()
+            return
+
+        self.active += 1
+        future = self.executor.submit(self._call_wsgi, environ)
+        loop = asyncio.get_running_loop()
+        # The slot is only freed once the thread is done, even if nobody waits for it anymore
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release_slot))
+        work = asyncio.wrap_future(future)
+        await asyncio.wait({work, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+
+        if not work.done():
+            # The running query can't be interrupted; its result is simply dropped
+            future.cancel()
+            self._stats["disconnected"] += 1
+            logger.info(f"Client disconnected from {scope['method']} {scope['path']}, dropping the request")
+            return
+        disconnect.cancel()
+        try:
+            status, headers, content = work.result()
+        except Exception as e:
+            logger.error(f"Error serving {scope['method']} {scope['path']}: {e}")
+            await self._send_error(send, 500, str(e))
+            return
+        await self._send_response(send, status, headers, content)
+
+    def _release_slot(self):
+        self.active -= 1
+        self._slots.release()
+        self._release_idle()
+
+    def _release_idle(self):
+        if not self.active and not self.pending:
+            self._idle.set()
+
+    @staticmethod
+    async def _read_body(receive):
+        """Return (request body, whether the client is still connected)"""
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return b'', False
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                return b''.join(chunks), True
+
+    @staticmethod
+    async def _wait_for_disconnect(receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    @staticmethod
+    def _environ(scope, body):
+        """Build the WSGI environ of an ASGI HTTP request"""
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+                continue
+            if name == 'CONTENT_LENGTH':
+                continue
+            key = f"HTTP_{name}"
+            if key in environ:
+                # Repeated headers are folded into one; cookie pairs are separated by '; '
+                separator = '; ' if key == 'HTTP_COOKIE' else ','
+                value = f"{environ[key]}{separator}{value}"
+            environ[key] = value
+        return environ
+
+    def _call_wsgi(self, environ):
+        """Run the WSGI app and return (status, headers, body)"""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = headers
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], content
+
+    @staticmethod
+    async def _send_response(send, status, headers, content):
+        headers = [(name, value) for name, value in headers if name.lower() != 'content-length']
+        headers.append(('Content-Length', str(len(content))))
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        })
+        await send({'type': 'http.response.body', 'body': content})
+
+    @classmethod
+    async def _send_error(cls, send, status, message):
+        content = json.dumps({"error": message}).encode()
+        headers = [('Content-Type', 'application/json')]
+        if status == 503:
+            headers.append(('Retry-After', '1'))
+        await cls._send_response(send, f"{status} Error", headers, content)
+
+
+app = AsyncServer(
+    flask_app,
+    threads=int(os.getenv('ASGI_WORKER_THREADS', 16)),
+    max_pending=int(os.getenv('ASGI_MAX_PENDING', 1000)),
+    shutdown_timeout=float(os.getenv('ASGI_SHUTDOWN_TIMEOUT', 30))
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the recommendation API on an ASGI server')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 8000)),
+                        help='Port to run the server on (default: 8000)')
+    args = parser.parse_args()
+
+    if not UVICORN_AVAILABLE:
+        logger.error("uvicorn is not installed; install it or serve asgi_app:app with another ASGI server")
+        return 1
+    logger.info(f"Starting ASGI server on port {args.port} ({app.threads} worker threads)")
+    uvicorn.run(app, host='0.0.0.0', port=args.port, timeout_graceful_shutdown=int(app.shutdown_timeout) + 5)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
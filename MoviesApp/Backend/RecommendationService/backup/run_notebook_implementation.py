@@ -88,6 +88,7 @@ import os
 import json
 import pandas as pd
 import numpy as np
+from scipy import sparse
 from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.preprocessing import StandardScaler
 import pyodbc
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Parallel generation of recommendations for every user.
+
+The service that starts a run writes what workers need to generate from
+into a snapshot directory: the ratings store, neighbor table and ALS model
+as .npz files, plus the catalog IDs, genre catalog and title stats behind
+the catalog index, genre index and leaderboards. The run itself happens out
+of process: a driver process (this module run with --snapshot) hands chunks
+of user IDs to a pool of forkserver- or spawn-started workers. Nothing is
+forked from the (multithreaded) service, and every worker loads the
+snapshot read-only instead of connecting to the database and building its
+own copies. Results stream back to the service as NDJSON and are handed to
+a callback as they arrive, and progress and throughput are logged while the
+run is going:
+
+    python batch_generation.py --output homeRecommendations.json --workers 8
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from recommendations_writer import open_writer, FORMATS, LAYOUTS, DEFAULT_SHARDS
+
+logger = logging.getLogger('recommendation_service')
+
+# Users handed to a worker per task
+DEFAULT_CHUNK_SIZE = 200
+
+# Files of a snapshot directory
+SNAPSHOT_FILE = 'snapshot.json'
+USERS_FILE = 'users.json'
+RATINGS_STORE_FILE = 'ratings_store.npz'
+NEIGHBOR_TABLE_FILE = 'neighbor_table.npz'
+ALS_MODEL_FILE = 'als_model.npz'
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(processName)s - %(levelname)s - %(message)s'
+
+# The service each worker process generates with
+_worker_service = None
+
+
+class BatchProgress:
+    """
+    Thread-safe progress counters of a batch run, readable while it runs.
+    """
+
+    def __init__(self, total=0):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def add(self, done, failed=0):
+        with self._lock:
+            self.done += done
+            self.failed += failed
+
+    def finish(self):
+        self.finished_at = time.monotonic()
+
+    def stats(self):
+        """Return counts, throughput and an ETA for status output"""
+        with self._lock:
+            done, failed = self.done, self.failed
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        rate = done / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total - done - failed, 0)
+        return {
+            "total": self.total,
+            "done": done,
+            "failed": failed,
+            "elapsedSeconds": round(elapsed, 1),
+            "usersPerSecond": round(rate, 1),
+            "etaSeconds": round(remaining / rate, 1) if rate and self.finished_at is None else None,
+            "finished": self.finished_at is not None,
+        }
+
+
+def write_snapshot(service, directory):
+    """
+    Write the data a worker needs to generate recommendations into a directory.
+
+    Args:
+        service (NotebookRecommendationService): The service starting the run.
+        directory (str): An existing, empty directory.
+    """
+    # Loaded the same way the service's own indexes load them
+    catalog, title_stats = service.genre_index.loader()
+    with service._rating_lock:
+        als_stale_users = sorted(service._als_stale_users)
+    with open(os.path.join(directory, SNAPSHOT_FILE), 'w') as f:
+        json.dump({
+            "engine": service.engine,
+            "collaborativeEngine": service.collaborative_engine,
+            "catalogIds": [str(show_id) for show_id in service.catalog_index.loader()],
+            "genreCatalog": [(str(show_id), list(genres)) for show_id, genres in catalog],
+            "titleStats": [(str(show_id), int(count), float(average)) for show_id, count, average in title_stats],
+            "alsStaleUsers": als_stale_users,
+        }, f)
+    if service.ratings_store is not None:
+        with service._rating_lock:
+            service.ratings_store.save(os.path.join(directory, RATINGS_STORE_FILE))
+    if service.neighbor_table is not None:
+        service.neighbor_table.save(os.path.join(directory, NEIGHBOR_TABLE_FILE))
+    if service.als_model is not None:
+        service.als_model.save(os.path.join(directory, ALS_MODEL_FILE))
+
+
+def load_snapshot(directory):
+    """
+    Create a recommendation service that serves from a snapshot directory.
+
+    The service skips everything a NotebookRecommendationService normally
+    loads at startup: the catalog index, genre index and leaderboards are
+    built from the snapshot on first use, and its pool only connects if a
+    query still has to go to the database.
+
+    Args:
+        directory (str): A directory written by write_snapshot().
+
+    Returns:
+        NotebookRecommendationService: The service.
+    """
+    from notebook_recommendation_service import NotebookRecommendationService, RATINGS_STORE_AVAILABLE
+    from catalog_index import CatalogIndex
+    from leaderboards import Leaderboards
+    from genre_index import GenreIndex
+
+    with open(os.path.join(directory, SNAPSHOT_FILE)) as f:
+        snapshot = json.load(f)
+    catalog_ids = snapshot["catalogIds"]
+    genre_catalog = snapshot["genreCatalog"]
+    title_stats = snapshot["titleStats"]
+
+    service = NotebookRecommendationService(engine=snapshot["engine"], preload=False)
+    service.collaborative_engine = snapshot["collaborativeEngine"]
+    service._als_stale_users = set(snapshot["alsStaleUsers"])
+    # No TTL: the data doesn't change for the length of the run
+    service.catalog_index = CatalogIndex(lambda: catalog_ids, ttl=0)
+    service.leaderboards = Leaderboards(lambda: title_stats, ttl=0, refresh_after_ratings=0)
+    service.genre_index = GenreIndex(lambda: (genre_catalog, title_stats), ttl=0, refresh_after_ratings=0)
+
+    if RATINGS_STORE_AVAILABLE:
+        from ratings_store import RatingsStore
+        from neighbor_table import NeighborTable
+        from als_model import ALSModel
+        for name, attribute, cls in ((RATINGS_STORE_FILE, 'ratings_store', RatingsStore),
+                                     (NEIGHBOR_TABLE_FILE, 'neighbor_table', NeighborTable),
+                                     (ALS_MODEL_FILE, 'als_model', ALSModel)):
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                setattr(service, attribute, cls.load(path))
+    return service
+
+
+def _init_worker(directory, log_level):
+    """Create the worker's recommendation service (runs once per worker process)"""
+    global _worker_service
+    logging.basicConfig(level=log_level, format=LOG_FORMAT, handlers=[logging.StreamHandler(sys.stderr)])
+    service = load_snapshot(directory)
+
+    # Parallelism comes from the processes: compute each user's sections in
+    # order, never time them out, and don't cache results nobody will ask for again
+    service.concurrent_sections = False
+    service.result_cache.max_entries = 0
+    _worker_service = service
+
+
+def _generate_chunk(user_ids):
+    """Generate recommendations for a chunk of users inside a worker"""
+    results = []
+    failed = []
+    for user_id in user_ids:
+        try:
+            results.append((user_id, _worker_service.generate_recommendations(user_id)))
+        except Exception as e:
+            logger.error(f"Error generating recommendations for user {user_id}: {e}")
+            failed.append(user_id)
+    return results, failed
+
+
+def run_snapshot(directory, out, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, log_level=logging.INFO):
+    """
+    Generate recommendations for the users of a snapshot directory on a process pool.
+
+    Runs in the driver process started by generate_all(). Each result is
+    written to `out` as a {"userId", "recommendations"} line, and the users
+    of a chunk that failed as a {"failed": [user IDs]} line.
+
+    Args:
+        directory (str): A directory written by write_snapshot(), plus its users file.
+        out (file): Text stream the result lines are written to.
+        workers (int): Worker processes (default: number of CPUs).
+        chunk_size (int): Users per task handed to a worker.
+        log_level (int): Log level of the workers.
+    """
+    with open(os.path.join(directory, USERS_FILE)) as f:
+        user_ids = json.load(f)
+    chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(chunks) or 1))
+
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        # Workers are forked from a server that has already imported the service and numpy/scipy
+        context.set_forkserver_preload(['notebook_recommendation_service'])
+    else:
+        context = multiprocessing.get_context('spawn')
+
+    logger.info(f"Generating recommendations for {len(user_ids)} users on {workers} "
+                f"{context.get_start_method()} workers")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(directory, log_level)) as executor:
+        futures = {executor.submit(_generate_chunk, chunk): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            try:
+                results, failed = future.result()
+            except Exception as e:
+                logger.error(f"Worker failed on a chunk of {len(futures[future])} users: {e}")
+                results, failed = [], futures[future]
+            for user_id, recommendations in results:
+                out.write(json.dumps({"userId": user_id, "recommendations": recommendations}) + '\n')
+            if failed:
+                out.write(json.dumps({"failed": failed}) + '\n')
+            out.flush()
+
+
+def generate_all(service, user_ids, on_result, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 progress=None, progress_interval=10):
+    """
+    Generate recommendations for many users on a process pool.
+
+    Writes a snapshot of the service to a temporary directory and runs the
+    pool in a separate driver process, so no worker is ever forked from the
+    calling process.
+
+    Args:
+        service (NotebookRecommendationService): The service whose data workers use.
+        user_ids (iterable): Users to generate recommendations for.
+        on_result (callable): Called as on_result(user_id, recommendations) in the
+            calling process as soon as each result arrives.
+        workers (int): Worker processes (default: number of CPUs).
+        chunk_size (int): Users per task handed to a worker.
+        progress (BatchProgress): Counters to update (a new one is created if omitted).
+        progress_interval (float): Seconds between progress log lines.
+
+    Returns:
+        BatchProgress: The final counters of the run.
+    """
+    user_ids = [str(user_id) for user_id in user_ids]
+    if progress is None:
+        progress = BatchProgress()
+    progress.total = len(user_ids)
+
+    directory = tempfile.mkdtemp(prefix='recommendation-batch-')
+    try:
+        write_snapshot(service, directory)
+        with open(os.path.join(directory, USERS_FILE), 'w') as f:
+            json.dump(user_ids, f)
+
+        command = [
+            sys.executable, os.path.abspath(__file__), '--snapshot', directory,
+            '--chunk-size', str(chunk_size), '--log-level', logging.getLevelName(logger.getEffectiveLevel()),
+        ]
+        if workers:
+            command += ['--workers', str(workers)]
+        with subprocess.Popen(command, stdout=subprocess.PIPE, text=True) as driver:
+            try:
+                last_report = time.monotonic()
+                for line in driver.stdout:
+                    message = json.loads(line)
+                    if "failed" in message:
+                        progress.add(0, len(message["failed"]))
+                    else:
+                        on_result(message["userId"], message["recommendations"])
+                        progress.add(1)
+
+                    if time.monotonic() - last_report >= progress_interval:
+                        last_report = time.monotonic()
+                        stats = progress.stats()
+                        logger.info(
+                            f"Batch progress: {stats['done'] + stats['failed']}/{stats['total']} users, "
+                            f"{stats['usersPerSecond']} users/s, ETA {stats['etaSeconds']}s"
+                        )
+            except BaseException:
+                driver.kill()
+                raise
+        if driver.returncode != 0:
+            raise RuntimeError(f"Batch driver exited with status {driver.returncode}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+        progress.finish()
+
+    stats = progress.stats()
+    logger.info(
+        f"Generated recommendations for {stats['done']} users ({stats['failed']} failed) "
+        f"in {stats['elapsedSeconds']}s ({stats['usersPerSecond']} users/s)"
+    )
+    return progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate recommendations for every user in parallel')
+    parser.add_argument('--output', default='homeRecommendations.json',
+                        help='Path of the file to write (default: homeRecommendations.json)')
+    parser.add_argument('--format', choices=FORMATS, default=None,
+                        help='Output format (default: ndjson for .ndjson/.jsonl paths, else json)')
+    parser.add_argument('--layout', choices=LAYOUTS, default='single',
+                        help="'single' file, or a directory with one file per user ('users') "
+                             "or hash-bucketed files ('shards') (default: single)")
+    parser.add_argument('--shards', type=int, default=DEFAULT_SHARDS,
+                        help=f'Buckets of the shards layout (default: {DEFAULT_SHARDS})')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes (default: number of CPUs)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'Users per worker task (default: {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--engine', default=None,
+                        help="'sql' or 'memory' (default: RECOMMENDATION_ENGINE)")
+    parser.add_argument('--snapshot', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--log-level', default='INFO', help='Log level (default: INFO)')
+    args = parser.parse_args()
+
+    if args.snapshot:
+        # Driver process of generate_all(): results go to the parent over stdout, so
+        # keep that for them and send anything else written to fd 1 (including by workers) to stderr
+        out = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+        logging.basicConfig(level=args.log_level, format=LOG_FORMAT, handlers=[logging.StreamHandler(sys.stderr)])
+        with out:
+            run_snapshot(args.snapshot, out, args.workers, args.chunk_size, args.log_level)
+        return 0
+
+    logging.basicConfig(level=args.log_level, format=LOG_FORMAT, handlers=[logging.StreamHandler(sys.stdout)])
+    from notebook_recommendation_service import NotebookRecommendationService
+
+    service = NotebookRecommendationService(engine=args.engine)
+    with open_writer(args.output, args.format, args.layout, args.shards) as writer:
+        service.generate_all_recommendations(workers=args.workers, chunk_size=args.chunk_size,
+                                             on_result=writer.write)
+    logger.info(f"Recommendations file written: {writer.summary()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+End-to-end load benchmark of the recommendation API.
+
+Concurrent clients send a weighted mix of requests for a fixed time and the
+throughput, status codes and latency percentiles of every request type are
+written to a JSON report that later runs can be compared with:
+
+    python benchmark_endpoints.py --ratings 100000 --concurrency 8 --duration 30 --output before.json
+    python benchmark_endpoints.py --ratings 100000 --concurrency 8 --duration 30 --output after.json --compare before.json
+
+By default the Flask app is served in this process (through its test
+client) with synthetic tables loaded into the memory engine, as in
+benchmark_methods.py. With --base-url the requests go over HTTP to a running
+server instead (app.py, gunicorn or asgi_app.py); user IDs still come from
+the synthetic data, so load the same tables into its database first with
+`synthetic_data.py --load` using the same --ratings and --seed.
+
+Request types (weights set with --mix):
+
+- recommendations: GET /recommendations/<user>
+- more: GET /recommendations/<user>/more for a random section and page
+- revalidate: GET /recommendations/<user> with the ETag last returned for
+  the user, answered with a 304 when nothing changed
+- batch: POST /recommendations/batch for --batch-size users
+- rating: POST /recommendations/update-after-rating
+- health: GET /health
+"""
+
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+import synthetic_data
+from benchmark_methods import summarize, report_metadata, write_report, compare_reports, attach_synthetic_data
+
+logger = logging.getLogger('recommendation_service')
+
+REQUEST_TYPES = ('recommendations', 'more', 'revalidate', 'batch', 'rating', 'health')
+DEFAULT_MIX = "recommendations=70,more=15,revalidate=8,batch=2,rating=4,health=1"
+
+# Statuses that count as a successful response
+OK_STATUSES = (200, 304)
+
+
+class InProcessClient:
+    """Sends requests to the Flask app through its test client"""
+
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, path, headers, body):
+        response = self.client.open(path, method=method, headers=headers, data=body)
+        return response.status_code, response.headers.get('ETag'), response.get_data()
+
+
+class HttpClient:
+    """Sends requests over one keep-alive HTTP connection"""
+
+    def __init__(self, base_url, timeout=60):
+        url = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self.connect = lambda: connection_class(url.hostname, url.port, timeout=timeout)
+        self.prefix = url.path.rstrip('/')
+        self.connection = self.connect()
+
+    def request(self, method, path, headers, body):
+        try:
+            self.connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            return response.status, response.getheader('ETag'), response.read()
+        except Exception:
+            # Start over on a fresh connection for the next request
+            self.connection.close()
+            self.connection = self.connect()
+            raise
+
+
+class Workload:
+    """
+    Builds the requests of each type for random users.
+    """
+
+    def __init__(self, user_ids, show_ids, sections, batch_size=50):
+        self.user_ids = user_ids
+        self.show_ids = show_ids
+        self.sections = sections
+        self.batch_size = batch_size
+        # Last ETag returned per (user, request), for conditional requests
+        self.etags = {}
+        self._lock = threading.Lock()
+
+    def build(self, kind, rng):
+        """Return (method, path, headers, body, ETag key) of a request of this type"""
+        user_id = rng.choice(self.user_ids)
+        headers = {'Accept-Encoding': 'gzip'}
+        if kind in ('recommendations', 'revalidate'):
+            path = f"/recommendations/{user_id}?page=0&limit=20"
+            if kind == 'revalidate':
+                with self._lock:
+                    etag = self.etags.get(path)
+                if etag:
+                    headers['If-None-Match'] = etag
+            return 'GET', path, headers, None, path
+        if kind == 'more':
+            section = rng.choice(self.sections)
+            path = f"/recommendations/{user_id}/more?section={section}&page={rng.randint(1, 4)}&limit=10"
+            return 'GET', path, headers, None, None
+        if kind == 'batch':
+            users = rng.sample(self.user_ids, min(self.batch_size, len(self.user_ids)))
+            body = json.dumps({"userIds": users, "limit": 20})
+            return 'POST', '/recommendations/batch', dict(headers, **{'Content-Type': 'application/json'}), body, None
+        if kind == 'rating':
+            body = json.dumps({"userId": user_id, "showId": rng.choice(self.show_ids), "ratingValue": rng.randint(1, 5)})
+            return 'POST', '/recommendations/update-after-rating', {'Content-Type': 'application/json'}, body, None
+        if kind == 'health':
+            return 'GET', '/health', {}, None, None
+        raise ValueError(f"Unknown request type: {kind}")
+
+    def remember(self, key, etag):
+        if key and etag:
+            with self._lock:
+                self.etags[key] = etag
+
+
+def parse_mix(mix):
+    """Parse "name=weight,..." into ([names], [weights])"""
+    kinds, weights = [], []
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in REQUEST_TYPES:
+            raise ValueError(f"Unknown request type {name.strip()!r}, expected one of {', '.join(REQUEST_TYPES)}")
+        kinds.append(name.strip())
+        weights.append(float(weight or 1))
+    return kinds, weights
+
+
+def run_load(make_client, workload, kinds, weights, concurrency, duration, warmup, seed=0):
+    """
+    Send requests from `concurrency` threads for `duration` seconds.
+
+    Args:
+        make_client (callable): Returns a new client for a worker thread.
+        workload (Workload): Builds the requests.
+        kinds (list): Request types to mix.
+        weights (list): Relative frequency of each type.
+        concurrency (int): Worker threads, each with one request in flight.
+        duration (float): Seconds of timed load.
+        warmup (float): Seconds of untimed load first.
+
+    Returns:
+        tuple: ([(type, seconds, status, bytes)], seconds the timed load ran)
+    """
+    samples = []
+    samples_lock = threading.Lock()
+    start = threading.Barrier(concurrency + 1)
+    timing = {}
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        client = make_client()
+        local = []
+        start.wait()
+        while time.perf_counter() < timing["end"]:
+            kind = rng.choices(kinds, weights)[0]
+            method, path, headers, body, etag_key = workload.build(kind, rng)
+            started = time.perf_counter()
+            try:
+                status, etag, content = client.request(method, path, headers, body)
+            except Exception as e:
+                logger.warning(f"{method} {path} failed: {e}")
+                status, etag, content = None, None, b''
+            elapsed = time.perf_counter() - started
+            workload.remember(etag_key, etag)
+            if started >= timing["measure_from"]:
+                local.append((kind, elapsed, status, len(content)))
+        with samples_lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,), name=f'load-{i}', daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    timing["measure_from"] = time.perf_counter() + warmup
+    timing["end"] = timing["measure_from"] + duration
+    start.wait()
+    for thread in threads:
+        thread.join()
+    # Requests still running at the end are waited for and counted
+    return samples, time.perf_counter() - timing["measure_from"]
+
+
+def summarize_load(samples, elapsed):
+    """Per-type and overall throughput, status counts and latency percentiles"""
+    results = {}
+    for kind in sorted({sample[0] for sample in samples}) + ['all']:
+        selected = [sample for sample in samples if kind == 'all' or sample[0] == kind]
+        summary = summarize([sample[1] for sample in selected], elapsed)
+        statuses = {}
+        for sample in selected:
+            status = str(sample[2]) if sample[2] is not None else 'failed'
+            statuses[status] = statuses.get(status, 0) + 1
+        summary["errors"] = sum(count for status, count in statuses.items()
+                                if status == 'failed' or int(status) not in OK_STATUSES)
+        summary["statuses"] = statuses
+        summary["meanBytes"] = round(sum(sample[3] for sample in selected) / len(selected), 1)
+        results[kind] = summary
+    return results
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    parser = argparse.ArgumentParser(description='Load-test the recommendation API')
+    parser.add_argument('--base-url', default=None,
+                        help='Send requests over HTTP to this server instead of an in-process app')
+    parser.add_argument('--ratings', type=int, default=100000, help='Synthetic ratings (default: 100000)')
+    parser.add_argument('--titles', type=int, default=None, help='Synthetic titles (default: scaled with ratings)')
+    parser.add_argument('--users', type=int, default=None, help='Synthetic users (default: ratings / 40)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--collaborative', choices=['tiered', 'als'], default='tiered',
+                        help='Collaborative engine of the in-process app (default: tiered)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Turn off the result and encoded-response caches of the in-process app')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Request types and weights (default: {DEFAULT_MIX})')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients (default: 8)')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of timed load (default: 30)')
+    parser.add_argument('--warmup', type=float, default=5, help='Seconds of untimed load first (default: 5)')
+    parser.add_argument('--batch-size', type=int, default=50, help='Users per batch request (default: 50)')
+    parser.add_argument('--output', default=None, help='Write the JSON report to this path')
+    parser.add_argument('--compare', default=None, help='Print changes against an earlier JSON report')
+    parser.add_argument('--log-level', default='WARNING',
+                        help='Log level of the app while under load (default: WARNING)')
+    args = parser.parse_args()
+    try:
+        kinds, weights = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    data = synthetic_data.generate(args.ratings, args.titles, args.users, seed=args.seed)
+    setup = {}
+    if args.base_url:
+        make_client = lambda: HttpClient(args.base_url)
+        sections = ['collaborative', 'contentBased', 'Action', 'Comedies', 'Dramas']
+    else:
+        import app as app_module
+        from result_cache import ResultCache
+        from response_codec import EncodedResponseCache
+        service = app_module.recommendation_service
+        setup = attach_synthetic_data(service, data, args.collaborative)
+        if args.no_cache:
+            service.result_cache = ResultCache(max_entries=0)
+            app_module.encoded_cache = EncodedResponseCache(max_entries=0)
+        make_client = lambda: InProcessClient(app_module.app)
+        sections = ['collaborative', 'contentBased'] + service.get_available_genres()
+    workload = Workload(data.user_ids(), data.titles["show_id"].tolist(), sections, args.batch_size)
+
+    logger.info(f"Running {args.concurrency} clients for {args.warmup:g}s warmup + {args.duration:g}s")
+    logging.getLogger('recommendation_service').setLevel(args.log_level)
+    samples, elapsed = run_load(make_client, workload, kinds, weights, args.concurrency,
+                                args.duration, args.warmup, args.seed)
+    logging.getLogger('recommendation_service').setLevel(logging.INFO)
+
+    report = {
+        "benchmark": "endpoints",
+        "metadata": report_metadata(),
+        "config": vars(args),
+        "data": data.stats(),
+        "setup": setup,
+        "results": summarize_load(samples, elapsed),
+    }
+    print(json.dumps(report["results"], indent=2))
+    if args.output:
+        write_report(report, args.output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare_reports(json.load(f), report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks of the recommendation engines on synthetic data.
+
+Times every user-facing method of NotebookRecommendationService and of the
+notebook RecommendationService (backup/recommendation_system_final.ipynb)
+on the same generated tables (see synthetic_data.py), and writes the
+latency percentiles to a JSON report that later runs can be compared with:
+
+    python benchmark_methods.py --ratings 1000000 --output before.json
+    python benchmark_methods.py --ratings 1000000 --output after.json --compare before.json
+
+The service runs on the "memory" engine: the synthetic tables are loaded
+into its ratings store, leaderboards, genre and catalog indexes, neighbor
+table and (with --collaborative als) ALS model exactly as they would be
+from the database. Its SQL Server queries are not run; a method that would
+need the database shows up as a failed connect in the report. To time the
+SQL engine, load the synthetic tables into a scratch database with
+`synthetic_data.py --load` and pass --engine sql.
+
+Result caching is turned off unless --cache is given, so every call is
+timed doing the actual work.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import platform
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+import numpy as np
+
+import synthetic_data
+from connection_pool import ConnectionPool
+from catalog_index import CatalogIndex
+from leaderboards import Leaderboards
+from genre_index import GenreIndex
+from result_cache import ResultCache
+from notebook_recommendation_service import NotebookRecommendationService, CATALOG_GENRE_COLUMNS
+
+logger = logging.getLogger('recommendation_service')
+
+NOTEBOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backup', 'recommendation_system_final.ipynb')
+
+# Percentiles reported for every benchmark
+PERCENTILES = (50, 90, 95, 99)
+
+
+def summarize(latencies, elapsed=None):
+    """
+    Summarize per-call latencies.
+
+    Args:
+        latencies (list): Seconds taken by each call.
+        elapsed (float): Wall-clock seconds the calls ran for; calls per second
+            is computed from it (default: the sum of the latencies).
+
+    Returns:
+        dict: count, perSecond, and mean/percentile/max latencies in milliseconds.
+    """
+    if not latencies:
+        return {"count": 0}
+    values = np.asarray(latencies) * 1000.0
+    elapsed = elapsed if elapsed is not None else float(values.sum()) / 1000.0
+    summary = {
+        "count": len(values),
+        "perSecond": round(len(values) / elapsed, 2) if elapsed > 0 else None,
+        "meanMs": round(float(values.mean()), 3),
+    }
+    for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary[f"p{percentile}Ms"] = round(float(value), 3)
+    summary["maxMs"] = round(float(values.max()), 3)
+    return summary
+
+
+def time_calls(call, args, warmup=0):
+    """Call call(arg) for every arg and return the summary of all but the first `warmup` calls"""
+    latencies = []
+    for i, arg in enumerate(args):
+        started = time.perf_counter()
+        call(arg)
+        if i >= warmup:
+            latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+def timed(setup, name, build):
+    """Run build() once, record its duration in setup[name] and return its result"""
+    started = time.perf_counter()
+    result = build()
+    setup[name] = round(time.perf_counter() - started, 3)
+    logger.info(f"{name}: {setup[name]}s")
+    return result
+
+
+def report_metadata():
+    """Where and when a report was produced, so runs can be told apart"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "createdAt": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Wrote benchmark report to {path}")
+
+
+def compare_reports(baseline, report, keys=('p50Ms', 'p95Ms', 'perSecond')):
+    """
+    Print how each benchmark in report changed against the same one in baseline.
+
+    Returns:
+        dict: Benchmark name -> {key: [baseline, current, change in percent]}.
+    """
+    changes = {}
+    for name, current in report["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or not current.get("count") or not previous.get("count"):
+            continue
+        changes[name] = {}
+        for key in keys:
+            before, after = previous.get(key), current.get(key)
+            if before is None or after is None:
+                continue
+            change = round((after - before) / before * 100, 1) if before else None
+            changes[name][key] = [before, after, change]
+
+    width = max((len(name) for name in changes), default=10)
+    print(f"\n{'benchmark':<{width}}  " + "  ".join(f"{key:>30}" for key in keys))
+    for name, values in changes.items():
+        cells = []
+        for key in keys:
+            if key not in values:
+                cells.append(f"{'-':>30}")
+                continue
+            before, after, change = values[key]
+            change_text = f"{change:+.1f}%" if change is not None else "n/a"
+            cells.append(f"{before:>10g} -> {after:<10g}{change_text:>8}")
+        print(f"{name:<{width}}  " + "  ".join(cells))
+    return changes
+
+
+def _no_database():
+    """Connection factory of the synthetic service: there is no database behind it"""
+    return None
+
+
+def attach_synthetic_data(service, data, collaborative_engine='tiered', workdir=None):
+    """
+    Load synthetic tables into a service's in-memory engine.
+
+    Everything the "memory" engine would load from the database is built
+    from the tables instead. The service gets a connection pool that cannot
+    connect, so code paths that still need SQL fail (and are counted in the
+    pool's failedConnects) instead of silently using sample data.
+
+    Args:
+        service (NotebookRecommendationService): The service to load into.
+        data (synthetic_data.SyntheticData): The tables.
+        collaborative_engine (str): 'tiered' or 'als'.
+        workdir (str): Directory for the neighbor table and ALS model files
+            (default: a new temporary directory).
+
+    Returns:
+        dict: Seconds taken by each build step.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix='recommendation-benchmark-')
+    setup = {}
+    service.pool = ConnectionPool(_no_database, max_size=1, timeout=0)
+    service.engine = 'memory'
+    service.collaborative_engine = collaborative_engine
+    service.neighbor_table_path = os.path.join(workdir, 'neighbor_table.npz')
+    service.als_model_path = os.path.join(workdir, 'als_model.npz')
+    # The overlay can't be reloaded from a database, so never try
+    service.ratings_store_reload_after = sys.maxsize
+
+    service.ratings_store = timed(setup, "ratingsStore", lambda: data.ratings_store(CATALOG_GENRE_COLUMNS))
+    catalog_ids = data.titles["show_id"].tolist()
+    service.catalog_index = CatalogIndex(lambda: catalog_ids, ttl=0)
+    timed(setup, "catalogIndex", service.catalog_index.refresh)
+    service.leaderboards = Leaderboards(service._load_title_stats, ttl=0, refresh_after_ratings=0)
+    timed(setup, "leaderboards", service.leaderboards.refresh)
+    genre_catalog = data.genre_catalog()
+    service.genre_index = GenreIndex(lambda: (genre_catalog, service._load_title_stats()), ttl=0, refresh_after_ratings=0)
+    timed(setup, "genreIndex", service.genre_index.refresh)
+    timed(setup, "neighborTable", service.rebuild_neighbor_table)
+    if collaborative_engine == 'als':
+        timed(setup, "alsModel", service.rebuild_als_model)
+    service.model_version += 1
+    return setup
+
+
+def service_methods(service, data, rng):
+    """(name, call(user_id)) for every user-facing method of NotebookRecommendationService"""
+    show_ids = data.titles["show_id"].tolist()
+    genres = service.get_available_genres()
+    user_ids = data.user_ids()
+    methods = [
+        ('get_user_ratings', service.get_user_ratings),
+        ('get_users_ratings', lambda user_id: service.get_users_ratings(rng.sample(user_ids, min(100, len(user_ids))))),
+        ('validate_movie_ids', lambda user_id: service.validate_movie_ids(rng.sample(show_ids, min(60, len(show_ids))))),
+        ('get_genre_movies', lambda user_id: service.get_genre_movies(rng.choice(genres), 20, rng.randrange(0, 100))),
+        ('get_collaborative_recommendations', lambda user_id: service.get_collaborative_recommendations(user_id, 20, 0)),
+        ('get_strict_collaborative_recommendations', lambda user_id: service.get_strict_collaborative_recommendations(user_id, 20, 0)),
+        ('get_extended_collaborative_recommendations', lambda user_id: service.get_extended_collaborative_recommendations(user_id, 20, 40, 1)),
+        ('get_user_preferred_genres', service.get_user_preferred_genres),
+        ('get_recommendation_fallbacks', lambda user_id: service.get_recommendation_fallbacks(user_id, 20)),
+        ('get_content_based_recommendations', lambda user_id: service.get_content_based_recommendations(user_id, 20, 0)),
+        ('get_popular_movies', lambda user_id: service.get_popular_movies(20)),
+        ('get_top_rated_movies', lambda user_id: service.get_top_rated_movies(20)),
+        ('get_available_genres', lambda user_id: service.get_available_genres()),
+        ('generate_recommendations', lambda user_id: service.generate_recommendations(user_id, 0, 20)),
+        ('generate_more_recommendations', lambda user_id: service.generate_more_recommendations(
+            user_id, rng.choice(['collaborative', 'contentBased'] + genres), 1, 10)),
+        ('generate_batch_recommendations', lambda user_id: service.generate_batch_recommendations(
+            rng.sample(user_ids, min(50, len(user_ids))), page=0, limit=20)),
+    ]
+    if service.als_model is not None:
+        methods.insert(5, ('get_als_recommendations', lambda user_id: service.get_als_recommendations(user_id, 20, 0)))
+    # Last, since it changes the data the other methods read
+    methods.append(('record_rating', lambda user_id: service.record_rating(user_id, rng.choice(show_ids), rng.randint(1, 5))))
+    return methods
+
+
+def benchmark_service(data, users, iterations, warmup, collaborative_engine='tiered', engine='memory', cache=False, seed=0):
+    """Time NotebookRecommendationService; returns (setup seconds, results by benchmark name, pool stats)"""
+    setup = {}
+    # The memory engine is switched on by attach_synthetic_data, not by loading from the database
+    service = timed(setup, "service.init", lambda: NotebookRecommendationService(engine='sql'))
+    if engine == 'memory':
+        setup.update({f"service.{name}": seconds for name, seconds in
+                      attach_synthetic_data(service, data, collaborative_engine).items()})
+    elif not service.pool:
+        raise RuntimeError("--engine sql needs a reachable database (see synthetic_data.py --load)")
+    if not cache:
+        service.result_cache = ResultCache(max_entries=0)
+
+    rng = random.Random(seed)
+    user_sample = [rng.choice(users) for _ in range(iterations + warmup)]
+    results = {}
+    for name, call in service_methods(service, data, rng):
+        logger.info(f"Benchmarking service.{name}")
+        results[f"service.{name}"] = time_calls(call, user_sample, warmup)
+    return setup, results, service.pool.stats()
+
+
+def load_notebook_class(path=NOTEBOOK_PATH):
+    """Return the RecommendationService class defined in the notebook"""
+    import pandas as pd
+    from scipy import sparse
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    with open(path, encoding='utf-8') as f:
+        notebook = json.load(f)
+    for cell in notebook['cells']:
+        source = ''.join(cell['source'])
+        if cell['cell_type'] == 'code' and 'class RecommendationService' in source:
+            break
+    else:
+        raise ValueError(f"No RecommendationService class in {path}")
+
+    # The notebook's setup cell imports these (plus pyodbc and FastAPI, which the class doesn't need)
+    namespace = {
+        'os': os, 'json': json, 'np': np, 'pd': pd, 'sparse': sparse,
+        'StandardScaler': StandardScaler, 'cosine_similarity': cosine_similarity,
+        'logger': logging.getLogger('recommendation_notebook'),
+    }
+    exec(compile(source, path, 'exec'), namespace)
+    return namespace['RecommendationService']
+
+
+def benchmark_notebook(data, users, iterations, warmup, write_file=False, seed=0):
+    """Time the notebook RecommendationService; returns (setup seconds, results by benchmark name)"""
+    setup = {}
+    cls = load_notebook_class()
+    # Skip __init__, which loads the tables from the database
+    service = cls.__new__(cls)
+    for name in ('user_item_matrix', 'user_keys', 'show_keys', 'user_index', 'show_index', 'user_norms',
+                 'movie_features', 'feature_values', 'feature_matrix', 'feature_show_ids', 'feature_index',
+                 'movie_genre_matrix', 'rated_genre_matrix', 'show_in_catalog', 'genre_columns'):
+        setattr(service, name, None)
+    service.genre_preference_cache = {}
+    service.ratings_df, service.movies_df, service.users_df = data.notebook_frames()
+    timed(setup, "notebook._prepare_matrices", service._prepare_matrices)
+
+    def genre_preferences(user_id):
+        service.invalidate_user(user_id)
+        return service.get_genre_preferences(user_id)
+
+    rng = random.Random(seed)
+    user_sample = [int(rng.choice(users)) for _ in range(iterations + warmup)]
+    results = {}
+    for name, call in (
+        ('get_collaborative_recommendations', lambda user_id: service.get_collaborative_recommendations(user_id, n=10)),
+        ('get_content_based_recommendations', lambda user_id: service.get_content_based_recommendations(user_id, n=10)),
+        ('get_genre_preferences', genre_preferences),
+        ('get_genre_recommendations', lambda user_id: service.get_genre_recommendations(user_id, n=5)),
+        ('get_all_recommendations', service.get_all_recommendations),
+    ):
+        logger.info(f"Benchmarking notebook.{name}")
+        results[f"notebook.{name}"] = time_calls(call, user_sample, warmup)
+    timed(setup, "notebook.compute_all_genre_preferences", service.compute_all_genre_preferences)
+    if write_file:
+        with tempfile.TemporaryDirectory() as workdir:
+            timed(setup, "notebook.generate_recommendations_file",
+                  lambda: service.generate_recommendations_file(os.path.join(workdir, 'recommendations.json')))
+    return setup, results
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    parser = argparse.ArgumentParser(description='Benchmark the recommendation engines on synthetic data')
+    parser.add_argument('--ratings', type=int, default=100000, help='Synthetic ratings (default: 100000)')
+    parser.add_argument('--titles', type=int, default=None, help='Synthetic titles (default: scaled with ratings)')
+    parser.add_argument('--users', type=int, default=None, help='Synthetic users (default: ratings / 40)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--target', choices=['service', 'notebook', 'all'], default='all',
+                        help='Which implementation to benchmark (default: all)')
+    parser.add_argument('--iterations', type=int, default=200, help='Timed calls per method (default: 200)')
+    parser.add_argument('--warmup', type=int, default=10, help='Untimed calls per method first (default: 10)')
+    parser.add_argument('--engine', choices=['memory', 'sql'], default='memory',
+                        help='Service engine; sql runs against the SQL_* database (default: memory)')
+    parser.add_argument('--collaborative', choices=['tiered', 'als'], default='tiered',
+                        help='Collaborative engine of the memory engine (default: tiered)')
+    parser.add_argument('--cache', action='store_true', help='Keep the service result cache on')
+    parser.add_argument('--notebook-file', action='store_true',
+                        help='Also time generate_recommendations_file (one call for every user)')
+    parser.add_argument('--output', default=None, help='Write the JSON report to this path')
+    parser.add_argument('--compare', default=None, help='Print changes against an earlier JSON report')
+    parser.add_argument('--log-level', default='WARNING',
+                        help='Log level of the services while timing (default: WARNING)')
+    args = parser.parse_args()
+
+    data = synthetic_data.generate(args.ratings, args.titles, args.users, seed=args.seed)
+    users = data.user_ids()
+    if args.engine == 'sql':
+        logger.info("Timing the SQL engine: users are sampled from the synthetic data, so it should be what the database holds")
+    logging.getLogger('recommendation_service').setLevel(args.log_level)
+    logging.getLogger('recommendation_notebook').setLevel(args.log_level)
+
+    report = {
+        "benchmark": "methods",
+        "metadata": report_metadata(),
+        "config": vars(args),
+        "data": data.stats(),
+        "setup": {},
+        "results": {},
+        "pool": None,
+    }
+    if args.target in ('service', 'all'):
+        setup, results, report["pool"] = benchmark_service(data, users, args.iterations, args.warmup,
+                                                           args.collaborative, args.engine, args.cache, args.seed)
+        report["setup"].update(setup)
+        report["results"].update(results)
+    if args.target in ('notebook', 'all'):
+        setup, results = benchmark_notebook(data, users, args.iterations, args.warmup,
+                                            args.notebook_file, args.seed)
+        report["setup"].update(setup)
+        report["results"].update(results)
+
+    logging.getLogger('recommendation_service').setLevel(logging.INFO)
+    print(json.dumps({key: report[key] for key in ("setup", "results", "pool")}, indent=2))
+    if args.output:
+        write_report(report, args.output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare_reports(json.load(f), report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+In-process index of the show IDs that exist in movies_titles.
+
+Used to validate recommendation lists without a database round trip. The
+index is reloaded when it is older than its TTL or when its version is
+bumped (for example after the catalog is known to have changed).
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger('recommendation_service')
+
+
+class CatalogIndex:
+    """
+    Hash set of valid show IDs with TTL / version based reloading.
+
+    Only one thread reloads a stale index; the others keep filtering against
+    the previous set until the new one is swapped in.
+    """
+
+    def __init__(self, loader, ttl=600):
+        """
+        Args:
+            loader (callable): Returns an iterable of every show_id in movies_titles.
+            ttl (float): Seconds before the index is considered stale (0 disables expiry).
+        """
+        self.loader = loader
+        self.ttl = ttl
+        self.version = 0
+        self.ids = None
+        self.loaded_version = None
+        self.loaded_at = 0.0
+        self._reload_lock = threading.Lock()
+
+    def invalidate(self):
+        """Bump the version so the next lookup reloads the index"""
+        self.version += 1
+
+    def is_stale(self):
+        if self.ids is None or self.loaded_version != self.version:
+            return True
+        return self.ttl > 0 and time.monotonic() - self.loaded_at > self.ttl
+
+    def refresh(self, blocking=True):
+        """
+        Reload the index from the loader.
+
+        Args:
+            blocking (bool): Wait for a reload already in progress instead of skipping.
+
+        Returns:
+            bool: True if this call reloaded the index.
+        """
+        if not self._reload_lock.acquire(blocking=blocking):
+            return False
+        try:
+            version = self.version
+            ids = frozenset(self.loader())
+            self.ids = ids
+            self.loaded_version = version
+            self.loaded_at = time.monotonic()
+        finally:
+            self._reload_lock.release()
+        logger.info(f"Loaded catalog index with {len(ids)} show IDs (version {version})")
+        return True
+
+    def _current_ids(self):
+        if self.is_stale():
+            if self.ids is None:
+                # Nothing to serve yet, so this caller has to wait for the load
+                self.refresh()
+            else:
+                try:
+                    self.refresh(blocking=False)
+                except Exception as e:
+                    logger.error(f"Error reloading catalog index, keeping previous version: {e}")
+        return self.ids
+
+    def __contains__(self, show_id):
+        return show_id in self._current_ids()
+
+    def __len__(self):
+        return len(self._current_ids())
+
+    def filter(self, movie_ids):
+        """
+        Keep only IDs that exist in the catalog, preserving input order.
+
+        Args:
+            movie_ids (list): Show IDs to check.
+
+        Returns:
+            list: The IDs from movie_ids that are in the catalog.
+        """
+        ids = self._current_ids()
+        return [movie_id for movie_id in movie_ids if movie_id in ids]
@@ -0,0 +1,195 @@
+"""
+Thread-safe pool of database connections for the recommendation service.
+
+pyodbc connections must not be used by two threads at once, so every query
+checks a connection out of the pool for its duration and returns it after.
+Connections are validated on checkout, recycled after sitting idle too long
+and replaced transparently when Azure SQL drops them.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger('recommendation_service')
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available within the checkout timeout"""
+
+
+class ConnectionPool:
+    """
+    Bounded pool of database connections.
+
+    At most max_size connections are open or checked out at any time; callers
+    beyond that wait up to `timeout` seconds for one to be returned.
+    """
+
+    def __init__(self, factory, max_size=10, timeout=30, max_idle=300,
+                 validation_interval=5, validation_query="SELECT 1"):
+        """
+        Args:
+            factory (callable): Opens and returns a new connection, or None on failure.
+            max_size (int): Maximum number of connections open at once.
+            timeout (float): Seconds to wait for a free connection on checkout.
+            max_idle (float): Idle connections older than this are closed instead of reused.
+            validation_interval (float): Connections used more recently than this skip
+                the validation query on checkout.
+            validation_query (str): Cheap statement used to check a connection is alive.
+        """
+        self.factory = factory
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.validation_interval = validation_interval
+        self.validation_query = validation_query
+
+        self._idle = deque()  # (connection, last returned at)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._in_use = 0
+        self._closed = False
+        self._stats = {
+            "created": 0,
+            "checkouts": 0,
+            "recycled": 0,
+            "invalidated": 0,
+            "timeouts": 0,
+            "failedConnects": 0,
+            "waitSeconds": 0.0,
+        }
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception as e:
+            logger.debug(f"Error closing pooled connection: {e}")
+
+    def _is_healthy(self, conn):
+        """Run the validation query, returning False if the connection is dead"""
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.validation_query)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception as e:
+            logger.warning(f"Discarding broken database connection: {e}")
+            return False
+
+    def checkout(self):
+        """
+        Take a healthy connection from the pool, opening a new one if needed.
+
+        Raises:
+            PoolTimeoutError: If the pool is exhausted for longer than the timeout.
+            ConnectionError: If a new connection could not be opened.
+        """
+        if self._closed:
+            raise ConnectionError("Connection pool is closed")
+
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            self._count("timeouts")
+            raise PoolTimeoutError(f"No database connection available after {self.timeout}s")
+        self._count("waitSeconds", time.monotonic() - started)
+
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    conn, returned_at = self._idle.pop()
+                idle_for = time.monotonic() - returned_at
+                if idle_for > self.max_idle:
+                    self._count("recycled")
+                    self._close_quietly(conn)
+                    continue
+                if idle_for > self.validation_interval and not self._is_healthy(conn):
+                    self._count("invalidated")
+                    self._close_quietly(conn)
+                    continue
+                return self._hand_out(conn)
+
+            conn = self.factory()
+            if conn is None:
+                self._count("failedConnects")
+                raise ConnectionError("Could not open a database connection")
+            self._count("created")
+            return self._hand_out(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _hand_out(self, conn):
+        with self._lock:
+            self._in_use += 1
+            self._stats["checkouts"] += 1
+        return conn
+
+    def checkin(self, conn, discard=False):
+        """
+        Return a connection to the pool.
+
+        Args:
+            conn: A connection obtained from checkout().
+            discard (bool): Close the connection instead of keeping it for reuse.
+        """
+        with self._lock:
+            self._in_use -= 1
+            keep = not discard and not self._closed
+            if keep:
+                self._idle.append((conn, time.monotonic()))
+        if not keep:
+            self._close_quietly(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager that checks a connection out and always returns it.
+
+        If the block raises, any open transaction is rolled back and the
+        connection is validated before being kept, so temp tables or a dead
+        socket never leak into the next caller.
+        """
+        conn = self.checkout()
+        try:
+            yield conn
+        except Exception:
+            discard = False
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+            self.checkin(conn, discard=discard or not self._is_healthy(conn))
+            raise
+        else:
+            self.checkin(conn)
+
+    def close(self):
+        """Close every idle connection and refuse further checkouts"""
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+        logger.info(f"Closed {len(idle)} pooled database connections")
+
+    def stats(self):
+        """Return a snapshot of pool usage counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["maxSize"] = self.max_size
+            stats["idle"] = len(self._idle)
+            stats["inUse"] = self._in_use
+        stats["waitSeconds"] = round(stats["waitSeconds"], 3)
+        return stats
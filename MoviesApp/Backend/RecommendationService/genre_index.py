@@ -0,0 +1,176 @@
+"""
+Per-genre ranked indexes of well-rated titles.
+
+For every genre column of movies_titles the index keeps the titles in that
+genre whose average rating clears a threshold, sorted by average rating.
+Genre rows are then served as slices by offset or by keyset (the last show
+ID the client saw). New ratings re-position only the rated title in the
+genres it belongs to, so the index stays current between full rebuilds,
+which happen when the index is older than its TTL or after a number of new
+ratings.
+"""
+
+import bisect
+import logging
+import threading
+import time
+
+logger = logging.getLogger('recommendation_service')
+
+
+class GenreIndex:
+    """
+    Sorted genre -> [show_id] lists keyed by (-average rating, show_id).
+    """
+
+    def __init__(self, loader, ttl=3600, refresh_after_ratings=1000, min_average=3.5):
+        """
+        Args:
+            loader (callable): Returns (catalog, title_stats), where catalog is an iterable of
+                (show_id, [genre names]) and title_stats an iterable of
+                (show_id, rating_count, average_rating).
+            ttl (float): Seconds between full rebuilds (0 disables expiry).
+            refresh_after_ratings (int): New ratings that trigger a rebuild (0 disables).
+            min_average (float): Titles need at least this average rating to be listed.
+        """
+        self.loader = loader
+        self.ttl = ttl
+        self.refresh_after_ratings = refresh_after_ratings
+        self.min_average = min_average
+
+        self.title_genres = None
+        self.rating_totals = {}  # show_id -> [count, sum]
+        self.keys = {}  # genre -> sorted [(-average, show_id)]
+        self.loaded_at = 0.0
+        self.pending_ratings = 0
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+
+    def _key(self, show_id):
+        count, total = self.rating_totals.get(show_id, (0, 0.0))
+        if not count or total / count < self.min_average:
+            return None
+        return (-(total / count), show_id)
+
+    def is_stale(self):
+        if self.title_genres is None:
+            return True
+        if self.refresh_after_ratings and self.pending_ratings >= self.refresh_after_ratings:
+            return True
+        return self.ttl > 0 and time.monotonic() - self.loaded_at > self.ttl
+
+    def refresh(self, blocking=True):
+        """
+        Rebuild every genre list from the loader.
+
+        Args:
+            blocking (bool): Wait for a rebuild already in progress instead of skipping.
+
+        Returns:
+            bool: True if this call rebuilt the index.
+        """
+        if not self._reload_lock.acquire(blocking=blocking):
+            return False
+        try:
+            with self._lock:
+                pending = self.pending_ratings
+            catalog, title_stats = self.loader()
+            title_genres = {str(show_id): list(genres) for show_id, genres in catalog}
+            rating_totals = {
+                str(show_id): [int(count), float(average) * int(count)]
+                for show_id, count, average in title_stats
+            }
+
+            keys = {}
+            for show_id, genres in title_genres.items():
+                count, total = rating_totals.get(show_id, (0, 0.0))
+                listed = count and total / count >= self.min_average
+                for genre in genres:
+                    genre_keys = keys.setdefault(genre, [])
+                    if listed:
+                        genre_keys.append((-(total / count), show_id))
+            for genre_keys in keys.values():
+                genre_keys.sort()
+
+            with self._lock:
+                self.title_genres = title_genres
+                self.rating_totals = rating_totals
+                self.keys = keys
+                self.loaded_at = time.monotonic()
+                self.pending_ratings -= pending
+        finally:
+            self._reload_lock.release()
+        logger.info(f"Built genre index for {len(keys)} genres over {len(title_genres)} titles")
+        return True
+
+    def _ensure_loaded(self):
+        if self.is_stale():
+            if self.title_genres is None:
+                # Nothing to serve yet, so this caller has to wait for the build
+                self.refresh()
+            else:
+                try:
+                    self.refresh(blocking=False)
+                except Exception as e:
+                    logger.error(f"Error rebuilding genre index, keeping previous version: {e}")
+
+    def apply_rating(self, show_id, rating, previous_rating=None):
+        """
+        Re-rank one title after a rating is added or changed.
+
+        Args:
+            show_id (str): The rated title.
+            rating (float): The new rating value.
+            previous_rating (float): The user's earlier rating of the title, if this
+                replaces one rather than adding a new rating.
+        """
+        show_id = str(show_id)
+        with self._lock:
+            self.pending_ratings += 1
+            if self.title_genres is None:
+                return
+            genres = self.title_genres.get(show_id, ())
+            old_key = self._key(show_id)
+
+            totals = self.rating_totals.setdefault(show_id, [0, 0.0])
+            if previous_rating is None or not totals[0]:
+                totals[0] += 1
+                totals[1] += float(rating)
+            else:
+                totals[1] += float(rating) - float(previous_rating)
+            new_key = self._key(show_id)
+            if new_key == old_key:
+                return
+
+            for genre in genres:
+                genre_keys = self.keys.setdefault(genre, [])
+                if old_key is not None:
+                    pos = bisect.bisect_left(genre_keys, old_key)
+                    if pos < len(genre_keys) and genre_keys[pos] == old_key:
+                        del genre_keys[pos]
+                if new_key is not None:
+                    bisect.insort(genre_keys, new_key)
+
+    def slice(self, genre, limit=20, offset=0, after=None):
+        """
+        Return a page of a genre's ranking.
+
+        Args:
+            genre (str): Genre column name.
+            limit (int): Page size.
+            offset (int): Number of ranked titles to skip (ignored when `after` is set).
+            after (str): Keyset cursor; the page starts right after this show ID.
+
+        Returns:
+            list: Show IDs in rank order, or None if the genre is not indexed.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            genre_keys = self.keys.get(genre)
+            if genre_keys is None:
+                return None
+            if after is not None:
+                key = self._key(str(after))
+                if key is not None:
+                    offset = bisect.bisect_right(genre_keys, key)
+            return [show_id for _, show_id in genre_keys[offset:offset + limit]]
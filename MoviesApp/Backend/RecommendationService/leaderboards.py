@@ -0,0 +1,199 @@
+"""
+Materialized leaderboards of globally popular and top-rated titles.
+
+The per-title rating aggregates (count and average) are loaded in one pass,
+ranked into a few fixed boards and served as list slices. A new rating
+re-positions only the rated title in each board; the boards are still
+rebuilt when they are older than their TTL or after a number of new ratings
+(which also refreshes the Bayesian prior), whichever comes first.
+"""
+
+import bisect
+import logging
+import threading
+import time
+
+logger = logging.getLogger('recommendation_service')
+
+# Board names served by Leaderboards.slice()
+POPULAR = 'popular'
+TOP_RATED = 'topRated'
+BAYESIAN = 'bayesian'
+
+
+class Leaderboards:
+    """
+    Precomputed ranked title lists.
+
+    Each board is a list of show IDs plus a parallel dict of per-title stats,
+    so a page is a plain slice and needs no aggregation at request time.
+    """
+
+    def __init__(self, loader, ttl=300, refresh_after_ratings=100, popular_min_average=3.5,
+                 top_rated_min_count=3, prior_weight=None):
+        """
+        Args:
+            loader (callable): Returns an iterable of (show_id, rating_count, average_rating).
+            ttl (float): Seconds before the boards are rebuilt (0 disables expiry).
+            refresh_after_ratings (int): New ratings that trigger a rebuild (0 disables).
+            popular_min_average (float): Minimum average for the popular board.
+            top_rated_min_count (int): Minimum number of ratings for the top-rated board.
+            prior_weight (float): Pseudo-count of the Bayesian prior; defaults to the
+                mean rating count per title.
+        """
+        self.loader = loader
+        self.ttl = ttl
+        self.refresh_after_ratings = refresh_after_ratings
+        self.popular_min_average = popular_min_average
+        self.top_rated_min_count = top_rated_min_count
+        self.prior_weight = prior_weight
+
+        self.boards = None
+        self.title_stats = {}
+        self.global_mean = 0.0
+        self.prior = 0.0
+        self.loaded_at = 0.0
+        self.pending_ratings = 0
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+
+    def _sort_key(self, board):
+        """Return the function boards are ordered by, reading the current title stats"""
+        field = {POPULAR: "count", TOP_RATED: "average", BAYESIAN: "bayesian"}[board]
+        return lambda show_id: (-self.title_stats[show_id][field], show_id)
+
+    def _qualifies(self, board, stats):
+        if board == POPULAR:
+            return stats["average"] >= self.popular_min_average
+        if board == TOP_RATED:
+            return stats["count"] >= self.top_rated_min_count
+        return True
+
+    def apply_rating(self, show_id, rating, previous_rating=None):
+        """
+        Update a title's stats after a rating and re-rank it in every board.
+
+        Args:
+            show_id (str): The rated title.
+            rating (float): The new rating value.
+            previous_rating (float): The user's earlier rating of the title, if this
+                replaces one rather than adding a new rating.
+        """
+        show_id = str(show_id)
+        with self._lock:
+            self.pending_ratings += 1
+            if self.boards is None:
+                return
+            stats = self.title_stats.get(show_id)
+            if stats is not None:
+                for board, ranking in self.boards.items():
+                    if self._qualifies(board, stats):
+                        key = self._sort_key(board)
+                        pos = bisect.bisect_left(ranking, key(show_id), key=key)
+                        if pos < len(ranking) and ranking[pos] == show_id:
+                            del ranking[pos]
+
+            count = stats["count"] if stats else 0
+            total = stats["average"] * count if stats else 0.0
+            if previous_rating is None or not count:
+                count += 1
+                total += float(rating)
+            else:
+                total += float(rating) - float(previous_rating)
+            stats = {
+                "count": count,
+                "average": total / count,
+                "bayesian": (self.prior * self.global_mean + total) / (self.prior + count),
+            }
+            self.title_stats[show_id] = stats
+
+            for board, ranking in self.boards.items():
+                if self._qualifies(board, stats):
+                    bisect.insort(ranking, show_id, key=self._sort_key(board))
+
+    def is_stale(self):
+        if self.boards is None:
+            return True
+        if self.refresh_after_ratings and self.pending_ratings >= self.refresh_after_ratings:
+            return True
+        return self.ttl > 0 and time.monotonic() - self.loaded_at > self.ttl
+
+    def refresh(self, blocking=True):
+        """
+        Rebuild every board from the loader.
+
+        Args:
+            blocking (bool): Wait for a rebuild already in progress instead of skipping.
+
+        Returns:
+            bool: True if this call rebuilt the boards.
+        """
+        if not self._reload_lock.acquire(blocking=blocking):
+            return False
+        try:
+            with self._lock:
+                pending = self.pending_ratings
+            rows = [(str(show_id), int(count), float(average)) for show_id, count, average in self.loader()]
+
+            total_count = sum(count for _, count, _ in rows)
+            global_mean = sum(count * average for _, count, average in rows) / total_count if total_count else 0.0
+            prior = self.prior_weight if self.prior_weight is not None else (total_count / len(rows) if rows else 0.0)
+
+            title_stats = {}
+            for show_id, count, average in rows:
+                bayesian = (prior * global_mean + count * average) / (prior + count) if prior + count else 0.0
+                title_stats[show_id] = {"count": count, "average": average, "bayesian": bayesian}
+
+            boards = {
+                POPULAR: [
+                    show_id for show_id, count, average in sorted(rows, key=lambda r: (-r[1], r[0]))
+                    if average >= self.popular_min_average
+                ],
+                TOP_RATED: [
+                    show_id for show_id, count, average in sorted(rows, key=lambda r: (-r[2], r[0]))
+                    if count >= self.top_rated_min_count
+                ],
+                BAYESIAN: sorted(title_stats, key=lambda s: (-title_stats[s]["bayesian"], s)),
+            }
+
+            with self._lock:
+                self.title_stats = title_stats
+                self.global_mean = global_mean
+                self.prior = prior
+                self.boards = boards
+                self.loaded_at = time.monotonic()
+                self.pending_ratings -= pending
+        finally:
+            self._reload_lock.release()
+        logger.info(f"Rebuilt leaderboards for {len(rows)} titles")
+        return True
+
+    def _current_boards(self):
+        if self.is_stale():
+            if self.boards is None:
+                # Nothing to serve yet, so this caller has to wait for the build
+                self.refresh()
+            else:
+                try:
+                    self.refresh(blocking=False)
+                except Exception as e:
+                    logger.error(f"Error rebuilding leaderboards, keeping previous version: {e}")
+        return self.boards
+
+    def slice(self, board, limit=10, offset=0):
+        """
+        Return a page of a board.
+
+        Args:
+            board (str): One of POPULAR, TOP_RATED or BAYESIAN.
+            limit (int): Page size.
+            offset (int): Number of ranked titles to skip.
+
+        Returns:
+            list: Show IDs in rank order.
+        """
+        return self._current_boards()[board][offset:offset + limit]
+
+    def stats(self, show_id):
+        """Return {'count', 'average', 'bayesian'} for a title, or None if it has no ratings"""
+        return self.title_stats.get(str(show_id))
@@ -0,0 +1,395 @@
+"""
+In-process metrics for the recommendation service.
+
+Counters and latency histograms are kept in a process-wide registry and
+rendered in the Prometheus text exposition format by the /metrics endpoint.
+Per-stage latency quantiles (p50/p95/p99) can be computed with PromQL's
+histogram_quantile, or read directly from MetricsRegistry.quantiles().
+
+Two kinds of timing are collected automatically:
+
+- instrument_methods() wraps the service's get_*/generate_* methods, timing
+  each call under its method name.
+- instrument_connection() wraps a database connection so every
+  cursor.execute() is timed under the name of the instrumented method that
+  issued it, and recorded with its fingerprint in query_log.py.
+"""
+
+import time
+import logging
+import functools
+import threading
+from contextvars import ContextVar
+
+from query_log import QUERY_LOG, estimate_bytes
+
+logger = logging.getLogger('recommendation_service')
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Name of the instrumented method currently running in this thread
+current_method = ContextVar('current_method', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels.
+    """
+
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        """Return [(name, labels, value)] in exposition order"""
+        with self._lock:
+            values = sorted(self._values.items())
+        return [(self.name, tuple(zip(self.labelnames, key)), value) for key, value in values]
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with optional labels.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series = {}  # label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        """Context manager observing the duration of its block"""
+        return _Timer(self, labels)
+
+    def samples(self):
+        """Return [(name, labels, value)] in exposition order"""
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        samples = []
+        for key, (counts, total, count) in series:
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", labels + (('le', _format_value(bound)),), cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+    def quantiles(self, quantiles=(0.5, 0.95, 0.99)):
+        """
+        Estimate quantiles of every series from its buckets.
+
+        Interpolates linearly within the bucket a quantile falls in, like
+        Prometheus' histogram_quantile; values in the +Inf bucket are
+        reported as the largest finite bound.
+
+        Returns:
+            dict: Label string -> {"count": n, "p50": seconds, ...}
+        """
+        with self._lock:
+            series = {key: (list(counts), count) for key, (counts, _, count) in self._series.items()}
+        result = {}
+        for key, (counts, count) in sorted(series.items()):
+            entry = {"count": count}
+            for q in quantiles:
+                entry[f"p{round(q * 100):g}"] = self._quantile(counts, count, q)
+            result[_format_labels(tuple(zip(self.labelnames, key)))] = entry
+        return result
+
+    def _quantile(self, counts, count, q):
+        if count == 0:
+            return None
+        rank = q * count
+        cumulative = 0
+        lower = 0.0
+        for bound, bucket_count in zip(self.buckets, counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if bound == float('inf'):
+                    return self.buckets[-2]
+                return round(lower + (bound - lower) * (rank - cumulative) / bucket_count, 6)
+            cumulative += bucket_count
+            if bound != float('inf'):
+                lower = bound
+        return self.buckets[-2]
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """
+    Named counters and histograms plus callbacks reporting other components' stats.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labelnames=()):
+        """Return the counter with this name, creating it on first use"""
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Return the histogram with this name, creating it on first use"""
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def add_collector(self, name, collect):
+        """
+        Report values owned by another component (cache and pool stats).
+
+        Args:
+            name (str): Replaces any earlier collector of the same name.
+            collect (callable): Returns [(metric name, type, help, value)],
+                type being 'counter' or 'gauge'.
+        """
+        with self._lock:
+            self._collectors[name] = collect
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.items())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for collector_name, collect in collectors:
+            try:
+                collected = collect()
+            except Exception as e:
+                logger.error(f"Error collecting {collector_name} metrics: {e}")
+                continue
+            for name, metric_type, help, value in collected:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                lines.append(f"{name} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def quantiles(self):
+        """Return p50/p95/p99 of every histogram series, for quick inspection"""
+        with self._lock:
+            histograms = [metric for metric in self._metrics.values() if isinstance(metric, Histogram)]
+        return {histogram.name: histogram.quantiles() for histogram in histograms}
+
+
+REGISTRY = MetricsRegistry()
+
+METHOD_SECONDS = REGISTRY.histogram(
+    'recommendation_method_duration_seconds', 'Duration of recommendation service methods', ('method',)
+)
+METHOD_ERRORS = REGISTRY.counter(
+    'recommendation_method_errors_total', 'Recommendation service methods that raised', ('method',)
+)
+SQL_SECONDS = REGISTRY.histogram(
+    'recommendation_sql_duration_seconds', 'Duration of cursor.execute calls by the method that issued them', ('method',)
+)
+SQL_ERRORS = REGISTRY.counter(
+    'recommendation_sql_errors_total', 'cursor.execute calls that raised, by the method that issued them', ('method',)
+)
+
+
+def instrument_methods(prefixes=('get_', 'generate_', '_generate_'), suffixes=('_section',)):
+    """
+    Class decorator timing every method whose name matches a prefix or suffix.
+
+    Calls are observed in METHOD_SECONDS under the method name, which is also
+    made the current_method so queries it runs are attributed to it.
+    """
+    def decorate(cls):
+        for name, method in list(vars(cls).items()):
+            if callable(method) and (name.startswith(prefixes) or name.endswith(suffixes)):
+                setattr(cls, name, _timed(name, method))
+        return cls
+    return decorate
+
+
+def _timed(name, method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        token = current_method.set(name)
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            METHOD_ERRORS.inc(method=name)
+            raise
+        finally:
+            METHOD_SECONDS.observe(time.perf_counter() - started, method=name)
+            current_method.reset(token)
+    return wrapper
+
+
+class InstrumentedCursor:
+    """
+    Cursor proxy timing execute() calls and recording each statement, with
+    the rows it fetched, in the query log; everything else is passed through.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._statement = None  # [sql, params, method, seconds, rows, bytes] of the last execute
+
+    def execute(self, sql, *params):
+        self._finish()
+        method = current_method.get() or 'other'
+        started = time.perf_counter()
+        try:
+            result = self._cursor.execute(sql, *params)
+        except Exception:
+            elapsed = time.perf_counter() - started
+            SQL_ERRORS.inc(method=method)
+            SQL_SECONDS.observe(elapsed, method=method)
+            QUERY_LOG.record(sql, params[0] if len(params) == 1 else params, elapsed, 0, 0, method, failed=True)
+            raise
+        elapsed = time.perf_counter() - started
+        SQL_SECONDS.observe(elapsed, method=method)
+        self._statement = [sql, params[0] if len(params) == 1 else params, method, elapsed, 0, 0]
+        # pyodbc returns the cursor itself so calls can be chained
+        return self if result is self._cursor else result
+
+    def _fetched(self, rows, seconds):
+        if self._statement is not None:
+            self._statement[3] += seconds
+            self._statement[4] += len(rows)
+            self._statement[5] += estimate_bytes(rows)
+
+    def _finish(self):
+        """Record the last statement once its results have been consumed"""
+        if self._statement is not None:
+            sql, params, method, seconds, rows, size = self._statement
+            self._statement = None
+            QUERY_LOG.record(sql, params, seconds, rows, size, method)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(rows, time.perf_counter() - started)
+        self._finish()
+        return rows
+
+    def fetchmany(self, *args):
+        started = time.perf_counter()
+        rows = self._cursor.fetchmany(*args)
+        self._fetched(rows, time.perf_counter() - started)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        if row is None:
+            self._finish()
+        else:
+            self._fetched([row], time.perf_counter() - started)
+        return row
+
+    def close(self):
+        self._finish()
+        return self._cursor.close()
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._finish()
+        return self._cursor.__exit__(exc_type, exc, tb)
+
+    def __del__(self):
+        self._finish()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """
+    Connection proxy whose cursors time their queries.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return InstrumentedCursor(self._conn.cursor())
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def instrument_connection(conn):
+    """Wrap a connection for query timing (None is passed through)"""
+    return InstrumentedConnection(conn) if conn is not None else None
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Precomputed item-item neighbor table for the strict collaborative tier.
+
+The strict tier recommends titles liked by users who rated the same titles
+within one star of the target user. Instead of self-joining movies_ratings
+per request, this module precomputes, for every (title, rating level) pair,
+the top-K titles liked by users whose rating of that title agrees with the
+level, weighted by how many such users there are. Scoring a user is then
+just summing the neighbor lists of the titles they rated.
+
+The table is stored as flat CSR-style arrays (int32 neighbors, float32
+weights) in an .npz file so it can be built offline and loaded quickly:
+
+    python neighbor_table.py --output neighbor_table.npz --neighbors 100
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger('recommendation_service')
+
+# Integer rating levels a user can give (movies_ratings.rating is 1-5)
+RATING_LEVELS = (1, 2, 3, 4, 5)
+
+
+def build_neighbor_table(ratings, item_keys, k=100, max_difference=1, liked_rating=3.5,
+                         levels=RATING_LEVELS, chunk_size=256):
+    """
+    Compute the top-k agreement-weighted neighbors of every title.
+
+    Args:
+        ratings (scipy.sparse matrix): users x titles rating matrix.
+        item_keys (sequence): show_id of each column of `ratings`.
+        k (int): Neighbors kept per (title, rating level) row.
+        max_difference (float): Maximum rating difference that counts as agreement.
+        liked_rating (float): Ratings at or above this count as liking a title.
+        levels (sequence): Rating levels a row is built for.
+        chunk_size (int): Titles processed per dense block (bounds peak memory).
+
+    Returns:
+        NeighborTable: The built table.
+    """
+    started = time.perf_counter()
+    ratings = sparse.csr_matrix(ratings, dtype=np.float32)
+    by_item = ratings.tocsc()
+    liked = ratings.copy()
+    liked.data = (liked.data >= liked_rating).astype(np.float32)
+    liked.eliminate_zeros()
+    liked = liked.tocsc()
+
+    n_items = ratings.shape[1]
+    indptr = [0]
+    neighbors = []
+    weights = []
+
+    for start in range(0, n_items, chunk_size):
+        end = min(start + chunk_size, n_items)
+        block = by_item[:, start:end]
+
+        # One dense (chunk x titles) block of agreement counts per rating level
+        level_blocks = []
+        for level in levels:
+            agree = block.copy()
+            agree.data = (np.abs(agree.data - level) <= max_difference).astype(np.float32)
+            agree.eliminate_zeros()
+            counts = (agree.T @ liked).toarray()
+            counts[np.arange(end - start), np.arange(start, end)] = 0
+            level_blocks.append(counts)
+
+        for row in range(end - start):
+            for counts in level_blocks:
+                row_counts = counts[row]
+                candidates = np.flatnonzero(row_counts)
+                if len(candidates) > k:
+                    top = np.argpartition(-row_counts[candidates], k - 1)[:k]
+                    candidates = candidates[top]
+                order = np.lexsort((candidates, -row_counts[candidates]))
+                candidates = candidates[order]
+                neighbors.append(candidates.astype(np.int32))
+                weights.append(row_counts[candidates].astype(np.float32))
+                indptr.append(indptr[-1] + len(candidates))
+
+    table = NeighborTable(
+        item_keys,
+        np.asarray(indptr, dtype=np.int64),
+        np.concatenate(neighbors) if neighbors else np.empty(0, dtype=np.int32),
+        np.concatenate(weights) if weights else np.empty(0, dtype=np.float32),
+        levels=levels,
+    )
+    logger.info(
+        f"Built neighbor table for {n_items} titles ({len(table.neighbors)} neighbors, k={k}) "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+    return table
+
+
+class NeighborTable:
+    """
+    Array-backed (title, rating level) -> [(neighbor title, weight)] table.
+
+    Row `item * len(levels) + level_index` holds the neighbors of a title for
+    users who rated it at that level, sorted by weight.
+    """
+
+    def __init__(self, item_keys, indptr, neighbors, weights, levels=RATING_LEVELS, built_at=None):
+        self.item_keys = np.asarray([str(key) for key in item_keys], dtype=str)
+        self.item_lookup = {key: idx for idx, key in enumerate(self.item_keys.tolist())}
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.neighbors = np.asarray(neighbors, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.levels = np.asarray(levels, dtype=np.float32)
+        self.built_at = built_at if built_at is not None else time.time()
+        self._matrix = None
+
+    @property
+    def num_items(self):
+        return len(self.item_keys)
+
+    def stats(self):
+        """Return a summary of the table for health and debugging output"""
+        return {
+            "titles": int(self.num_items),
+            "neighbors": int(len(self.neighbors)),
+            "builtAt": self.built_at,
+        }
+
+    def _row(self, item, rating):
+        level = int(np.abs(self.levels - rating).argmin())
+        row = item * len(self.levels) + level
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return self.neighbors[start:end], self.weights[start:end]
+
+    def score(self, user_ratings):
+        """
+        Sum the neighbor lists of every title a user rated.
+
+        Args:
+            user_ratings (dict): {show_id: rating} for the user.
+
+        Returns:
+            tuple: (scores array over titles, indices of the user's rated titles)
+        """
+        scores = np.zeros(self.num_items, dtype=np.float32)
+        rated = []
+        for show_id, rating in user_ratings.items():
+            item = self.item_lookup.get(str(show_id))
+            if item is None:
+                continue
+            rated.append(item)
+            neighbors, weights = self._row(item, float(rating))
+            np.add.at(scores, neighbors, weights)
+        return scores, np.asarray(rated, dtype=np.int64)
+
+    def recommend(self, user_ratings, limit=20, offset=0):
+        """
+        Rank unrated titles for a user by summed neighbor weight.
+
+        Args:
+            user_ratings (dict): {show_id: rating} for the user.
+            limit (int): Page size.
+            offset (int): Number of ranked titles to skip.
+
+        Returns:
+            list: Show IDs ordered by score (ties by show_id).
+        """
+        scores, rated = self.score(user_ratings)
+        scores[rated] = 0
+        return self._page(scores, limit, offset)
+
+    def _page(self, scores, limit, offset):
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) == 0:
+            return []
+        order = np.lexsort((candidates, -scores[candidates]))
+        return self.item_keys[candidates[order[offset:offset + limit]]].tolist()
+
+    def recommend_many(self, users_ratings, limit=20, offset=0):
+        """
+        Rank unrated titles for several users with one sparse matrix product.
+
+        Each user becomes a row selecting the (title, rating level) rows of
+        the titles they rated; multiplying by the table gives every user's
+        scores at once.
+
+        Args:
+            users_ratings (list): {show_id: rating} dict of each user.
+            limit (int): Page size.
+            offset (int): Number of ranked titles to skip.
+
+        Returns:
+            list: Show ID list of each user, as returned by recommend().
+        """
+        if self._matrix is None:
+            # (title, rating level) rows x titles, built on first use
+            self._matrix = sparse.csr_matrix(
+                (self.weights, self.neighbors, self.indptr),
+                shape=(len(self.indptr) - 1, self.num_items)
+            )
+
+        rows, cols, rated = [], [], []
+        for user, user_ratings in enumerate(users_ratings):
+            for show_id, rating in user_ratings.items():
+                item = self.item_lookup.get(str(show_id))
+                if item is None:
+                    continue
+                rows.append(user)
+                cols.append(item * len(self.levels) + int(np.abs(self.levels - float(rating)).argmin()))
+                rated.append(item)
+        selection = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(users_ratings), self._matrix.shape[0])
+        )
+        scores = (selection @ self._matrix).toarray()
+        scores[rows, rated] = 0
+        return [self._page(user_scores, limit, offset) for user_scores in scores]
+
+    def save(self, path):
+        """Write the table to an .npz file, replacing any existing file atomically"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                item_keys=self.item_keys,
+                indptr=self.indptr,
+                neighbors=self.neighbors,
+                weights=self.weights,
+                levels=self.levels,
+                built_at=np.float64(self.built_at),
+            )
+        os.replace(tmp_path, path)
+        logger.info(f"Saved neighbor table to {path}")
+
+    @classmethod
+    def load(cls, path):
+        """Load a table written by save()"""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data['item_keys'],
+                data['indptr'],
+                data['neighbors'],
+                data['weights'],
+                levels=data['levels'],
+                built_at=float(data['built_at']),
+            )
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    parser = argparse.ArgumentParser(description='Build the strict-tier item neighbor table from movies_ratings')
+    parser.add_argument('--output', default=os.getenv('NEIGHBOR_TABLE_PATH', 'neighbor_table.npz'),
+                        help='Path of the .npz file to write (default: neighbor_table.npz)')
+    parser.add_argument('--neighbors', type=int, default=100,
+                        help='Neighbors kept per title and rating level (default: 100)')
+    args = parser.parse_args()
+
+    from notebook_recommendation_service import get_connection
+    from ratings_store import RatingsStore
+
+    conn = get_connection()
+    if not conn:
+        logger.error("Could not connect to the database")
+        return 1
+    try:
+        store = RatingsStore.from_connection(conn)
+    finally:
+        conn.close()
+
+    table = build_neighbor_table(store.csr, store.item_keys, k=args.neighbors)
+    table.save(args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,20 @@
 import os
 import json
 import logging
+import time
 import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
+from connection_pool import ConnectionPool
+from catalog_index import CatalogIndex
+from leaderboards import Leaderboards, POPULAR, TOP_RATED
+from genre_index import GenreIndex
+from result_cache import ResultCache
+from scroll_cursors import ScrollCursorStore
+from single_flight import SingleFlight
+from metrics import REGISTRY, instrument_methods, instrument_connection
+from batch_generation import generate_all, DEFAULT_CHUNK_SIZE
 
 # Configure logging
 logger = logging.getLogger('recommendation_service')
@@ -15,6 +27,66 @@ except ImportError as e:
     logger.warning(f"pyodbc import failed: {e}. SQL database functionality will be unavailable.")
     PYODBC_AVAILABLE = False
 
+# The in-memory engine needs numpy/scipy; fall back to SQL-only mode without them
+try:
+    from ratings_store import RatingsStore
+    from neighbor_table import NeighborTable, build_neighbor_table
+    from als_model import ALSModel, train_als
+    RATINGS_STORE_AVAILABLE = True
+except ImportError as e:
+    logger.warning(f"ratings store import failed: {e}. In-memory engine will be unavailable.")
+    RATINGS_STORE_AVAILABLE = False
+
+# Genre columns of movies_titles used by the recommendation queries
+CATALOG_GENRE_COLUMNS = [
+    "Action", "Adventure", "Comedies", "Dramas",
+    "HorrorMovies", "Thrillers", "Documentaries"
+]
+# Every genre column of movies_titles, indexed for genre rows
+ALL_GENRE_COLUMNS = [
+    "Action", "Adventure", "AnimeSeriesInternationalTVShows",
+    "BritishTVShowsDocuseriesInternationalTVShows", "Children", "Comedies",
+    "ComediesDramasInternationalMovies", "ComediesInternationalMovies",
+    "ComediesRomanticMovies", "CrimeTVShowsDocuseries", "Documentaries",
+    "DocumentariesInternationalMovies", "Docuseries", "Dramas",
+    "DramasInternationalMovies", "DramasRomanticMovies", "FamilyMovies", "Fantasy",
+    "HorrorMovies", "InternationalMoviesThrillers",
+    "InternationalTVShowsRomanticTVShowsTVDramas", "KidsTV", "LanguageTVShows",
+    "Musicals", "NatureTV", "RealityTV", "Spirituality", "TVAction", "TVComedies",
+    "TVDramas", "TalkShowsTVComedies", "Thrillers"
+]
+# Genres compared by the content-based query
+CONTENT_GENRE_COLUMNS = ["Action", "Comedies", "Dramas", "Thrillers"]
+# Genres summed into the extended collaborative similarity score
+EXTENDED_SCORE_COLUMNS = ["Action", "Comedies", "Dramas", "Thrillers", "HorrorMovies"]
+# Sections a batch request can ask for
+BATCH_SECTIONS = ("collaborative", "contentBased", "genres")
+# Users per movies_ratings lookup (SQL Server allows 2100 parameters per query)
+USER_LOOKUP_CHUNK = 1000
+
+# Which source answered a section, e.g. the collaborative tier that produced results
+SECTION_SOURCES = REGISTRY.counter(
+    'recommendation_section_source_total', 'Sections answered, by section and the tier or fallback that answered',
+    ('section', 'source')
+)
+# Sections of generate_recommendations replaced by _section_fallback
+SECTION_FALLBACKS = REGISTRY.counter(
+    'recommendation_section_fallbacks_total', 'Sections replaced by their fallback', ('section', 'reason')
+)
+VALIDATION_DROPPED = REGISTRY.counter(
+    'recommendation_validation_dropped_total', 'Recommended show IDs dropped because they are not in the catalog'
+)
+
+def format_show_id(show_id):
+    """Ensure a show ID is in the 's' prefix format used by the frontend"""
+    if not show_id.startswith('s'):
+        # If it's a TMDB ID (starts with 'tt'), extract the numeric part
+        if show_id.startswith('tt'):
+            return f"s{show_id[2:]}"
+        # For any other format, just ensure it has 's' prefix
+        return f"s{show_id}"
+    return show_id
+
 def get_connection():
     """Create and return a connection to the database"""
     if not PYODBC_AVAILABLE:
@@ -38,25 +110,88 @@ def get_connection():
         return None
 
 
+@instrument_methods()
 class NotebookRecommendationService:
     """
     Recommendation service that connects to SQL database.
     Falls back to sample data if database connection fails.
+
+    With the "memory" engine the ratings table is loaded once into a
+    RatingsStore and every rating-based query is answered from memory.
     """
     
-    def __init__(self):
-        """Initialize the recommendation service."""
-        self.conn = None
+    def __init__(self, engine=None, preload=True):
+        """
+        Initialize the recommendation service.
+
+        Args:
+            engine (str): 'sql' to query the database on every call, or 'memory'
+                to serve rating-based queries from an in-memory snapshot.
+                Defaults to the RECOMMENDATION_ENGINE environment variable.
+            preload (bool): Connect to the database and load the indexes, ratings
+                snapshot and models up front. Batch workers pass False and are
+                handed the data of the service that started them instead
+                (see batch_generation.py); their pool connects on first use.
+        """
+        self.pool = None
+        self.catalog_index = CatalogIndex(self._load_catalog_ids, ttl=float(os.getenv('CATALOG_INDEX_TTL', 600)))
+        self.engine = (engine or os.getenv('RECOMMENDATION_ENGINE', 'sql')).lower()
+        self.ratings_store = None
+        self.neighbor_table = None
+        self.als_model = None
+        self.leaderboards = None
+        self.genre_index = None
+        # Bumped whenever the data behind recommendations is reloaded, so cached results keyed by it expire
+        self.model_version = 0
+        # Response versions also roll over this often, since other users' ratings change results too
+        self.etag_max_age = float(os.getenv('ETAG_MAX_AGE', 3600))
+        self.result_cache = ResultCache(
+            max_entries=int(os.getenv('RESULT_CACHE_SIZE', 10000)),
+            ttl=float(os.getenv('RESULT_CACHE_TTL', 300)),
+            stale_ttl=float(os.getenv('RESULT_CACHE_STALE_TTL', 600))
+        )
+        # Concurrent identical requests share one computation
+        self.single_flight = SingleFlight()
+        self.scroll_cursors = ScrollCursorStore(
+            ttl=float(os.getenv('SCROLL_CURSOR_TTL', 1800)),
+            max_lists=int(os.getenv('SCROLL_CURSOR_MAX_LISTS', 10000))
+        )
+        self.neighbor_table_path = os.getenv('NEIGHBOR_TABLE_PATH', 'neighbor_table.npz')
+        # 'tiered' for the neighbor-based tiers, 'als' to rank with the matrix-factorization model
+        self.collaborative_engine = os.getenv('COLLABORATIVE_ENGINE', 'tiered').lower()
+        self.als_model_path = os.getenv('ALS_MODEL_PATH', 'als_model.npz')
+        # Users who rated since the ALS model was trained; they are folded in from their current ratings.
+        # Changed under _rating_lock; readers only test membership
+        self._als_stale_users = set()
+        self._builder_stops = []
+        # Ratings kept in the store's overlay before it is reloaded from the database
+        self.ratings_store_reload_after = int(os.getenv('RATINGS_STORE_RELOAD_AFTER', 10000))
+        self._ratings_store_reloading = False
+        self._rating_lock = threading.Lock()
+        # Sections of generate_recommendations run side by side on this executor
+        self.concurrent_sections = os.getenv('CONCURRENT_SECTIONS', 'true').lower() == 'true'
+        self.section_timeout = float(os.getenv('SECTION_TIMEOUT', 5))
+        self.section_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('SECTION_WORKERS', 8)), thread_name_prefix='section'
+        )
         
         if PYODBC_AVAILABLE:
             try:
-                self.conn = get_connection()
-                if self.conn:
+                pool = ConnectionPool(
+                    # Connections time their queries for /metrics
+                    lambda: instrument_connection(get_connection()),
+                    max_size=int(os.getenv('SQL_POOL_SIZE', 10)),
+                    timeout=float(os.getenv('SQL_POOL_TIMEOUT', 30)),
+                    max_idle=float(os.getenv('SQL_POOL_MAX_IDLE', 300))
+                )
+                if preload:
+                    # Open the first connection up front so we know whether the database is reachable
+                    with pool.connection():
+                        pass
                     logger.info("Successfully connected to SQL database")
-                else:
-                    logger.warning("Failed to connect to database, using fallback sample data")
+                self.pool = pool
             except Exception as e:
-                logger.error(f"Error initializing database connection: {e}")
+                logger.warning(f"Failed to connect to database, using fallback sample data: {e}")
         else:
             logger.info("Using sample data (pyodbc not available)")
             
@@ -76,58 +211,411 @@ class NotebookRecommendationService:
             "Action", "Comedy", "Drama", "Horror", "SciFi", 
             "Thriller", "Romance", "Animation", "Documentary"
         ]
-        logger.info("Recommendation service initialized")
+
+        if preload:
+            if self.pool:
+                try:
+                    self.catalog_index.refresh()
+                except Exception as e:
+                    logger.error(f"Error loading catalog index: {e}")
+                self.leaderboards = Leaderboards(
+                    self._load_title_stats,
+                    ttl=float(os.getenv('LEADERBOARD_TTL', 300)),
+                    refresh_after_ratings=int(os.getenv('LEADERBOARD_REFRESH_RATINGS', 1000))
+                )
+                self.genre_index = GenreIndex(
+                    self._load_genre_catalog,
+                    ttl=float(os.getenv('GENRE_INDEX_TTL', 3600)),
+                    refresh_after_ratings=int(os.getenv('GENRE_INDEX_REFRESH_RATINGS', 1000))
+                )
+            if self.engine == 'memory':
+                self.refresh_ratings_store()
+            self.load_neighbor_table()
+            rebuild_interval = float(os.getenv('NEIGHBOR_TABLE_REBUILD_SECONDS', 0))
+            if rebuild_interval > 0:
+                self.start_neighbor_table_builder(rebuild_interval)
+            if self.collaborative_engine == 'als':
+                self.load_als_model()
+                als_interval = float(os.getenv('ALS_REBUILD_SECONDS', 0))
+                if als_interval > 0:
+                    self.start_als_builder(als_interval)
+                elif self.als_model is None:
+                    logger.warning(f"No ALS model at {self.als_model_path}, using the tiered collaborative engine until one is trained")
+        REGISTRY.add_collector('recommendation_service', self._collect_metrics)
+        logger.info(f"Recommendation service initialized ({self.engine} engine)")
     
+    def _collect_metrics(self):
+        """Cache, coalescing and pool counters for /metrics"""
+        cache = self.result_cache.stats()
+        flights = self.single_flight.stats()
+        collected = [
+            ('recommendation_result_cache_hits_total', 'counter', 'Fresh result cache hits', cache["hits"]),
+            ('recommendation_result_cache_stale_hits_total', 'counter', 'Stale result cache hits', cache["staleHits"]),
+            ('recommendation_result_cache_misses_total', 'counter', 'Result cache misses', cache["misses"]),
+            ('recommendation_result_cache_entries', 'gauge', 'Results in the result cache', cache["entries"]),
+            ('recommendation_single_flight_calls_total', 'counter', 'Calls through single-flight', flights["calls"]),
+            ('recommendation_single_flight_coalesced_total', 'counter', 'Calls that shared a concurrent computation', flights["coalesced"]),
+            ('recommendation_model_version', 'gauge', 'Reloads of the data behind recommendations', self.model_version),
+        ]
+        if self.pool:
+            pool = self.pool.stats()
+            collected += [
+                ('recommendation_sql_pool_checkouts_total', 'counter', 'Connections checked out of the pool', pool["checkouts"]),
+                ('recommendation_sql_pool_timeouts_total', 'counter', 'Checkouts that timed out', pool["timeouts"]),
+                ('recommendation_sql_pool_in_use', 'gauge', 'Connections checked out now', pool["inUse"]),
+                ('recommendation_sql_pool_idle', 'gauge', 'Idle pooled connections', pool["idle"]),
+            ]
+        return collected
+
     def __del__(self):
-        """Close database connection when object is destroyed"""
-        if self.conn:
+        """Close pooled database connections when object is destroyed"""
+        for stop in getattr(self, '_builder_stops', []):
+            stop.set()
+        if getattr(self, 'section_executor', None):
+            self.section_executor.shutdown(wait=False, cancel_futures=True)
+        if self.pool:
             try:
-                self.conn.close()
-                logger.info("Database connection closed")
+                self.pool.close()
             except Exception as e:
-                logger.error(f"Error closing database connection: {e}")
+                logger.error(f"Error closing database connections: {e}")
+
+    def _load_catalog_ids(self):
+        """Load every show ID in movies_titles for the catalog index"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT show_id FROM movies_titles")
+            show_ids = [row.show_id for row in cursor.fetchall()]
+            cursor.close()
+        return show_ids
+
+    def _load_title_stats(self):
+        """Load (show_id, rating count, average rating) for every rated title"""
+        if self.ratings_store is not None:
+            return list(self.ratings_store.title_stats())
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+            SELECT show_id, COUNT(*) AS rating_count, AVG(CAST(rating AS FLOAT)) AS avg_rating
+            FROM movies_ratings
+            GROUP BY show_id
+            """)
+            stats = [(row.show_id, row.rating_count, row.avg_rating) for row in cursor.fetchall()]
+            cursor.close()
+        return stats
+
+    def _load_genre_catalog(self):
+        """Load every title's genres plus per-title rating stats for the genre index"""
+        genre_select = ', '.join(f"[{genre}]" for genre in ALL_GENRE_COLUMNS)
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT show_id, {genre_select} FROM movies_titles")
+            catalog = [
+                (row[0], [genre for genre, value in zip(ALL_GENRE_COLUMNS, row[1:]) if value and value > 0])
+                for row in cursor.fetchall()
+            ]
+            cursor.close()
+        return catalog, self._load_title_stats()
+
+    def record_rating(self, user_id, show_id, rating):
+        """
+        Apply a new rating incrementally.
+
+        The rating is added to the in-memory ratings store (when the memory
+        engine is used), the rated title is re-ranked in the leaderboards and
+        its genre rows, and the user's cached results and scroll lists are
+        dropped. Nothing is rebuilt; the store is reloaded in the background
+        once enough ratings have piled up in its overlay.
+
+        Without the store (or when the title is not in it) the user's earlier
+        rating of the title is unknown, since the database already holds the
+        new one, so the rating is applied to the leaderboards and genre index
+        as a new one. The drift this leaves when a rating was changed is
+        cleared by their rebuild after LEADERBOARD_REFRESH_RATINGS and
+        GENRE_INDEX_REFRESH_RATINGS new ratings.
+
+        Args:
+            user_id (str): The user who rated.
+            show_id (str): The rated title.
+            rating (int): The rating value.
+
+        Returns:
+            dict: What was updated, for the endpoint response.
+        """
+        previous_rating = None
+        in_store = False
+        with self._rating_lock:
+            if self.collaborative_engine == 'als':
+                self._als_stale_users.add(str(user_id))
+            store = self.ratings_store
+            if store is not None:
+                in_store, previous_rating = store.apply_rating(user_id, show_id, rating)
+        if store is not None and not in_store:
+            logger.info(f"Show {show_id} is not in the ratings snapshot yet, it will be included on the next reload")
+
+        self.result_cache.invalidate_user(user_id)
+        self.scroll_cursors.invalidate_user(user_id)
+        for index in (self.leaderboards, self.genre_index):
+            if index is not None:
+                index.apply_rating(show_id, rating, previous_rating)
+
+        if in_store and store.num_pending >= self.ratings_store_reload_after:
+            self._reload_ratings_store_in_background()
+
+        return {"ratingsStore": in_store, "previousRating": previous_rating}
+
+    def _reload_ratings_store_in_background(self):
+        """Fold the store's overlay into a fresh snapshot without blocking the caller"""
+        if self._ratings_store_reloading:
+            return
+        self._ratings_store_reloading = True
+
+        def run():
+            try:
+                self.refresh_ratings_store()
+            finally:
+                self._ratings_store_reloading = False
+
+        threading.Thread(target=run, name='ratings-store-reload', daemon=True).start()
+
+    def refresh_ratings_store(self):
+        """
+        Reload the in-memory ratings snapshot from the database.
+
+        The new snapshot is built off to the side and swapped in, so requests
+        keep using the previous one until loading has finished.
+
+        Returns:
+            bool: True if a new snapshot was loaded.
+        """
+        if not RATINGS_STORE_AVAILABLE:
+            logger.warning("In-memory engine requested but numpy/scipy are not available, using SQL queries")
+            return False
+        if not self.pool:
+            logger.warning("In-memory engine requested but there is no database connection")
+            return False
+            
+        try:
+            with self.pool.connection() as conn:
+                store = RatingsStore.from_connection(conn, CATALOG_GENRE_COLUMNS)
+            with self._rating_lock:
+                # Carry over ratings recorded while the new snapshot was loading;
+                # ones it already contains are no-ops
+                if self.ratings_store is not None:
+                    for user_id, show_id, rating in self.ratings_store.pending_ratings():
+                        store.apply_rating(user_id, show_id, rating)
+                self.ratings_store = store
+            # The snapshot reflects the current catalog, so reload the ID index alongside it
+            self.catalog_index.invalidate()
+            self.model_version += 1
+            logger.info(f"Loaded ratings store: {self.ratings_store.stats()}")
+            return True
+        except Exception as e:
+            logger.error(f"Error loading ratings store: {e}")
+            return False
+
+    def load_neighbor_table(self):
+        """
+        Load the precomputed strict-tier neighbor table from disk, if present.
+
+        Returns:
+            bool: True if a table was loaded.
+        """
+        if not RATINGS_STORE_AVAILABLE or not os.path.exists(self.neighbor_table_path):
+            return False
+            
+        try:
+            self.neighbor_table = NeighborTable.load(self.neighbor_table_path)
+            self.model_version += 1
+            logger.info(f"Loaded neighbor table from {self.neighbor_table_path}: {self.neighbor_table.stats()}")
+            return True
+        except Exception as e:
+            logger.error(f"Error loading neighbor table: {e}")
+            return False
+
+    def rebuild_neighbor_table(self, k=100):
+        """
+        Rebuild the strict-tier neighbor table from the current ratings and save it.
+
+        Uses the in-memory ratings store when available, otherwise loads a
+        temporary snapshot of movies_ratings for the build.
+
+        Returns:
+            bool: True if a new table was built and swapped in.
+        """
+        if not RATINGS_STORE_AVAILABLE or not self.pool:
+            return False
+            
+        try:
+            store = self.ratings_store
+            if store is None:
+                with self.pool.connection() as conn:
+                    store = RatingsStore.from_connection(conn)
+            table = build_neighbor_table(store.ratings_matrix(), store.item_keys, k=k)
+            table.save(self.neighbor_table_path)
+            self.neighbor_table = table
+            self.model_version += 1
+            return True
+        except Exception as e:
+            logger.error(f"Error rebuilding neighbor table: {e}")
+            return False
+
+    def load_als_model(self):
+        """
+        Load the trained ALS model from disk, if present.
+
+        Returns:
+            bool: True if a model was loaded.
+        """
+        if not RATINGS_STORE_AVAILABLE or not os.path.exists(self.als_model_path):
+            return False
+
+        try:
+            self.als_model = ALSModel.load(self.als_model_path)
+            self.model_version += 1
+            logger.info(f"Loaded ALS model from {self.als_model_path}: {self.als_model.stats()}")
+            return True
+        except Exception as e:
+            logger.error(f"Error loading ALS model: {e}")
+            return False
+
+    def rebuild_als_model(self):
+        """
+        Retrain the ALS model on the current ratings and save it.
+
+        Uses the in-memory ratings store (including ratings recorded since it
+        was loaded) when available, otherwise loads a temporary snapshot of
+        movies_ratings for training.
+
+        Returns:
+            bool: True if a new model was trained and swapped in.
+        """
+        if not RATINGS_STORE_AVAILABLE or not self.pool:
+            return False
+
+        try:
+            with self._rating_lock:
+                trained_for = set(self._als_stale_users)
+            store = self.ratings_store
+            if store is None:
+                with self.pool.connection() as conn:
+                    store = RatingsStore.from_connection(conn)
+            with self._rating_lock:
+                ratings = store.ratings_matrix()
+                user_keys = sorted(store.user_lookup, key=store.user_lookup.get)
+            model = train_als(
+                ratings, user_keys, store.item_keys,
+                factors=int(os.getenv('ALS_FACTORS', 32)),
+                iterations=int(os.getenv('ALS_ITERATIONS', 10))
+            )
+            model.save(self.als_model_path)
+            self.als_model = model
+            # Ratings recorded while training still need folding in
+            with self._rating_lock:
+                self._als_stale_users = self._als_stale_users - trained_for
+            self.model_version += 1
+            return True
+        except Exception as e:
+            logger.error(f"Error rebuilding ALS model: {e}")
+            return False
+
+    def _start_builder(self, name, rebuild, has_result, interval):
+        """Call rebuild() in a background thread every `interval` seconds"""
+        def run():
+            # Build right away when there is nothing loaded yet, otherwise wait a full interval
+            if has_result():
+                stop.wait(interval)
+            while not stop.is_set():
+                rebuild()
+                stop.wait(interval)
+
+        stop = threading.Event()
+        self._builder_stops.append(stop)
+        threading.Thread(target=run, name=name, daemon=True).start()
+
+    def start_neighbor_table_builder(self, interval):
+        """Rebuild the neighbor table in a background thread every `interval` seconds"""
+        self._start_builder('neighbor-table-builder', self.rebuild_neighbor_table,
+                            lambda: self.neighbor_table is not None, interval)
+        logger.info(f"Started neighbor table builder (every {interval:.0f}s)")
+
+    def start_als_builder(self, interval):
+        """Retrain the ALS model in a background thread every `interval` seconds"""
+        self._start_builder('als-builder', self.rebuild_als_model,
+                            lambda: self.als_model is not None, interval)
+        logger.info(f"Started ALS model builder (every {interval:.0f}s)")
 
     def get_user_ratings(self, user_id):
         """Get all ratings for a specific user"""
-        if not self.conn:
+        if self.ratings_store is not None:
+            return self.ratings_store.user_ratings(user_id)
+        if not self.pool:
             # If no database connection, return empty dict
             return {}
             
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT show_id, rating FROM movies_ratings WHERE user_id = ?", (user_id,))
-            ratings = {row.show_id: row.rating for row in cursor.fetchall()}
-            cursor.close()
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT show_id, rating FROM movies_ratings WHERE user_id = ?", (user_id,))
+                ratings = {row.show_id: row.rating for row in cursor.fetchall()}
+                cursor.close()
             logger.info(f"Retrieved {len(ratings)} ratings for user {user_id}")
             return ratings
         except Exception as e:
             logger.error(f"Error retrieving user ratings: {e}")
             return {}
     
+    def get_users_ratings(self, user_ids):
+        """Get the ratings of several users with one query per USER_LOOKUP_CHUNK users"""
+        if self.ratings_store is not None:
+            return {user_id: self.ratings_store.user_ratings(user_id) for user_id in user_ids}
+        ratings = {user_id: {} for user_id in user_ids}
+        if not self.pool:
+            return ratings
+
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                for start in range(0, len(user_ids), USER_LOOKUP_CHUNK):
+                    chunk = user_ids[start:start + USER_LOOKUP_CHUNK]
+                    placeholders = ", ".join("?" * len(chunk))
+                    cursor.execute(
+                        f"SELECT user_id, show_id, rating FROM movies_ratings WHERE user_id IN ({placeholders})",
+                        chunk
+                    )
+                    for row in cursor.fetchall():
+                        ratings.setdefault(str(row.user_id), {})[row.show_id] = row.rating
+                cursor.close()
+            logger.info(f"Retrieved ratings for {len(user_ids)} users")
+            return ratings
+        except Exception as e:
+            logger.error(f"Error retrieving ratings for {len(user_ids)} users: {e}")
+            return ratings
+
     def get_movie_ids(self, limit=100):
         """Get a list of movie IDs from the database"""
-        if not self.conn:
+        if not self.pool:
             # If no database connection, return sample movies
             return self.sample_movies
             
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT TOP (?) show_id FROM movies_titles", (limit,))
-            # Ensure all IDs are in the 's' prefix format
-            movie_ids = []
-            for row in cursor.fetchall():
-                # Get the ID and ensure it's in the correct format (starting with 's')
-                show_id = row.show_id
-                if not show_id.startswith('s'):
-                    # If it's a TMDB ID (starts with 'tt'), extract the numeric part
-                    if show_id.startswith('tt'):
-                        show_id = f"s{show_id[2:]}"
-                    else:
-                        # For any other format, just ensure it has 's' prefix
-                        show_id = f"s{show_id}"
-                movie_ids.append(show_id)
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT TOP (?) show_id FROM movies_titles", (limit,))
+                # Ensure all IDs are in the 's' prefix format
+                movie_ids = []
+                for row in cursor.fetchall():
+                    # Get the ID and ensure it's in the correct format (starting with 's')
+                    show_id = row.show_id
+                    if not show_id.startswith('s'):
+                        # If it's a TMDB ID (starts with 'tt'), extract the numeric part
+                        if show_id.startswith('tt'):
+                            show_id = f"s{show_id[2:]}"
+                        else:
+                            # For any other format, just ensure it has 's' prefix
+                            show_id = f"s{show_id}"
+                    movie_ids.append(show_id)
             
-            cursor.close()
+                cursor.close()
             logger.info(f"Retrieved {len(movie_ids)} movie IDs from database")
             return movie_ids
         except Exception as e:
@@ -136,7 +624,8 @@ class NotebookRecommendationService:
             
     def validate_movie_ids(self, movie_ids):
         """
-        Filter out movie IDs that don't exist in the database
+        Filter out movie IDs that don't exist in the database, using the
+        in-process catalog index instead of a query per call
         
         Args:
             movie_ids (list): List of movie IDs to validate
@@ -144,29 +633,18 @@ class NotebookRecommendationService:
         Returns:
             list: Filtered list containing only valid movie IDs
         """
-        if not self.conn or not movie_ids:
+        if not self.pool or not movie_ids:
             return movie_ids
             
         try:
-            # Convert list to tuple for SQL query
-            ids_tuple_str = ','.join(f"'{id}'" for id in movie_ids)
-            
-            cursor = self.conn.cursor()
-            query = f"""
-            SELECT show_id
-            FROM movies_titles
-            WHERE show_id IN ({ids_tuple_str})
-            """
-            cursor.execute(query)
-            
-            # Get all valid IDs from the database
-            valid_ids = [row.show_id for row in cursor.fetchall()]
-            cursor.close()
+            # In-memory lookup against the catalog index, keeping the input order
+            valid_ids = self.catalog_index.filter(movie_ids)
             
             # Log how many IDs were filtered out
             filtered_count = len(movie_ids) - len(valid_ids)
             if filtered_count > 0:
                 logger.warning(f"Filtered out {filtered_count} non-existent movie IDs")
+                VALIDATION_DROPPED.inc(filtered_count)
                 
             return valid_ids
         except Exception as e:
@@ -175,47 +653,57 @@ class NotebookRecommendationService:
     
     def get_genre_movies(self, genre, limit=20, offset=0):
         """Get movies for a specific genre with good ratings with pagination support"""
-        if not self.conn:
+        if not self.pool:
             # If no database connection, return sample movies
             return random.sample(self.sample_movies, min(limit, len(self.sample_movies)))
             
         try:
-            cursor = self.conn.cursor()
-            # Use the genre column name directly from the database
-            # Note: This assumes the genre names match column names in the database
-            # We need to sanitize the genre name to ensure it's a valid column name
-            sanitized_genre = ''.join(c for c in genre if c.isalnum())
-            query = f"""
-            SELECT m.show_id 
-            FROM movies_titles m
-            JOIN (
-                SELECT show_id, AVG(CAST(rating AS FLOAT)) as avg_rating
-                FROM movies_ratings
-                GROUP BY show_id
-                HAVING AVG(CAST(rating AS FLOAT)) >= 3.5
-            ) r ON m.show_id = r.show_id
-            WHERE [{sanitized_genre}] > 0
-            ORDER BY r.avg_rating DESC
-            OFFSET ? ROWS
-            FETCH NEXT ? ROWS ONLY
-            """
-            cursor.execute(query, (offset, limit))
-            
-            # Ensure all IDs are in the 's' prefix format
-            genre_movies = []
-            for row in cursor.fetchall():
-                # Get the ID and ensure it's in the correct format (starting with 's')
-                show_id = row.show_id
-                if not show_id.startswith('s'):
-                    # If it's a TMDB ID (starts with 'tt'), extract the numeric part
-                    if show_id.startswith('tt'):
-                        show_id = f"s{show_id[2:]}"
-                    else:
-                        # For any other format, just ensure it has 's' prefix
-                        show_id = f"s{show_id}"
-                genre_movies.append(show_id)
+            if self.genre_index is not None:
+                genre_movies = self.genre_index.slice(genre, limit, offset)
+                if genre_movies is not None:
+                    genre_movies = [format_show_id(show_id) for show_id in genre_movies]
+                    if not genre_movies:
+                        return random.sample(self.get_movie_ids(), min(limit, len(self.sample_movies)))
+                    logger.info(f"Retrieved {len(genre_movies)} movies for genre {genre} from genre index")
+                    return genre_movies
+
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                # Use the genre column name directly from the database
+                # Note: This assumes the genre names match column names in the database
+                # We need to sanitize the genre name to ensure it's a valid column name
+                sanitized_genre = ''.join(c for c in genre if c.isalnum())
+                query = f"""
+                SELECT m.show_id 
+                FROM movies_titles m
+                JOIN (
+                    SELECT show_id, AVG(CAST(rating AS FLOAT)) as avg_rating
+                    FROM movies_ratings
+                    GROUP BY show_id
+                    HAVING AVG(CAST(rating AS FLOAT)) >= 3.5
+                ) r ON m.show_id = r.show_id
+                WHERE [{sanitized_genre}] > 0
+                ORDER BY r.avg_rating DESC
+                OFFSET ? ROWS
+                FETCH NEXT ? ROWS ONLY
+                """
+                cursor.execute(query, (offset, limit))
+            
+                # Ensure all IDs are in the 's' prefix format
+                genre_movies = []
+                for row in cursor.fetchall():
+                    # Get the ID and ensure it's in the correct format (starting with 's')
+                    show_id = row.show_id
+                    if not show_id.startswith('s'):
+                        # If it's a TMDB ID (starts with 'tt'), extract the numeric part
+                        if show_id.startswith('tt'):
+                            show_id = f"s{show_id[2:]}"
+                        else:
+                            # For any other format, just ensure it has 's' prefix
+                            show_id = f"s{show_id}"
+                    genre_movies.append(show_id)
                 
-            cursor.close()
+                cursor.close()
             
             if not genre_movies:
                 # Fallback if no movies found for this genre
@@ -229,11 +717,18 @@ class NotebookRecommendationService:
     
     def get_collaborative_recommendations(self, user_id, limit=20, offset=0):
         """Get collaborative filtering recommendations for a user with pagination"""
-        if not self.conn:
+        if not self.pool:
             # If no database connection, return sample movies
             return random.sample(self.sample_movies, min(limit, len(self.sample_movies)))
             
         try:
+            if self.collaborative_engine == 'als' and self.als_model is not None:
+                recommendations = self.get_als_recommendations(user_id, limit, offset)
+                if recommendations:
+                    logger.info(f"Retrieved {len(recommendations)} ALS recommendations")
+                    SECTION_SOURCES.inc(section='collaborative', source='als')
+                    return recommendations
+
             # Calculate the tier based on offset to progressively relax constraints
             # This allows us to generate more recommendations as the user scrolls
             tier = min(4, offset // 40)  # Tier increases every 40 movies (8 pages of 5)
@@ -246,6 +741,7 @@ class NotebookRecommendationService:
                 recommendations = self.get_strict_collaborative_recommendations(user_id, limit, offset)
                 if recommendations and len(recommendations) > 0:
                     logger.info(f"Retrieved {len(recommendations)} strict collaborative recommendations")
+                    SECTION_SOURCES.inc(section='collaborative', source='strict')
                     return recommendations
             
             # If we've already gone through initial tiers or strict recommendations returned nothing
@@ -253,57 +749,77 @@ class NotebookRecommendationService:
                 recommendations = self.get_extended_collaborative_recommendations(user_id, limit, offset, tier)
                 if recommendations and len(recommendations) > 0:
                     logger.info(f"Retrieved {len(recommendations)} extended recommendations (tier {tier})")
+                    SECTION_SOURCES.inc(section='collaborative', source=f'extended_tier{tier}')
                     return recommendations
             
             # Final fallback to popular and genre-based recommendations
             logger.info(f"No suitable collaborative recommendations found for user {user_id}, using fallbacks")
+            SECTION_SOURCES.inc(section='collaborative', source='fallback')
             return self.get_recommendation_fallbacks(user_id, limit)
             
         except Exception as e:
             logger.error(f"Error retrieving collaborative recommendations: {e}")
+            SECTION_SOURCES.inc(section='collaborative', source='error')
             return random.sample(self.sample_movies, min(limit, len(self.sample_movies)))
     
+    def get_als_recommendations(self, user_id, limit=20, offset=0):
+        """Get recommendations ranked by the ALS model, excluding titles the user has rated"""
+        user_ratings = self.get_user_ratings(user_id)
+        # The trained vector is out of date once the user has rated something since training
+        trained_user = None if str(user_id) in self._als_stale_users else user_id
+        return [format_show_id(show_id) for show_id in
+                self.als_model.recommend(user_ratings, limit, offset, user_id=trained_user)]
+
     def get_strict_collaborative_recommendations(self, user_id, limit=20, offset=0):
         """Get strict collaborative filtering recommendations (users with very similar ratings)"""
-        if not self.conn:
+        if self.neighbor_table is not None:
+            # Sum the precomputed neighbor lists of the user's rated titles
+            user_ratings = self.get_user_ratings(user_id)
+            return [format_show_id(show_id) for show_id in
+                    self.neighbor_table.recommend(user_ratings, limit, offset)]
+        if self.ratings_store is not None:
+            return [format_show_id(show_id) for show_id in
+                    self.ratings_store.strict_collaborative(user_id, limit, offset)]
+        if not self.pool:
             return []
             
         try:
-            cursor = self.conn.cursor()
-            # Rewritten strict collaborative filtering query to avoid ORDER BY in CTE
-            strict_query = """
-            SELECT show_id
-            FROM (
-                SELECT r2.show_id, COUNT(*) as similarity_count
-                FROM movies_ratings r1
-                JOIN movies_ratings r2 ON r1.user_id != r2.user_id 
-                    AND r1.show_id = r2.show_id 
-                    AND ABS(r1.rating - r2.rating) <= 1
-                    AND r2.rating >= 3.5
-                WHERE r1.user_id = ?
-                    AND r2.show_id NOT IN (
-                        SELECT show_id FROM movies_ratings WHERE user_id = ?
-                    )
-                GROUP BY r2.show_id
-            ) as recs
-            ORDER BY similarity_count DESC
-            OFFSET ? ROWS
-            FETCH NEXT ? ROWS ONLY
-            """
-            cursor.execute(strict_query, (user_id, user_id, offset, limit))
-            
-            # Ensure all IDs are in the 's' prefix format
-            collaborative = []
-            for row in cursor.fetchall():
-                show_id = row.show_id
-                if not show_id.startswith('s'):
-                    if show_id.startswith('tt'):
-                        show_id = f"s{show_id[2:]}"
-                    else:
-                        show_id = f"s{show_id}"
-                collaborative.append(show_id)
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                # Rewritten strict collaborative filtering query to avoid ORDER BY in CTE
+                strict_query = """
+                SELECT show_id
+                FROM (
+                    SELECT r2.show_id, COUNT(*) as similarity_count
+                    FROM movies_ratings r1
+                    JOIN movies_ratings r2 ON r1.user_id != r2.user_id 
+                        AND r1.show_id = r2.show_id 
+                        AND ABS(r1.rating - r2.rating) <= 1
+                        AND r2.rating >= 3.5
+                    WHERE r1.user_id = ?
+                        AND r2.show_id NOT IN (
+                            SELECT show_id FROM movies_ratings WHERE user_id = ?
+                        )
+                    GROUP BY r2.show_id
+                ) as recs
+                ORDER BY similarity_count DESC
+                OFFSET ? ROWS
+                FETCH NEXT ? ROWS ONLY
+                """
+                cursor.execute(strict_query, (user_id, user_id, offset, limit))
+            
+                # Ensure all IDs are in the 's' prefix format
+                collaborative = []
+                for row in cursor.fetchall():
+                    show_id = row.show_id
+                    if not show_id.startswith('s'):
+                        if show_id.startswith('tt'):
+                            show_id = f"s{show_id[2:]}"
+                        else:
+                            show_id = f"s{show_id}"
+                    collaborative.append(show_id)
             
-            cursor.close()
+                cursor.close()
             return collaborative
         except Exception as e:
             logger.error(f"Error retrieving strict collaborative recommendations: {e}")
@@ -311,76 +827,83 @@ class NotebookRecommendationService:
     
     def get_extended_collaborative_recommendations(self, user_id, limit=20, offset=0, tier=1):
         """Get extended collaborative recommendations using progressively relaxed criteria"""
-        if not self.conn:
+        if not self.pool and self.ratings_store is None:
             return []
             
         try:
-            cursor = self.conn.cursor()
-            
             # Calculate offset within the relaxed tier (resetting for each tier)
             tier_offset = max(0, offset - (tier * 40))
             
             # Get the user's rated genres to find similar movies
             user_genres = self.get_user_preferred_genres(user_id)
             
-            # Generate the genre conditions dynamically based on user preferences
-            genre_conditions = ""
-            if user_genres and len(user_genres) > 0:
-                genre_clauses = []
-                for genre in user_genres:
-                    genre_clauses.append(f"m2.[{genre}] > 0")
-                genre_conditions = "AND (" + " OR ".join(genre_clauses) + ")"
-            else:
-                # Fallback if no user genres found
-                genre_conditions = "AND (m2.[Action] > 0 OR m2.[Comedies] > 0 OR m2.[Dramas] > 0)"
-            
             # Relaxed parameters for different tiers
             rating_difference = 1 + (tier * 0.5)  # 1, 1.5, 2, 2.5
             min_rating = max(2.5, 4 - (tier * 0.5))  # 4, 3.5, 3, 2.5
             
-            # Completely rewritten query to avoid nested subqueries and ORDER BY issues
-            # First get the user's rated movies and their details in a temporary table
-            user_rated_query = f"""
-            -- First, get a subset of movies rated by the user
-            SELECT TOP 50 m1.show_id, r1.rating, m1.Action, m1.Comedies, m1.Dramas, m1.Thrillers, m1.HorrorMovies
-            INTO #user_rated_movies
-            FROM movies_ratings r1
-            JOIN movies_titles m1 ON r1.show_id = m1.show_id
-            WHERE r1.user_id = ? AND r1.rating >= {min_rating}
-            ORDER BY r1.rating DESC;
-
-            -- Get the movies that match the user's preferred genres
-            SELECT TOP {limit + offset} m2.show_id,
-                AVG(CAST(m2.Action + m2.Comedies + m2.Dramas + m2.Thrillers + m2.HorrorMovies AS FLOAT) *
-                    (1 - ABS(ur.rating - {min_rating})/5)) as genre_similarity_score
-            FROM #user_rated_movies ur
-            JOIN movies_titles m2 ON m2.show_id != ur.show_id
-                {genre_conditions}
-            WHERE m2.show_id NOT IN (
-                SELECT show_id FROM movies_ratings WHERE user_id = ?
-            )
-            GROUP BY m2.show_id
-            ORDER BY genre_similarity_score DESC
-            OFFSET ? ROWS FETCH NEXT ? ROWS ONLY;
-            
-            -- Drop the temporary table
-            DROP TABLE #user_rated_movies;
-            """
-            
-            cursor.execute(user_rated_query, (user_id, user_id, tier_offset, limit))
-            
-            # Ensure all IDs are in the 's' prefix format
-            extended = []
-            for row in cursor.fetchall():
-                show_id = row.show_id
-                if not show_id.startswith('s'):
-                    if show_id.startswith('tt'):
-                        show_id = f"s{show_id[2:]}"
-                    else:
-                        show_id = f"s{show_id}"
-                extended.append(show_id)
+            if self.ratings_store is not None:
+                return [format_show_id(show_id) for show_id in self.ratings_store.extended_collaborative(
+                    user_id, user_genres or ["Action", "Comedies", "Dramas"], EXTENDED_SCORE_COLUMNS,
+                    limit, tier_offset, min_rating=min_rating
+                )]
+            
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+            
+                # Generate the genre conditions dynamically based on user preferences
+                genre_conditions = ""
+                if user_genres and len(user_genres) > 0:
+                    genre_clauses = []
+                    for genre in user_genres:
+                        genre_clauses.append(f"m2.[{genre}] > 0")
+                    genre_conditions = "AND (" + " OR ".join(genre_clauses) + ")"
+                else:
+                    # Fallback if no user genres found
+                    genre_conditions = "AND (m2.[Action] > 0 OR m2.[Comedies] > 0 OR m2.[Dramas] > 0)"
+            
+                # Completely rewritten query to avoid nested subqueries and ORDER BY issues
+                # First get the user's rated movies and their details in a temporary table
+                user_rated_query = f"""
+                -- First, get a subset of movies rated by the user
+                SELECT TOP 50 m1.show_id, r1.rating, m1.Action, m1.Comedies, m1.Dramas, m1.Thrillers, m1.HorrorMovies
+                INTO #user_rated_movies
+                FROM movies_ratings r1
+                JOIN movies_titles m1 ON r1.show_id = m1.show_id
+                WHERE r1.user_id = ? AND r1.rating >= {min_rating}
+                ORDER BY r1.rating DESC;
+
+                -- Get the movies that match the user's preferred genres
+                SELECT TOP {limit + offset} m2.show_id,
+                    AVG(CAST(m2.Action + m2.Comedies + m2.Dramas + m2.Thrillers + m2.HorrorMovies AS FLOAT) *
+                        (1 - ABS(ur.rating - {min_rating})/5)) as genre_similarity_score
+                FROM #user_rated_movies ur
+                JOIN movies_titles m2 ON m2.show_id != ur.show_id
+                    {genre_conditions}
+                WHERE m2.show_id NOT IN (
+                    SELECT show_id FROM movies_ratings WHERE user_id = ?
+                )
+                GROUP BY m2.show_id
+                ORDER BY genre_similarity_score DESC
+                OFFSET ? ROWS FETCH NEXT ? ROWS ONLY;
+            
+                -- Drop the temporary table
+                DROP TABLE #user_rated_movies;
+                """
+            
+                cursor.execute(user_rated_query, (user_id, user_id, tier_offset, limit))
+            
+                # Ensure all IDs are in the 's' prefix format
+                extended = []
+                for row in cursor.fetchall():
+                    show_id = row.show_id
+                    if not show_id.startswith('s'):
+                        if show_id.startswith('tt'):
+                            show_id = f"s{show_id[2:]}"
+                        else:
+                            show_id = f"s{show_id}"
+                    extended.append(show_id)
             
-            cursor.close()
+                cursor.close()
             return extended
         except Exception as e:
             logger.error(f"Error retrieving extended collaborative recommendations: {e}")
@@ -388,30 +911,33 @@ class NotebookRecommendationService:
     
     def get_user_preferred_genres(self, user_id):
         """Get a user's preferred genres based on their highly-rated movies"""
-        if not self.conn:
+        if self.ratings_store is not None:
+            return self.ratings_store.preferred_genres(user_id, CATALOG_GENRE_COLUMNS)
+        if not self.pool:
             return self.genres[:3]
             
         try:
-            cursor = self.conn.cursor()
-            
-            # Find genres for movies the user has rated highly
-            query = """
-            SELECT 
-                SUM(m.Action) as Action, 
-                SUM(m.Adventure) as Adventure,
-                SUM(m.Comedies) as Comedies, 
-                SUM(m.Dramas) as Dramas,
-                SUM(m.HorrorMovies) as HorrorMovies, 
-                SUM(m.Thrillers) as Thrillers,
-                SUM(m.Documentaries) as Documentaries
-            FROM movies_ratings r
-            JOIN movies_titles m ON r.show_id = m.show_id
-            WHERE r.user_id = ? AND r.rating >= 3.5
-            """
-            
-            cursor.execute(query, (user_id,))
-            row = cursor.fetchone()
-            cursor.close()
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+            
+                # Find genres for movies the user has rated highly
+                query = """
+                SELECT 
+                    SUM(m.Action) as Action, 
+                    SUM(m.Adventure) as Adventure,
+                    SUM(m.Comedies) as Comedies, 
+                    SUM(m.Dramas) as Dramas,
+                    SUM(m.HorrorMovies) as HorrorMovies, 
+                    SUM(m.Thrillers) as Thrillers,
+                    SUM(m.Documentaries) as Documentaries
+                FROM movies_ratings r
+                JOIN movies_titles m ON r.show_id = m.show_id
+                WHERE r.user_id = ? AND r.rating >= 3.5
+                """
+            
+                cursor.execute(query, (user_id,))
+                row = cursor.fetchone()
+                cursor.close()
             
             if not row:
                 return []
@@ -503,95 +1029,119 @@ class NotebookRecommendationService:
     
     def get_content_based_recommendations(self, user_id, limit=20, offset=0):
         """Get content-based recommendations for a user with pagination"""
-        if not self.conn:
+        if not self.pool:
             # If no database connection, return sample movies
             return random.sample(self.sample_movies, min(limit, len(self.sample_movies)))
             
         try:
-            cursor = self.conn.cursor()
-            # Find movies similar to ones the user has rated highly
-            # This is a simplified content-based approach
-            query = """
-            SELECT m2.show_id
-            FROM movies_ratings r
-            JOIN movies_titles m1 ON r.show_id = m1.show_id
-            JOIN movies_titles m2 ON m1.show_id != m2.show_id
-                AND (
-                    (m1.Action > 0 AND m2.Action > 0) OR
-                    (m1.Comedies > 0 AND m2.Comedies > 0) OR
-                    (m1.Dramas > 0 AND m2.Dramas > 0) OR
-                    (m1.Thrillers > 0 AND m2.Thrillers > 0)
-                )
-            WHERE r.user_id = ? AND r.rating >= 4
-                AND m2.show_id NOT IN (
-                    SELECT show_id FROM movies_ratings WHERE user_id = ?
-                )
-            GROUP BY m2.show_id
-            ORDER BY COUNT(*) DESC
-            OFFSET ? ROWS
-            FETCH NEXT ? ROWS ONLY
-            """
-            cursor.execute(query, (user_id, user_id, offset, limit))
-            
-            # Ensure all IDs are in the 's' prefix format
-            content_based = []
-            for row in cursor.fetchall():
-                # Get the ID and ensure it's in the correct format (starting with 's')
-                show_id = row.show_id
-                if not show_id.startswith('s'):
-                    # If it's a TMDB ID (starts with 'tt'), extract the numeric part
-                    if show_id.startswith('tt'):
-                        show_id = f"s{show_id[2:]}"
-                    else:
-                        # For any other format, just ensure it has 's' prefix
-                        show_id = f"s{show_id}"
-                content_based.append(show_id)
+            if self.ratings_store is not None:
+                content_based = [format_show_id(show_id) for show_id in self.ratings_store.content_based(
+                    user_id, CONTENT_GENRE_COLUMNS, limit, offset
+                )]
+                if not content_based:
+                    logger.info(f"No content-based recommendations found for user {user_id}, using top rated movies")
+                    SECTION_SOURCES.inc(section='contentBased', source='top_rated')
+                    return self.get_top_rated_movies(limit)
+                logger.info(f"Retrieved {len(content_based)} content-based recommendations for user {user_id} from memory")
+                SECTION_SOURCES.inc(section='contentBased', source='memory')
+                return content_based
+
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                # Find movies similar to ones the user has rated highly
+                # This is a simplified content-based approach
+                query = """
+                SELECT m2.show_id
+                FROM movies_ratings r
+                JOIN movies_titles m1 ON r.show_id = m1.show_id
+                JOIN movies_titles m2 ON m1.show_id != m2.show_id
+                    AND (
+                        (m1.Action > 0 AND m2.Action > 0) OR
+                        (m1.Comedies > 0 AND m2.Comedies > 0) OR
+                        (m1.Dramas > 0 AND m2.Dramas > 0) OR
+                        (m1.Thrillers > 0 AND m2.Thrillers > 0)
+                    )
+                WHERE r.user_id = ? AND r.rating >= 4
+                    AND m2.show_id NOT IN (
+                        SELECT show_id FROM movies_ratings WHERE user_id = ?
+                    )
+                GROUP BY m2.show_id
+                ORDER BY COUNT(*) DESC
+                OFFSET ? ROWS
+                FETCH NEXT ? ROWS ONLY
+                """
+                cursor.execute(query, (user_id, user_id, offset, limit))
+            
+                # Ensure all IDs are in the 's' prefix format
+                content_based = []
+                for row in cursor.fetchall():
+                    # Get the ID and ensure it's in the correct format (starting with 's')
+                    show_id = row.show_id
+                    if not show_id.startswith('s'):
+                        # If it's a TMDB ID (starts with 'tt'), extract the numeric part
+                        if show_id.startswith('tt'):
+                            show_id = f"s{show_id[2:]}"
+                        else:
+                            # For any other format, just ensure it has 's' prefix
+                            show_id = f"s{show_id}"
+                    content_based.append(show_id)
             
-            cursor.close()
+                cursor.close()
             
             if not content_based:
                 # Fallback if no content-based recommendations found
                 logger.info(f"No content-based recommendations found for user {user_id}, using top rated movies")
+                SECTION_SOURCES.inc(section='contentBased', source='top_rated')
                 return self.get_top_rated_movies(limit)
                 
             logger.info(f"Retrieved {len(content_based)} content-based recommendations for user {user_id}")
+            SECTION_SOURCES.inc(section='contentBased', source='sql')
             return content_based
         except Exception as e:
             logger.error(f"Error retrieving content-based recommendations: {e}")
+            SECTION_SOURCES.inc(section='contentBased', source='error')
             return random.sample(self.sample_movies, min(limit, len(self.sample_movies)))
     
     def get_popular_movies(self, limit=10):
         """Get popular movies based on rating count and average rating"""
-        if not self.conn:
+        if not self.pool:
             # If no database connection, return sample movies
             return random.sample(self.sample_movies, min(limit, len(self.sample_movies)))
             
         try:
-            cursor = self.conn.cursor()
-            query = """
-            SELECT TOP (?) show_id
-            FROM movies_ratings
-            GROUP BY show_id
-            HAVING AVG(CAST(rating AS FLOAT)) >= 3.5 -- Only include well-rated movies
-            ORDER BY COUNT(*) DESC
-            """
-            cursor.execute(query, (limit,))
-            
-            # Ensure all IDs are in the 's' prefix format
-            popular = []
-            for row in cursor.fetchall():
-                # Get the ID and ensure it's in the correct format (starting with 's')
-                show_id = row.show_id
-                if not show_id.startswith('s'):
-                    # If it's a TMDB ID (starts with 'tt'), extract the numeric part
-                    if show_id.startswith('tt'):
-                        show_id = f"s{show_id[2:]}"
-                    else:
-                        # For any other format, just ensure it has 's' prefix
-                        show_id = f"s{show_id}"
-                popular.append(show_id)
+            if self.leaderboards is not None:
+                popular = [format_show_id(show_id) for show_id in self.leaderboards.slice(POPULAR, limit)]
+                if not popular:
+                    return random.sample(self.get_movie_ids(), min(limit, len(self.sample_movies)))
+                logger.info(f"Retrieved {len(popular)} popular movies from leaderboard")
+                return popular
+
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                query = """
+                SELECT TOP (?) show_id
+                FROM movies_ratings
+                GROUP BY show_id
+                HAVING AVG(CAST(rating AS FLOAT)) >= 3.5 -- Only include well-rated movies
+                ORDER BY COUNT(*) DESC
+                """
+                cursor.execute(query, (limit,))
+            
+                # Ensure all IDs are in the 's' prefix format
+                popular = []
+                for row in cursor.fetchall():
+                    # Get the ID and ensure it's in the correct format (starting with 's')
+                    show_id = row.show_id
+                    if not show_id.startswith('s'):
+                        # If it's a TMDB ID (starts with 'tt'), extract the numeric part
+                        if show_id.startswith('tt'):
+                            show_id = f"s{show_id[2:]}"
+                        else:
+                            # For any other format, just ensure it has 's' prefix
+                            show_id = f"s{show_id}"
+                    popular.append(show_id)
             
-            cursor.close()
+                cursor.close()
             
             if not popular:
                 # Fallback if no popular movies found
@@ -605,36 +1155,44 @@ class NotebookRecommendationService:
     
     def get_top_rated_movies(self, limit=10):
         """Get top rated movies based on average rating"""
-        if not self.conn:
+        if not self.pool:
             # If no database connection, return sample movies
             return random.sample(self.sample_movies, min(limit, len(self.sample_movies)))
             
         try:
-            cursor = self.conn.cursor()
-            query = """
-            SELECT TOP (?) show_id
-            FROM movies_ratings
-            GROUP BY show_id
-            HAVING COUNT(*) >= 3
-            ORDER BY AVG(CAST(rating AS FLOAT)) DESC
-            """
-            cursor.execute(query, (limit,))
-            
-            # Ensure all IDs are in the 's' prefix format
-            top_rated = []
-            for row in cursor.fetchall():
-                # Get the ID and ensure it's in the correct format (starting with 's')
-                show_id = row.show_id
-                if not show_id.startswith('s'):
-                    # If it's a TMDB ID (starts with 'tt'), extract the numeric part
-                    if show_id.startswith('tt'):
-                        show_id = f"s{show_id[2:]}"
-                    else:
-                        # For any other format, just ensure it has 's' prefix
-                        show_id = f"s{show_id}"
-                top_rated.append(show_id)
+            if self.leaderboards is not None:
+                top_rated = [format_show_id(show_id) for show_id in self.leaderboards.slice(TOP_RATED, limit)]
+                if not top_rated:
+                    return random.sample(self.get_movie_ids(), min(limit, len(self.sample_movies)))
+                logger.info(f"Retrieved {len(top_rated)} top rated movies from leaderboard")
+                return top_rated
+
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                query = """
+                SELECT TOP (?) show_id
+                FROM movies_ratings
+                GROUP BY show_id
+                HAVING COUNT(*) >= 3
+                ORDER BY AVG(CAST(rating AS FLOAT)) DESC
+                """
+                cursor.execute(query, (limit,))
+            
+                # Ensure all IDs are in the 's' prefix format
+                top_rated = []
+                for row in cursor.fetchall():
+                    # Get the ID and ensure it's in the correct format (starting with 's')
+                    show_id = row.show_id
+                    if not show_id.startswith('s'):
+                        # If it's a TMDB ID (starts with 'tt'), extract the numeric part
+                        if show_id.startswith('tt'):
+                            show_id = f"s{show_id[2:]}"
+                        else:
+                            # For any other format, just ensure it has 's' prefix
+                            show_id = f"s{show_id}"
+                    top_rated.append(show_id)
             
-            cursor.close()
+                cursor.close()
             
             if not top_rated:
                 # Fallback if no top rated movies found
@@ -648,7 +1206,7 @@ class NotebookRecommendationService:
     
     def get_available_genres(self):
         """Get available genres from database"""
-        if not self.conn:
+        if not self.pool:
             # If no database connection, return sample genres
             return self.genres
             
@@ -658,10 +1216,77 @@ class NotebookRecommendationService:
             "HorrorMovies", "Thrillers", "Documentaries"
         ]
     
+    def data_version(self):
+        """
+        Version of the shared data behind every user's recommendations.
+
+        Made of the ratings snapshot's contents and the build times of the
+        neighbor table and ALS model, which travel with their files. Every
+        process serving the same data reports the same version, and processes
+        whose data differs report different ones.
+        """
+        store = self.ratings_store
+        table = self.neighbor_table
+        model = self.als_model if self.collaborative_engine == 'als' else None
+        return "-".join([
+            store.version if store is not None else "sql",
+            f"{table.built_at:.6f}" if table is not None else "none",
+            f"{model.built_at:.6f}" if model is not None else "none",
+        ])
+
+    def version_epoch(self):
+        """Number of the current etag_max_age window (0 when versions never roll over)"""
+        return int(time.time() // self.etag_max_age) if self.etag_max_age > 0 else 0
+
+    def response_version(self, user_id):
+        """
+        Version of the data a user's recommendations are computed from.
+
+        Built from data_version() and the time of the user's latest rating
+        (from the ratings store, or movies_ratings.timestamp in SQL mode)
+        rather than anything this process counts, so every process behind the
+        API versions the same data the same way. It also changes every
+        etag_max_age seconds. Read it before computing a response, so a rating
+        that lands mid-computation can only make the version newer than the
+        response.
+        """
+        return f"{self.data_version()}.{self.latest_rating_time(user_id):.6f}.{self.version_epoch()}"
+
+    def _genre_choice(self, user_id):
+        """
+        Random generator for picking a user's genre rows.
+
+        Seeded from the user, data_version() and version_epoch() so every
+        recomputation under the same ETag picks the same genres.
+        """
+        return random.Random(f"{user_id}.{self.data_version()}.{self.version_epoch()}")
+
+    def latest_rating_time(self, user_id):
+        """Return when a user last rated, in seconds since the epoch (0 if never)"""
+        if self.ratings_store is not None:
+            return self.ratings_store.latest_rating_time(user_id)
+        if not self.pool:
+            return 0.0
+
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT MAX([timestamp]) FROM movies_ratings WHERE user_id = ?", (user_id,))
+                row = cursor.fetchone()
+                cursor.close()
+            return row[0].timestamp() if row and row[0] else 0.0
+        except Exception as e:
+            logger.error(f"Error retrieving latest rating time for user {user_id}: {e}")
+            # Unknown, so don't let any earlier response count as current
+            return time.time()
+
     def generate_recommendations(self, user_id, page=0, limit=20):
         """
         Generate recommendations for a specific user with pagination.
         
+        Results are served from the per-user result cache when possible, and
+        concurrent misses for the same page share one computation.
+        
         Args:
             user_id (str): The user ID to generate recommendations for.
             page (int): The page number for pagination (default: 0).
@@ -670,43 +1295,43 @@ class NotebookRecommendationService:
         Returns:
             dict: A dictionary containing collaborative, content-based, and genre recommendations.
         """
+        key = (str(user_id), 'all', page, limit, self.model_version)
+        return self.result_cache.get_or_compute(
+            key, lambda: self.single_flight.do(key, lambda: self._generate_recommendations(user_id, page, limit)),
+            # Responses with fallback sections are not kept, so the next request retries them
+            cacheable=lambda result: not result.get("degradedSections")
+        )
+    
+    def _generate_recommendations(self, user_id, page=0, limit=20):
+        """Compute recommendations for a user, bypassing the result cache"""
         logger.info(f"Generating recommendations for user {user_id}, page {page}, limit {limit}")
         
         # Calculate offset based on page and limit for pagination
         offset = page * limit
         
+        # Sections that had to fall back (failed or timed out)
+        degraded = []
+        
         # Get recommendations from database if connection is available
-        if self.conn:
-            # Get collaborative filtering recommendations with proper pagination
-            collaborative = self.get_collaborative_recommendations(user_id, limit=limit, offset=offset)
-            logger.info(f"Found {len(collaborative)} collaborative recommendations with offset {offset}")
-            
-            # Validate movie IDs to ensure they exist in the database
-            collaborative = self.validate_movie_ids(collaborative)
-            logger.info(f"After validation: {len(collaborative)} collaborative recommendations remain")
-            
-            # Get content-based recommendations with proper pagination
-            content_based = self.get_content_based_recommendations(user_id, limit=limit, offset=offset)
-            logger.info(f"Found {len(content_based)} content-based recommendations with offset {offset}")
+        if self.pool:
+            available_genres = self.get_available_genres()
+            selected_genres = self._genre_choice(user_id).sample(available_genres, min(3, len(available_genres)))
             
-            # Validate movie IDs
-            content_based = self.validate_movie_ids(content_based)
-            logger.info(f"After validation: {len(content_based)} content-based recommendations remain")
+            # Every section is independent and checks out its own pooled connection
+            sections = {
+                "collaborative": lambda: self._collaborative_section(user_id, limit, offset),
+                "contentBased": lambda: self._content_based_section(user_id, limit, offset),
+            }
+            for genre in selected_genres:
+                sections[genre] = lambda genre=genre: self._genre_section(genre, limit, offset)
+            results, degraded = self._run_sections(user_id, sections, limit, offset)
             
-            # Get genre-based recommendations
+            collaborative = results["collaborative"]
+            content_based = results["contentBased"]
             genres_dict = {}
-            available_genres = self.get_available_genres()
-            selected_genres = random.sample(available_genres, min(3, len(available_genres)))
-            
             for genre in selected_genres:
-                # Get twice as many recommendations as needed to ensure we have enough after validation
-                genre_movies = self.get_genre_movies(genre, limit=20, offset=offset)
-                # Validate genre movie IDs
-                genre_movies = self.validate_movie_ids(genre_movies)
-                if genre_movies and len(genre_movies) > 0:  # Only add genres that have valid movies
-                    # Limit to requested number after validation
-                    genres_dict[genre] = genre_movies[:limit]
-                    logger.info(f"Genre {genre}: {len(genre_movies)} valid recommendations found")
+                if results[genre]:  # Only add genres that have valid movies
+                    genres_dict[genre] = results[genre]
                 else:
                     logger.warning(f"No valid movies found for genre {genre}")
             
@@ -734,64 +1359,176 @@ class NotebookRecommendationService:
         logger.info(f"Generated recommendations for {len(genres_dict)} genres")
         logger.info(f"Generated all recommendations for user {user_id}")
         
-        return {
+        recommendations = {
             "collaborative": collaborative,
             "contentBased": content_based,
             "genres": genres_dict
         }
+        if degraded:
+            recommendations["degradedSections"] = degraded
+        return recommendations
     
-    def generate_more_recommendations(self, user_id, section, page, limit=10):
+    def _collaborative_section(self, user_id, limit, offset):
+        """Collaborative filtering row of the home page, validated against the catalog"""
+        collaborative = self.get_collaborative_recommendations(user_id, limit=limit, offset=offset)
+        logger.info(f"Found {len(collaborative)} collaborative recommendations with offset {offset}")
+        
+        # Validate movie IDs to ensure they exist in the database
+        collaborative = self.validate_movie_ids(collaborative)
+        logger.info(f"After validation: {len(collaborative)} collaborative recommendations remain")
+        return collaborative
+
+    def _content_based_section(self, user_id, limit, offset):
+        """Content-based row of the home page, validated against the catalog"""
+        content_based = self.get_content_based_recommendations(user_id, limit=limit, offset=offset)
+        logger.info(f"Found {len(content_based)} content-based recommendations with offset {offset}")
+        
+        content_based = self.validate_movie_ids(content_based)
+        logger.info(f"After validation: {len(content_based)} content-based recommendations remain")
+        return content_based
+
+    def _genre_section(self, genre, limit, offset):
+        """One genre row of the home page, validated against the catalog"""
+        # Get twice as many recommendations as needed to ensure we have enough after validation
+        genre_movies = self.validate_movie_ids(self.get_genre_movies(genre, limit=20, offset=offset))
+        logger.info(f"Genre {genre}: {len(genre_movies)} valid recommendations found")
+        return genre_movies[:limit]
+
+    def _section_fallback(self, section, limit, offset):
+        """
+        Stand-in for a section that failed or timed out.
+
+        Only uses data already in memory (the popular leaderboard), so it can
+        never be slow itself. Genre rows are simply left out.
+        """
+        boards = self.leaderboards.boards if self.leaderboards is not None else None
+        if section not in ("collaborative", "contentBased") or not boards:
+            return []
+        return [format_show_id(show_id) for show_id in boards[POPULAR][offset:offset + limit]]
+
+    def _run_sections(self, user_id, sections, limit, offset):
+        """
+        Compute the sections of a recommendations response.
+
+        In concurrent mode all sections are submitted to the section executor at
+        once. Each section gets section_timeout seconds from when a worker picks
+        it up, so time spent queued behind other requests' sections does not
+        count against it; a section still running after that (or that raised)
+        is replaced by its fallback.
+
+        Args:
+            user_id (str): The user the sections are for (for logging).
+            sections (dict): Section name -> callable producing its show IDs.
+            limit (int): Page size, used by fallbacks.
+            offset (int): Page offset, used by fallbacks.
+
+        Returns:
+            tuple: (section name -> list of show IDs, names of sections that fell back)
+        """
+        results = {}
+        degraded = []
+        if not self.concurrent_sections:
+            for section, compute in sections.items():
+                try:
+                    results[section] = compute()
+                except Exception as e:
+                    logger.error(f"Error computing {section} section for user {user_id}: {e}")
+                    results[section] = self._section_fallback(section, limit, offset)
+                    degraded.append(section)
+                    SECTION_FALLBACKS.inc(section=section, reason='error')
+            return results, degraded
+        
+        started = {section: threading.Event() for section in sections}
+        started_at = {}
+
+        def run(section, compute):
+            started_at[section] = time.monotonic()
+            started[section].set()
+            return compute()
+
+        futures = {}
+        for section, compute in sections.items():
+            futures[section] = self.section_executor.submit(run, section, compute)
+            # Also wakes the waiter below if the executor drops the section unstarted
+            futures[section].add_done_callback(lambda future, event=started[section]: event.set())
+        for section, future in futures.items():
+            started[section].wait()
+            deadline = started_at.get(section, time.monotonic()) + self.section_timeout
+            wait([future], timeout=max(deadline - time.monotonic(), 0))
+            if not future.done():
+                # The worker keeps running until its query returns, but nobody waits for it
+                logger.warning(f"{section} section for user {user_id} timed out after {self.section_timeout}s, using fallback")
+                results[section] = self._section_fallback(section, limit, offset)
+                degraded.append(section)
+                SECTION_FALLBACKS.inc(section=section, reason='timeout')
+                continue
+            try:
+                results[section] = future.result()
+            except Exception as e:
+                logger.error(f"Error computing {section} section for user {user_id}: {e}")
+                results[section] = self._section_fallback(section, limit, offset)
+                degraded.append(section)
+                SECTION_FALLBACKS.inc(section=section, reason='error')
+        return results, degraded
+
+    def _collaborative_candidates(self, user_id, depth):
+        """Rank up to `depth` valid collaborative candidates across every tier, then fallbacks"""
+        candidates = []
+        # Walk the tiers the same way paging through get_collaborative_recommendations would
+        for offset in range(0, depth, 40):
+            candidates.extend(self.get_collaborative_recommendations(user_id, limit=min(40, depth - offset), offset=offset))
+        candidates.extend(self.get_recommendation_fallbacks(user_id, depth))
+        return self.validate_movie_ids(list(dict.fromkeys(candidates)))[:depth]
+
+    def _content_based_candidates(self, user_id, depth):
+        """Rank up to `depth` valid content-based candidates"""
+        return self.validate_movie_ids(self.get_content_based_recommendations(user_id, limit=depth, offset=0))
+
+    def _genre_candidates(self, genre, depth):
+        """Rank up to `depth` valid candidates for a genre"""
+        return self.validate_movie_ids(self.get_genre_movies(genre, limit=depth, offset=0))
+
+    def generate_more_recommendations(self, user_id, section, page, limit=10, cursor=None):
         """
         Generate more recommendations for a specific section with pagination.
         
+        With a database connection, pages are slices of a server-held ranked
+        list per (user, section), so deep pages cost the same as the first one
+        and never repeat a title.
+        
         Args:
             user_id (str): The user ID to generate recommendations for.
             section (str): The section to generate recommendations for ('collaborative', 'contentBased', or genre name).
-            page (int): The page number for pagination.
+            page (int): The page number for pagination (ignored when a cursor is given).
             limit (int): The number of items per page.
+            cursor (str): Opaque cursor returned with the previous page.
             
         Returns:
-            dict: A dictionary containing the requested recommendations.
+            dict: A dictionary containing the requested recommendations and the
+                cursor for the next page.
         """
+        key = (str(user_id), 'more', section, page, limit, cursor, self.model_version)
+        return self.single_flight.do(
+            key, lambda: self._generate_more_recommendations(user_id, section, page, limit, cursor)
+        )
+
+    def _generate_more_recommendations(self, user_id, section, page, limit=10, cursor=None):
+        """Compute a page of one section, without coalescing"""
         logger.info(f"Generating more recommendations for user {user_id}, section {section}, page {page}")
         
         # Calculate the offset based on page and limit
         offset = page * limit
-        
-        # For tracking already returned recommendations to avoid duplicates
-        already_recommended = set()
+        next_cursor = None
         
         # Generate the appropriate recommendations based on section
         if section == 'collaborative':
             # Get collaborative filtering recommendations with offset
-            if self.conn:
-                # Request more recommendations than needed to ensure we have enough after validation
-                expanded_limit = limit * 3  # Increased to get more potential recommendations
-                
-                # Get both strict and extended recommendations
-                recommendations = []
-                
-                # Try strict collaborative first
-                strict_recs = self.get_collaborative_recommendations(user_id, limit=expanded_limit, offset=offset)
-                if strict_recs:
-                    recommendations.extend(strict_recs)
-                
-                # If we don't have enough, try some additional fallbacks
-                if len(recommendations) < limit:
-                    remaining = limit - len(recommendations)
-                    fallbacks = self.get_recommendation_fallbacks(user_id, remaining * 2)
-                    
-                    # Add fallbacks that aren't already in recommendations
-                    for movie_id in fallbacks:
-                        if movie_id not in recommendations and len(recommendations) < expanded_limit:
-                            recommendations.append(movie_id)
-                
-                # Validate the recommendations
-                recommendations = self.validate_movie_ids(recommendations)
-                logger.info(f"Returning {len(recommendations)} validated collaborative recommendations (requested {expanded_limit})")
-                
-                # Limit to the requested number after validation
-                recommendations = recommendations[:limit]
+            if self.pool:
+                recommendations, next_cursor = self.scroll_cursors.page(
+                    user_id, section, lambda depth: self._collaborative_candidates(user_id, depth),
+                    limit, offset, cursor
+                )
+                logger.info(f"Returning {len(recommendations)} collaborative recommendations from scroll list")
             else:
                 # Deterministic random sampling for consistent results
                 random.seed(int(user_id) if user_id.isdigit() else sum(ord(c) for c in user_id))
@@ -805,19 +1542,16 @@ class NotebookRecommendationService:
                     # Wrap around if we reach the end
                     recommendations += all_recommendations[:limit - len(recommendations)]
             
-            return {"collaborative": recommendations}
+            return {"collaborative": recommendations, "cursor": next_cursor}
             
         elif section == 'contentBased':
             # Get content-based recommendations with offset
-            if self.conn:
-                # Request more recommendations than needed to ensure we have enough after validation
-                expanded_limit = limit * 2
-                recommendations = self.get_content_based_recommendations(user_id, limit=expanded_limit, offset=offset)
-                # Validate the recommendations
-                recommendations = self.validate_movie_ids(recommendations)
-                logger.info(f"Returning {len(recommendations)} validated content-based recommendations (requested {expanded_limit})")
-                # Limit to the requested number after validation
-                recommendations = recommendations[:limit]
+            if self.pool:
+                recommendations, next_cursor = self.scroll_cursors.page(
+                    user_id, section, lambda depth: self._content_based_candidates(user_id, depth),
+                    limit, offset, cursor
+                )
+                logger.info(f"Returning {len(recommendations)} content-based recommendations from scroll list")
             else:
                 # Deterministic random sampling with different seed
                 random.seed((int(user_id) if user_id.isdigit() else sum(ord(c) for c in user_id)) + 100)
@@ -830,19 +1564,16 @@ class NotebookRecommendationService:
                 if len(recommendations) < limit:
                     recommendations += all_recommendations[:limit - len(recommendations)]
             
-            return {"contentBased": recommendations}
+            return {"contentBased": recommendations, "cursor": next_cursor}
             
         else:
             # Assume it's a genre
-            if self.conn:
-                # Request more recommendations than needed to ensure we have enough after validation
-                expanded_limit = limit * 2
-                recommendations = self.get_genre_movies(section, limit=expanded_limit, offset=offset)
-                # Validate the recommendations
-                recommendations = self.validate_movie_ids(recommendations)
-                logger.info(f"Returning {len(recommendations)} validated genre recommendations for {section} (requested {expanded_limit})")
-                # Limit to the requested number after validation
-                recommendations = recommendations[:limit]
+            if self.pool:
+                recommendations, next_cursor = self.scroll_cursors.page(
+                    user_id, section, lambda depth: self._genre_candidates(section, depth),
+                    limit, offset, cursor
+                )
+                logger.info(f"Returning {len(recommendations)} genre recommendations for {section} from scroll list")
             else:
                 # Deterministic random sampling with genre-specific seed
                 genre_seed = sum(ord(c) for c in section)
@@ -856,45 +1587,169 @@ class NotebookRecommendationService:
                 if len(recommendations) < limit:
                     recommendations += all_recommendations[:limit - len(recommendations)]
             
-            return {"genres": {section: recommendations}}
+            return {"genres": {section: recommendations}, "cursor": next_cursor}
     
-    def generate_all_recommendations(self):
+    def generate_batch_recommendations(self, user_ids, sections=BATCH_SECTIONS, page=0, limit=20):
         """
-        Generate recommendations for all sample users.
+        Generate recommendations for several users at once.
+
+        Work that does not depend on the user is shared: ratings are fetched
+        with one query, collaborative rows are scored for all users with one
+        matrix product when the ALS model or neighbor table is loaded, and
+        each genre row is computed once. Users without a batch-scored
+        collaborative row go through the usual tiers and fallbacks.
+
+        Args:
+            user_ids (list): The users to generate recommendations for.
+            sections (sequence): Which of BATCH_SECTIONS to include.
+            page (int): The page number for pagination (default: 0).
+            limit (int): The number of items per page (default: 20).
+
+        Returns:
+            dict: User ID -> recommendations dict with the requested sections.
+        """
+        user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+        logger.info(f"Generating batch recommendations for {len(user_ids)} users, sections {list(sections)}")
+        if not self.pool:
+            # Sample data is cheap and deterministic per user
+            return {
+                user_id: {section: recommendations[section] for section in sections}
+                for user_id, recommendations in
+                ((user_id, self.generate_recommendations(user_id, page, limit)) for user_id in user_ids)
+            }
+
+        offset = page * limit
+        results = {user_id: {} for user_id in user_ids}
+        if "collaborative" in sections:
+            collaborative = self._batch_collaborative(user_ids, limit, offset)
+            for user_id in user_ids:
+                results[user_id]["collaborative"] = self.validate_movie_ids(collaborative[user_id])
+        if "contentBased" in sections:
+            content_based = self._map_users(lambda user_id: self._content_based_section(user_id, limit, offset), user_ids)
+            for user_id, recommendations in zip(user_ids, content_based):
+                results[user_id]["contentBased"] = recommendations
+        if "genres" in sections:
+            available_genres = self.get_available_genres()
+            genre_rows = {}
+            for user_id in user_ids:
+                genres_dict = {}
+                for genre in self._genre_choice(user_id).sample(available_genres, min(3, len(available_genres))):
+                    if genre not in genre_rows:
+                        genre_rows[genre] = self._genre_section(genre, limit, offset)
+                    if genre_rows[genre]:
+                        genres_dict[genre] = genre_rows[genre]
+                results[user_id]["genres"] = genres_dict
+        return results
+
+    def _batch_collaborative(self, user_ids, limit, offset):
+        """Collaborative rows of several users, scored together where the engine allows it"""
+        scored = [[] for _ in user_ids]
+        # The neighbor table only stands in for the strict tier (the first 40 titles)
+        batch_model = self.als_model if self.collaborative_engine == 'als' else None
+        if batch_model is not None or (offset < 40 and self.neighbor_table is not None):
+            users_ratings = self.get_users_ratings(user_ids)
+            ratings = [users_ratings.get(user_id, {}) for user_id in user_ids]
+            try:
+                if batch_model is not None:
+                    trained_users = [None if user_id in self._als_stale_users else user_id for user_id in user_ids]
+                    scored = batch_model.recommend_many(ratings, limit, offset, trained_users)
+                else:
+                    scored = self.neighbor_table.recommend_many(ratings, limit, offset)
+            except Exception as e:
+                logger.error(f"Error scoring batch collaborative recommendations: {e}")
+
+        unscored = [user_id for user_id, show_ids in zip(user_ids, scored) if not show_ids]
+        fallbacks = dict(zip(unscored, self._map_users(
+            lambda user_id: self.get_collaborative_recommendations(user_id, limit, offset), unscored
+        )))
+        return {
+            user_id: [format_show_id(show_id) for show_id in show_ids] if show_ids else fallbacks[user_id]
+            for user_id, show_ids in zip(user_ids, scored)
+        }
+
+    def _map_users(self, compute, user_ids):
+        """Apply compute to every user, on the section executor in concurrent mode"""
+        if not self.concurrent_sections or len(user_ids) < 2:
+            return [compute(user_id) for user_id in user_ids]
+        return list(self.section_executor.map(compute, user_ids))
+
+    def get_all_user_ids(self):
+        """
+        Get the ID of every user.
         If database connection is available, gets real users from the database.
         Otherwise, falls back to sample users 500-600.
-        
-        Returns:
-            dict: A dictionary mapping user IDs to their recommendations.
         """
-        all_recommendations = {}
-        
-        if self.conn:
+        if self.pool:
             try:
-                # Get a list of user IDs from the database
-                cursor = self.conn.cursor()
-                cursor.execute("SELECT TOP 100 user_id FROM movies_users")
-                user_ids = [str(row.user_id) for row in cursor.fetchall()]
-                cursor.close()
+                user_ids = []
+                with self.pool.connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("SELECT user_id FROM movies_users ORDER BY user_id")
+                    while True:
+                        rows = cursor.fetchmany(10000)
+                        if not rows:
+                            break
+                        user_ids.extend(str(row.user_id) for row in rows)
+                    cursor.close()
                 
-                if not user_ids:
-                    # Fallback if no users found
-                    user_ids = [str(i) for i in range(500, 600)]
+                if user_ids:
+                    return user_ids
+                # Fallback if no users found
                 
             except Exception as e:
                 logger.error(f"Error retrieving user IDs: {e}")
                 # Fallback if error
-                user_ids = [str(i) for i in range(500, 600)]
-        else:
-            # Fallback if no database connection
-            user_ids = [str(i) for i in range(500, 600)]
         
+        # Fallback if no database connection
+        return [str(i) for i in range(500, 600)]
+
+    def generate_all_recommendations(self, workers=None, on_result=None, progress=None,
+                                     chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Generate recommendations for every user.
+        
+        With a database connection the users are spread over a pool of worker
+        processes (see batch_generation.py); with workers=1 or sample data they
+        are generated one after another in this process.
+        
+        Args:
+            workers (int): Worker processes (default: BATCH_WORKERS or the number of CPUs).
+            on_result (callable): Called as on_result(user_id, recommendations) as
+                results come in. When omitted, results are collected and returned.
+            progress (BatchProgress): Counters to update while generating.
+            chunk_size (int): Users per worker task.
+            
+        Returns:
+            dict: A dictionary mapping user IDs to their recommendations
+                (empty when on_result is given).
+        """
+        all_recommendations = {}
+        if on_result is None:
+            on_result = all_recommendations.__setitem__
+        if workers is None:
+            workers = int(os.getenv('BATCH_WORKERS', 0)) or os.cpu_count() or 1
+        
+        user_ids = self.get_all_user_ids()
+        
+        if self.pool and workers > 1:
+            generate_all(self, user_ids, on_result, workers=workers, chunk_size=chunk_size,
+                         progress=progress)
+            return all_recommendations
+        
+        if progress is not None:
+            progress.total = len(user_ids)
         # Generate recommendations for each user
         for user_id in user_ids:
             try:
                 logger.info(f"Generating all recommendations for user {user_id}")
-                all_recommendations[user_id] = self.generate_recommendations(user_id)
+                on_result(user_id, self.generate_recommendations(user_id))
+                if progress is not None:
+                    progress.add(1)
             except Exception as e:
                 logger.error(f"Error generating recommendations for user {user_id}: {str(e)}")
+                if progress is not None:
+                    progress.add(0, 1)
+        if progress is not None:
+            progress.finish()
         
         return all_recommendations
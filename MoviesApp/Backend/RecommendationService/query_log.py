@@ -0,0 +1,186 @@
+"""
+Query fingerprints and the slow-query log.
+
+Every statement run through an instrumented cursor (see metrics.py) is
+reduced to a fingerprint: comments are removed, literals and parameter
+lists are replaced with placeholders and whitespace is collapsed, so the
+same query with different values, page sizes or IN-list lengths is counted
+as one. Per fingerprint the log keeps call counts, total and maximum time,
+rows fetched and approximate bytes; statements slower than the threshold
+are logged (with their parameters only when log_params is on, since they
+hold user IDs and other request data). top() returns the most expensive
+fingerprints for the /admin/queries endpoint.
+"""
+
+import os
+import re
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger('recommendation_service')
+
+_COMMENTS = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+_STRINGS = re.compile(r"N?'(?:[^']|'')*'")
+_NUMBERS = re.compile(r'(?<![\w\]#@.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b')
+_IN_LISTS = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+# Rows sampled per fetch to estimate the bytes of a result
+_SAMPLE_ROWS = 50
+
+# Longest parameter text written to the slow-query log
+_MAX_PARAMS_LENGTH = 200
+
+SORT_KEYS = ('totalSeconds', 'maxSeconds', 'calls', 'rows', 'bytes')
+
+
+def normalize(sql):
+    """Return the statement with comments, literals and IN-list lengths removed"""
+    sql = _COMMENTS.sub(' ', sql)
+    sql = _STRINGS.sub('?', sql)
+    sql = _NUMBERS.sub('?', sql)
+    sql = _IN_LISTS.sub('IN (?...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    """Return (fingerprint ID, normalized statement)"""
+    normalized = normalize(sql)
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12], normalized
+
+
+def estimate_bytes(rows):
+    """Approximate the size of fetched rows from a sample of them"""
+    if not rows:
+        return 0
+    sample = rows[:_SAMPLE_ROWS]
+    size = 0
+    for row in sample:
+        for value in row:
+            size += len(value) if isinstance(value, (str, bytes)) else 8
+    return size * len(rows) // len(sample)
+
+
+class QueryLog:
+    """
+    Thread-safe per-fingerprint query statistics plus the slow-query log.
+    """
+
+    def __init__(self, slow_threshold=1.0, max_fingerprints=500, log_params=False):
+        """
+        Args:
+            slow_threshold (float): Statements taking longer than this many seconds
+                are logged (0 or less disables the log).
+            max_fingerprints (int): Fingerprints tracked; past this, the one with the
+                least total time is dropped to make room.
+            log_params (bool): Write the parameters of slow statements to the log;
+                otherwise only the normalized statement and the parameter count are logged.
+        """
+        self.slow_threshold = slow_threshold
+        self.max_fingerprints = max_fingerprints
+        self.log_params = log_params
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.slow_queries = 0
+
+    def record(self, sql, params, seconds, rows, size, method=None, failed=False):
+        """
+        Add one finished statement.
+
+        Args:
+            sql (str): The statement as executed.
+            params (tuple): Its parameters (only used for the slow-query log).
+            seconds (float): Time spent executing and fetching.
+            rows (int): Rows fetched.
+            size (int): Approximate bytes fetched.
+            method (str): Service method that ran it.
+            failed (bool): Whether execute raised.
+        """
+        fingerprint_id, normalized = fingerprint(sql)
+        with self._lock:
+            entry = self._entries.get(fingerprint_id)
+            if entry is None:
+                if len(self._entries) >= self.max_fingerprints:
+                    cheapest = min(self._entries, key=lambda key: self._entries[key]["totalSeconds"])
+                    del self._entries[cheapest]
+                entry = self._entries[fingerprint_id] = {
+                    "fingerprint": fingerprint_id,
+                    "statement": normalized,
+                    "methods": [],
+                    "calls": 0,
+                    "errors": 0,
+                    "totalSeconds": 0.0,
+                    "maxSeconds": 0.0,
+                    "rows": 0,
+                    "bytes": 0,
+                }
+            entry["calls"] += 1
+            entry["errors"] += int(failed)
+            entry["totalSeconds"] += seconds
+            entry["maxSeconds"] = max(entry["maxSeconds"], seconds)
+            entry["rows"] += rows
+            entry["bytes"] += size
+            if method and method not in entry["methods"]:
+                entry["methods"].append(method)
+            slow = 0 < self.slow_threshold <= seconds
+            if slow:
+                self.slow_queries += 1
+
+        if slow:
+            if self.log_params:
+                statement = _WHITESPACE.sub(' ', sql).strip()
+                params_text = repr(params)
+                if len(params_text) > _MAX_PARAMS_LENGTH:
+                    params_text = params_text[:_MAX_PARAMS_LENGTH] + '...'
+            else:
+                # The normalized statement has its literals replaced as well
+                statement = normalized
+                params_text = f"<{len(params) if params else 0} redacted>"
+            logger.warning(
+                f"Slow query [{fingerprint_id}] in {method or 'unknown'}: {seconds:.3f}s, {rows} rows, "
+                f"~{size} bytes: {statement} params={params_text}"
+            )
+
+    def top(self, n=20, sort='totalSeconds'):
+        """
+        Return the n most expensive fingerprints.
+
+        Args:
+            n (int): Number of fingerprints.
+            sort (str): One of SORT_KEYS.
+
+        Returns:
+            list: Fingerprint entries, each with its mean time.
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)}")
+        with self._lock:
+            entries = [dict(entry, methods=list(entry["methods"])) for entry in self._entries.values()]
+        entries.sort(key=lambda entry: entry[sort], reverse=True)
+        for entry in entries[:n]:
+            entry["meanSeconds"] = round(entry["totalSeconds"] / entry["calls"], 6)
+            entry["totalSeconds"] = round(entry["totalSeconds"], 6)
+            entry["maxSeconds"] = round(entry["maxSeconds"], 6)
+        return entries[:n]
+
+    def reset(self):
+        """Forget every fingerprint"""
+        with self._lock:
+            self._entries.clear()
+            self.slow_queries = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "fingerprints": len(self._entries),
+                "slowQueries": self.slow_queries,
+                "slowThresholdSeconds": self.slow_threshold,
+            }
+
+
+QUERY_LOG = QueryLog(
+    slow_threshold=float(os.getenv('SLOW_QUERY_SECONDS', 1.0)),
+    max_fingerprints=int(os.getenv('QUERY_LOG_SIZE', 500)),
+    log_params=os.getenv('SLOW_QUERY_LOG_PARAMS', 'false').lower() == 'true'
+)
@@ -0,0 +1,553 @@
+"""
+In-memory snapshot of movies_ratings used by the recommendation service
+when it runs with the "memory" engine.
+
+The snapshot is loaded once from SQL Server and kept as a user->items CSR
+matrix and an item->users CSC matrix (int32 indices, float32 ratings), plus
+the genre flags of movies_titles. Every query the service normally sends to
+the database is answered from these arrays instead.
+
+Ratings recorded after the snapshot was loaded are kept in a small overlay
+(see RatingsStore.apply_rating) that the queries merge in, so new ratings
+take effect immediately without rebuilding the matrices.
+"""
+
+import os
+import logging
+import threading
+import time
+
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger('recommendation_service')
+
+# Number of rows pulled per round trip while loading the snapshot
+FETCH_BATCH_SIZE = 50000
+
+# Ratings at or above this value count as a "like" in collaborative scoring
+LIKED_RATING = 3.5
+
+
+class RatingsStore:
+    """
+    Snapshot of the ratings table plus an overlay of newer ratings.
+
+    The bulk arrays are never modified: refreshing builds a new store and
+    swaps the reference, so readers never see a half-built snapshot. Single
+    ratings are added to the overlay by apply_rating(), which replaces whole
+    overlay entries so no locking is needed on the read path.
+    """
+
+    def __init__(self, user_ids, show_ids, values, catalog_ids=(), genre_values=None, genre_columns=(),
+                 rated_at=None):
+        """
+        Build the store from parallel rating arrays.
+
+        Args:
+            user_ids (sequence): User ID for each rating.
+            show_ids (sequence): Show ID for each rating.
+            values (sequence): Rating value for each rating.
+            catalog_ids (sequence): Show IDs present in movies_titles.
+            genre_values (array): len(catalog_ids) x len(genre_columns) genre flags.
+            genre_columns (sequence): Names of the genre columns in genre_values.
+            rated_at (sequence): Seconds since the epoch each rating was made (0 when unknown).
+        """
+        started = time.perf_counter()
+
+        user_keys = np.asarray([str(u) for u in user_ids], dtype=str)
+        rated_keys = np.asarray([str(s) for s in show_ids], dtype=str)
+        catalog_keys = np.asarray([str(s) for s in catalog_ids], dtype=str)
+
+        # Users are indexed by rating activity, items by catalog plus anything rated
+        self.user_keys, user_index = np.unique(user_keys, return_inverse=True)
+        self.item_keys, item_index = np.unique(
+            np.concatenate([catalog_keys, rated_keys]), return_inverse=True
+        )
+        self.user_lookup = {key: idx for idx, key in enumerate(self.user_keys.tolist())}
+        self.item_lookup = {key: idx for idx, key in enumerate(self.item_keys.tolist())}
+
+        self._build(user_index, item_index[len(catalog_keys):], values,
+                    item_index[:len(catalog_keys)], genre_values, genre_columns)
+        # Time of each user's latest rating, which versions their responses
+        self.user_rated_at = np.zeros(len(self.user_keys), dtype=np.float64)
+        if rated_at is not None:
+            np.maximum.at(self.user_rated_at, user_index, np.asarray(rated_at, dtype=np.float64))
+        logger.info(
+            f"Built ratings store with {self.csr.nnz} ratings, {len(self.user_keys)} users and "
+            f"{len(self.item_keys)} titles in {time.perf_counter() - started:.2f}s"
+        )
+
+    def _build(self, user_index, rated_index, values, catalog_index, genre_values, genre_columns):
+        """Build the matrices and aggregates from ratings already mapped to row/column indices"""
+        n_users = len(self.user_keys)
+        n_items = len(self.item_keys)
+
+        self.csr = sparse.csr_matrix(
+            (
+                np.asarray(values, dtype=np.float32),
+                (np.asarray(user_index, dtype=np.int32), np.asarray(rated_index, dtype=np.int32)),
+            ),
+            shape=(n_users, n_items),
+            dtype=np.float32,
+        )
+        self.csr.sort_indices()
+        self.csc = self.csr.tocsc()
+        self.csc.sort_indices()
+
+        # item->users indicator of likes, used to turn user weights into item scores
+        liked = self.csc.copy()
+        liked.data = (liked.data >= LIKED_RATING).astype(np.float32)
+        liked.eliminate_zeros()
+        self.liked_by_item = liked.T.tocsr()
+
+        # Per-item aggregates that replace GROUP BY show_id queries
+        self.item_counts = np.diff(self.csc.indptr).astype(np.int32)
+        self.item_sums = np.asarray(self.csc.sum(axis=0), dtype=np.float64).ravel()
+        self.item_means = np.divide(
+            self.item_sums, self.item_counts,
+            out=np.zeros(n_items, dtype=np.float64), where=self.item_counts > 0
+        )
+
+        # Titles that exist in movies_titles and their genre flags
+        self.in_catalog = np.zeros(n_items, dtype=bool)
+        self.in_catalog[catalog_index] = True
+        self.genre_columns = list(genre_columns)
+        self.genre_lookup = {name: idx for idx, name in enumerate(self.genre_columns)}
+        self.genre_matrix = np.zeros((n_items, len(self.genre_columns)), dtype=np.float32)
+        if genre_values is not None and len(catalog_index) > 0:
+            self.genre_matrix[catalog_index] = np.nan_to_num(
+                np.asarray(genre_values, dtype=np.float32)
+            )
+
+        # Ratings applied since the snapshot was built; users who first rate after
+        # loading get row indices past the end of csr
+        self.user_overlay = {}  # user row -> {item: rating}
+        self.item_overlay = {}  # item -> {user row: (rating, snapshot rating or None)}
+        self.rated_at_overlay = {}  # user row -> time of their latest overlay rating
+        # (user, title) pairs in the overlay, kept under _overlay_lock so readers
+        # never iterate item_overlay while apply_rating changes it
+        self._num_pending = 0
+        self._overlay_lock = threading.Lock()
+        self._version = None
+
+        self.loaded_at = time.time()
+
+    def save(self, path):
+        """
+        Write the snapshot, overlay ratings included, to an .npz file.
+
+        Used to hand the store to other processes (see batch_generation.py)
+        without reloading the ratings table; replaces any existing file atomically.
+        """
+        matrix = self.ratings_matrix().tocoo()
+        catalog = np.flatnonzero(self.in_catalog)
+        rated_at = np.zeros(self.num_users, dtype=np.float64)
+        rated_at[:len(self.user_rated_at)] = self.user_rated_at
+        for idx, when in list(self.rated_at_overlay.items()):
+            rated_at[idx] = when
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                user_keys=np.asarray(sorted(self.user_lookup, key=self.user_lookup.get), dtype=str),
+                item_keys=self.item_keys,
+                users=matrix.row.astype(np.int32),
+                items=matrix.col.astype(np.int32),
+                values=matrix.data,
+                catalog=catalog.astype(np.int32),
+                genre_values=self.genre_matrix[catalog],
+                genre_columns=np.asarray(self.genre_columns, dtype=str),
+                rated_at=rated_at,
+            )
+        os.replace(tmp_path, path)
+        logger.info(f"Saved ratings store to {path}")
+
+    @classmethod
+    def load(cls, path):
+        """Load a store written by save()"""
+        started = time.perf_counter()
+        store = cls.__new__(cls)
+        with np.load(path, allow_pickle=False) as data:
+            store.user_keys = data['user_keys']
+            store.item_keys = data['item_keys']
+            store.user_lookup = {key: idx for idx, key in enumerate(store.user_keys.tolist())}
+            store.item_lookup = {key: idx for idx, key in enumerate(store.item_keys.tolist())}
+            store._build(data['users'], data['items'], data['values'], data['catalog'],
+                         data['genre_values'], data['genre_columns'].tolist())
+            store.user_rated_at = data['rated_at']
+        logger.info(f"Loaded ratings store from {path} with {store.csr.nnz} ratings "
+                    f"in {time.perf_counter() - started:.2f}s")
+        return store
+
+    @classmethod
+    def from_connection(cls, conn, genre_columns=()):
+        """
+        Load the ratings table and catalog genre flags from the database.
+
+        Args:
+            conn: An open pyodbc connection.
+            genre_columns (sequence): Genre columns of movies_titles to load.
+
+        Returns:
+            RatingsStore: A freshly built snapshot.
+        """
+        cursor = conn.cursor()
+        try:
+            user_ids, show_ids, values, rated_at = [], [], [], []
+            cursor.execute("SELECT user_id, show_id, rating, [timestamp] FROM movies_ratings")
+            while True:
+                rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    user_ids.append(row[0])
+                    show_ids.append(row[1])
+                    values.append(row[2] or 0)
+                    rated_at.append(row[3].timestamp() if row[3] else 0.0)
+
+            # Genre names come from a fixed list of column names, never from user input
+            genre_select = ''.join(f", [{genre}]" for genre in genre_columns)
+            cursor.execute(f"SELECT show_id{genre_select} FROM movies_titles")
+            catalog_ids, genre_values = [], []
+            while True:
+                rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    catalog_ids.append(row[0])
+                    genre_values.append([value or 0 for value in row[1:]])
+        finally:
+            cursor.close()
+
+        genre_array = np.asarray(genre_values, dtype=np.float32).reshape(len(catalog_ids), len(genre_columns))
+        return cls(user_ids, show_ids, values, catalog_ids, genre_array, genre_columns, rated_at)
+
+    @property
+    def num_users(self):
+        return len(self.user_lookup)
+
+    @property
+    def num_items(self):
+        return self.csr.shape[1]
+
+    @property
+    def num_ratings(self):
+        return int(self.item_counts.sum())
+
+    @property
+    def num_pending(self):
+        """Number of (user, title) ratings held in the overlay"""
+        return self._num_pending
+
+    @property
+    def version(self):
+        """
+        Version of the snapshot's contents: its rating count and latest rating time.
+
+        Stores loaded from the same data get the same version in every process.
+        Overlay ratings are not included; they are versioned per user by
+        latest_rating_time().
+        """
+        if self._version is None:
+            latest = float(self.user_rated_at.max()) if len(self.user_rated_at) else 0.0
+            self._version = f"{self.csr.nnz}-{latest:.6f}"
+        return self._version
+
+    def stats(self):
+        """Return a summary of the snapshot for health and debugging output"""
+        return {
+            "users": int(self.num_users),
+            "titles": int(self.num_items),
+            "ratings": int(self.num_ratings),
+            "pendingRatings": int(self.num_pending),
+            "loadedAt": self.loaded_at,
+        }
+
+    # ------------------------------------------------------------------
+    # Low-level accessors
+    # ------------------------------------------------------------------
+
+    def user_index(self, user_id):
+        """Return the row index of a user, or None if the user has no ratings"""
+        return self.user_lookup.get(str(user_id))
+
+    def user_row(self, user_id):
+        """Return (item indices, ratings) for everything a user has rated"""
+        idx = self.user_index(user_id)
+        if idx is None:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        if idx < self.csr.shape[0]:
+            start, end = self.csr.indptr[idx], self.csr.indptr[idx + 1]
+            items, ratings = self.csr.indices[start:end], self.csr.data[start:end]
+        else:
+            items, ratings = np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        return self._merge(items, ratings, self.user_overlay.get(idx))
+
+    def item_column(self, item):
+        """Return (user indices, ratings) for everyone who rated an item"""
+        start, end = self.csc.indptr[item], self.csc.indptr[item + 1]
+        users, ratings = self.csc.indices[start:end], self.csc.data[start:end]
+        overlay = self.item_overlay.get(item)
+        if overlay:
+            overlay = {user: rating for user, (rating, _) in overlay.items()}
+        return self._merge(users, ratings, overlay)
+
+    @staticmethod
+    def _merge(indices, values, overlay):
+        """Replace/extend one snapshot row or column with its overlay entries"""
+        if not overlay:
+            return indices, values
+        extra = np.fromiter(overlay.keys(), dtype=np.int32, count=len(overlay))
+        keep = ~np.isin(indices, extra)
+        indices = np.concatenate([indices[keep], extra])
+        values = np.concatenate([values[keep], np.fromiter(overlay.values(), dtype=np.float32, count=len(overlay))])
+        order = np.argsort(indices, kind='stable')
+        return indices[order], values[order]
+
+    def apply_rating(self, user_id, show_id, rating):
+        """
+        Add or replace a single rating without rebuilding the snapshot.
+
+        Updates the user's row, the title's rating count/sum/mean and the
+        like indicator used by collaborative scoring, in O(user ratings).
+
+        Args:
+            user_id (str): The user who rated.
+            show_id (str): The rated title.
+            rating (float): The rating value.
+
+        Returns:
+            tuple: (applied, previous rating or None). applied is False when
+                the title is unknown to this snapshot.
+        """
+        item = self.item_lookup.get(str(show_id))
+        if item is None:
+            return False, None
+        rating = float(rating)
+
+        with self._overlay_lock:
+            idx = self.user_index(user_id)
+            if idx is None:
+                idx = len(self.user_lookup)
+                self.user_lookup[str(user_id)] = idx
+
+            items, ratings = self.user_row(user_id)
+            pos = np.searchsorted(items, item)
+            previous = float(ratings[pos]) if pos < len(items) and items[pos] == item else None
+            if previous == rating:
+                return True, previous
+
+            # Remember what the snapshot held so scoring can correct the like indicator
+            item_entries = dict(self.item_overlay.get(item, {}))
+            if idx in item_entries:
+                snapshot_rating = item_entries[idx][1]
+            elif idx < self.csr.shape[0]:
+                snapshot_rating = previous
+            else:
+                snapshot_rating = None
+            if idx not in item_entries:
+                self._num_pending += 1
+            item_entries[idx] = (rating, snapshot_rating)
+
+            user_entries = dict(self.user_overlay.get(idx, {}))
+            user_entries[item] = rating
+            self.user_overlay[idx] = user_entries
+            self.item_overlay[item] = item_entries
+            self.rated_at_overlay[idx] = time.time()
+
+            if previous is None:
+                self.item_counts[item] += 1
+                self.item_sums[item] += rating
+            else:
+                self.item_sums[item] += rating - previous
+            self.item_means[item] = self.item_sums[item] / self.item_counts[item]
+
+        return True, previous
+
+    def latest_rating_time(self, user_id):
+        """Return when a user last rated, in seconds since the epoch (0 if never or unknown)"""
+        idx = self.user_index(user_id)
+        if idx is None:
+            return 0.0
+        if idx in self.rated_at_overlay:
+            return self.rated_at_overlay[idx]
+        return float(self.user_rated_at[idx]) if idx < len(self.user_rated_at) else 0.0
+
+    def pending_ratings(self):
+        """Return [(user_id, show_id, rating)] for every rating in the overlay"""
+        with self._overlay_lock:
+            user_keys = {idx: key for key, idx in self.user_lookup.items()}
+            return [
+                (user_keys[idx], str(self.item_keys[item]), rating)
+                for item, entries in self.item_overlay.items()
+                for idx, (rating, _) in entries.items()
+            ]
+
+    def ratings_matrix(self):
+        """Return the users x titles CSR matrix including overlay ratings"""
+        if not self.item_overlay:
+            return self.csr
+        base = self.csr.tocoo()
+        users, items, values = [], [], []
+        for item, entries in list(self.item_overlay.items()):
+            for idx, (rating, _) in entries.items():
+                users.append(idx)
+                items.append(item)
+                values.append(rating)
+        replaced = set(zip(users, items))
+        keep = np.fromiter(
+            ((u, i) not in replaced for u, i in zip(base.row.tolist(), base.col.tolist())),
+            dtype=bool, count=base.nnz
+        )
+        matrix = sparse.csr_matrix(
+            (
+                np.concatenate([base.data[keep], np.asarray(values, dtype=np.float32)]),
+                (
+                    np.concatenate([base.row[keep], np.asarray(users, dtype=np.int32)]),
+                    np.concatenate([base.col[keep], np.asarray(items, dtype=np.int32)]),
+                ),
+            ),
+            shape=(self.num_users, self.num_items),
+            dtype=np.float32,
+        )
+        matrix.sort_indices()
+        return matrix
+
+    def user_ratings(self, user_id):
+        """Return a {show_id: rating} dict for a user"""
+        items, ratings = self.user_row(user_id)
+        return {str(self.item_keys[i]): float(r) for i, r in zip(items.tolist(), ratings.tolist())}
+
+    def genre_flags(self, genre):
+        """Return the flag column for a genre, or None if it was not loaded"""
+        col = self.genre_lookup.get(genre)
+        if col is None:
+            return None
+        return self.genre_matrix[:, col]
+
+    def _unrated_mask(self, items):
+        mask = np.ones(self.num_items, dtype=bool)
+        mask[items] = False
+        return mask
+
+    def _rank(self, scores, mask, limit, offset=0):
+        """Order the masked items by score (desc), ties by show_id, and slice a page"""
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 0 or limit <= 0:
+            return []
+        order = np.lexsort((candidates, -scores[candidates]))
+        page = candidates[order[offset:offset + limit]]
+        return self.item_keys[page].tolist()
+
+    # ------------------------------------------------------------------
+    # Query equivalents
+    # ------------------------------------------------------------------
+
+    def strict_collaborative(self, user_id, limit=20, offset=0, max_difference=1):
+        """
+        Titles liked by users who rated the same titles within max_difference
+        of this user, scored by the number of agreeing ratings behind them.
+        """
+        idx = self.user_index(user_id)
+        items, ratings = self.user_row(user_id)
+        if idx is None or len(items) == 0:
+            return []
+
+        # Collect every other user that agrees with this user on a co-rated title
+        agreeing = []
+        for item, rating in zip(items.tolist(), ratings.tolist()):
+            users, values = self.item_column(item)
+            agree = (np.abs(values - rating) <= max_difference) & (users != idx)
+            agreeing.append(users[agree])
+        weights = np.bincount(np.concatenate(agreeing), minlength=self.num_users).astype(np.float32)
+        if not weights.any():
+            return []
+
+        scores = self.liked_by_item @ weights[:self.csr.shape[0]]
+        # Overlay ratings that turned a like on or off since the snapshot
+        for item, entries in list(self.item_overlay.items()):
+            for user, (rating, snapshot_rating) in entries.items():
+                change = float(rating >= LIKED_RATING) - float(
+                    snapshot_rating is not None and snapshot_rating >= LIKED_RATING
+                )
+                if change:
+                    scores[item] += change * weights[user]
+
+        mask = (scores > 0) & self._unrated_mask(items)
+        return self._rank(scores, mask, limit, offset)
+
+    def content_based(self, user_id, genre_columns, limit=20, offset=0, min_rating=4):
+        """
+        Titles sharing at least one genre with the user's highly rated titles,
+        scored by how many of those titles they share a genre with.
+        """
+        items, ratings = self.user_row(user_id)
+        liked = items[(ratings >= min_rating) & self.in_catalog[items]]
+        if len(liked) == 0:
+            return []
+
+        # Encode each title's genres as a bitmask and count liked titles per mask
+        signatures = np.zeros(self.num_items, dtype=np.int64)
+        for bit, genre in enumerate(genre_columns):
+            flags = self.genre_flags(genre)
+            if flags is not None:
+                signatures |= (flags > 0).astype(np.int64) << bit
+        num_signatures = 1 << len(genre_columns)
+        liked_counts = np.bincount(signatures[liked], minlength=num_signatures)
+        overlap = np.array([
+            liked_counts[[s for s in range(num_signatures) if s & t]].sum()
+            for t in range(num_signatures)
+        ], dtype=np.float64)
+        scores = overlap[signatures]
+
+        mask = (scores > 0) & self.in_catalog & self._unrated_mask(items)
+        return self._rank(scores, mask, limit, offset)
+
+    def extended_collaborative(self, user_id, user_genres, score_columns, limit=20, offset=0,
+                               min_rating=4, max_seed_titles=50):
+        """
+        Titles in the user's preferred genres, scored by how many of the
+        score_columns genres they carry, as long as the user has rated at
+        least one catalog title at or above min_rating.
+        """
+        items, ratings = self.user_row(user_id)
+        seeds = (ratings >= min_rating) & self.in_catalog[items]
+        if not seeds.any():
+            return []
+        seed_ratings = np.sort(ratings[seeds])[::-1][:max_seed_titles]
+        weight = float(np.mean(1 - np.abs(seed_ratings - min_rating) / 5))
+
+        in_genres = np.zeros(self.num_items, dtype=bool)
+        for genre in user_genres:
+            flags = self.genre_flags(genre)
+            if flags is not None:
+                in_genres |= flags > 0
+
+        scores = np.zeros(self.num_items, dtype=np.float64)
+        for genre in score_columns:
+            flags = self.genre_flags(genre)
+            if flags is not None:
+                scores += flags
+        scores *= weight
+
+        mask = in_genres & self.in_catalog & self._unrated_mask(items)
+        return self._rank(scores, mask, limit, offset)
+
+    def preferred_genres(self, user_id, genres, min_rating=3.5, top=3):
+        """Return up to `top` genres with the most highly rated titles for a user"""
+        items, ratings = self.user_row(user_id)
+        liked = items[ratings >= min_rating]
+        if len(liked) == 0:
+            return []
+        scored = []
+        for genre in genres:
+            flags = self.genre_flags(genre)
+            scored.append((genre, float(flags[liked].sum()) if flags is not None else 0))
+        ranked = sorted(scored, key=lambda x: x[1], reverse=True)
+        return [genre for genre, score in ranked if score > 0][:top]
+
+    def title_stats(self):
+        """Yield (show_id, rating_count, average_rating) for every rated title"""
+        for item in np.flatnonzero(self.item_counts > 0).tolist():
+            yield str(self.item_keys[item]), int(self.item_counts[item]), float(self.item_means[item])
@@ -0,0 +1,373 @@
+"""
+Streaming writer for the per-user recommendations file.
+
+Users are appended one at a time, so writing the file takes constant memory
+no matter how many users there are. Output goes to a temporary file next to
+the target that is renamed over it only once everything has been written,
+so readers never see a half-written file and a failed run leaves the
+previous file in place. A SHA-256 checksum of the result is written to a
+`.sha256` file beside it (in `sha256sum` format).
+
+Two formats are supported:
+
+- json: one object mapping user IDs to recommendations (what the frontend loads)
+- ndjson: one {"userId": ..., "recommendations": ...} object per line
+
+ShardedRecommendationsWriter instead writes a directory for static hosting,
+so each client downloads only its own recommendations: either one small
+file per user or a fixed number of hash-bucketed shard files, each with
+precompressed .gz (and, when brotli is installed, .br) siblings, plus a
+manifest.json telling clients where to find a user. Shard entries are
+buffered in memory and appended to their files in batches, so only one
+file is open at a time however many shards there are.
+"""
+
+import os
+import re
+import gzip
+import json
+import shutil
+import hashlib
+import logging
+
+from response_codec import dumps
+
+logger = logging.getLogger('recommendation_service')
+
+# Brotli is optional; without it only .gz variants are written
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+FORMATS = ('json', 'ndjson')
+LAYOUTS = ('single', 'users', 'shards')
+
+# Hash buckets used by the shards layout
+DEFAULT_SHARDS = 256
+
+# Users buffered in memory between writes to disk
+DEFAULT_FLUSH_EVERY = 500
+
+# Bytes of shard entries buffered before they are appended to their shard files
+SHARD_BUFFER_BYTES = 8 * 1024 * 1024
+
+# Characters kept in per-user file names; IDs with anything else are escaped
+_UNSAFE_FILE_CHARS = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def shard_for_user(user_id, shards=DEFAULT_SHARDS):
+    """
+    Return the shard bucket of a user: 32-bit FNV-1a of the UTF-8 user ID modulo shards.
+
+    FNV-1a is a few lines in any language, so clients can compute the same bucket.
+    """
+    value = 0x811c9dc5
+    for byte in str(user_id).encode('utf-8'):
+        value = ((value ^ byte) * 0x01000193) & 0xffffffff
+    return value % shards
+
+
+def user_file_name(user_id):
+    """
+    Return the file name (without .json) of a user in the users layout.
+
+    IDs made only of letters, digits, '_', '.' and '-' are used as they are.
+    Anything else is replaced with '_' and the first 16 hex digits of the
+    ID's SHA-256 are appended after a '~', which a plain ID can never
+    contain, so two different IDs never share a file.
+    """
+    user_id = str(user_id)
+    name = _UNSAFE_FILE_CHARS.sub('_', user_id)
+    if name == user_id:
+        return name
+    return f"{name}~{hashlib.sha256(user_id.encode('utf-8')).hexdigest()[:16]}"
+
+
+def compressed_variants(data):
+    """Return {extension: bytes} of the precompressed variants of a file"""
+    variants = {'gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if BROTLI_AVAILABLE:
+        variants['br'] = brotli.compress(data, quality=11)
+    return variants
+
+
+def format_for_path(path):
+    """Guess the output format from a file name (.ndjson/.jsonl -> ndjson, else json)"""
+    return 'ndjson' if os.path.splitext(path)[1].lower() in ('.ndjson', '.jsonl') else 'json'
+
+
+class RecommendationsFileWriter:
+    """
+    Context manager that streams user recommendations to a file.
+
+    Usage:
+        with RecommendationsFileWriter(path) as writer:
+            for user_id, recommendations in results:
+                writer.write(user_id, recommendations)
+    """
+
+    def __init__(self, path, format=None, flush_every=DEFAULT_FLUSH_EVERY):
+        """
+        Args:
+            path (str): Final path of the file.
+            format (str): 'json' or 'ndjson' (default: guessed from the path).
+            flush_every (int): Users buffered before the buffer is written out.
+        """
+        self.path = path
+        self.format = format or format_for_path(path)
+        if self.format not in FORMATS:
+            raise ValueError(f"Unknown recommendations file format: {self.format}")
+        self.flush_every = max(1, flush_every)
+        self.tmp_path = f"{path}.tmp"
+        self.users = 0
+        self.bytes_written = 0
+        self.sha256 = None
+
+        self._file = None
+        self._buffer = []
+        self._hash = hashlib.sha256()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._file = open(self.tmp_path, 'wb')
+        if self.format == 'json':
+            self._append(b'{')
+
+    def _append(self, data):
+        self._buffer.append(data)
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        data = b''.join(self._buffer)
+        self._buffer = []
+        self._file.write(data)
+        self._file.flush()
+        self._hash.update(data)
+        self.bytes_written += len(data)
+
+    def write(self, user_id, recommendations):
+        """Append one user's recommendations"""
+        if self.format == 'json':
+            prefix = b',' if self.users else b''
+            self._append(prefix + dumps(str(user_id)) + b':' + dumps(recommendations))
+        else:
+            self._append(dumps({"userId": str(user_id), "recommendations": recommendations}) + b'\n')
+        self.users += 1
+        if self.users % self.flush_every == 0:
+            self._flush()
+
+    def close(self):
+        """Finish the file, move it into place and write its checksum"""
+        if self.format == 'json':
+            self._append(b'}')
+        self._flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+
+        self.sha256 = self._hash.hexdigest()
+        with open(f"{self.path}.sha256", 'w') as f:
+            f.write(f"{self.sha256}  {os.path.basename(self.path)}\n")
+        logger.info(f"Wrote recommendations for {self.users} users to {self.path} ({self.bytes_written} bytes)")
+
+    def abort(self):
+        """Discard the partial file, leaving any previous file untouched"""
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        logger.warning(f"Discarded partial recommendations file {self.tmp_path} after {self.users} users")
+
+    def summary(self):
+        """Return what was written, for endpoint responses"""
+        return {
+            "path": self.path,
+            "format": self.format,
+            "users": self.users,
+            "bytes": self.bytes_written,
+            "sha256": self.sha256,
+        }
+
+
+class ShardedRecommendationsWriter:
+    """
+    Writes per-user or hash-bucketed recommendation files plus a manifest.
+
+    Files are written into a temporary directory next to the target that
+    replaces the target directory once everything, including compression
+    and the manifest, has been written. Same interface as
+    RecommendationsFileWriter.
+    """
+
+    def __init__(self, directory, layout='users', shards=DEFAULT_SHARDS):
+        """
+        Args:
+            directory (str): Output directory (replaced as a whole on success).
+            layout (str): 'users' for one file per user or 'shards' for hash buckets.
+            shards (int): Number of buckets of the shards layout.
+        """
+        if layout not in ('users', 'shards'):
+            raise ValueError(f"Unknown sharded layout: {layout}")
+        self.directory = directory.rstrip('/\\') or directory
+        self.layout = layout
+        self.shards = shards
+        self.tmp_directory = f"{self.directory}.tmp"
+        self.users = 0
+        self.bytes_written = 0
+        self.compressed_bytes = {}
+
+        self._shard_buffers = {}  # shard -> [entry bytes] not yet appended to its file
+        self._buffered_bytes = 0
+        self._shard_users = {}
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    def open(self):
+        if os.path.exists(self.tmp_directory):
+            shutil.rmtree(self.tmp_directory)
+        os.makedirs(os.path.join(self.tmp_directory, self.layout))
+
+    def _write_file(self, relative_path, data):
+        """Write one finished file and its compressed variants"""
+        path = os.path.join(self.tmp_directory, relative_path)
+        with open(path, 'wb') as f:
+            f.write(data)
+        self.bytes_written += len(data)
+        for extension, compressed in compressed_variants(data).items():
+            with open(f"{path}.{extension}", 'wb') as f:
+                f.write(compressed)
+            self.compressed_bytes[extension] = self.compressed_bytes.get(extension, 0) + len(compressed)
+
+    def _shard_name(self, shard):
+        return f"{shard:0{len(format(self.shards - 1, 'x'))}x}.json"
+
+    def write(self, user_id, recommendations):
+        """Add one user's recommendations"""
+        user_id = str(user_id)
+        body = dumps(recommendations)
+        if self.layout == 'users':
+            self._write_file(os.path.join('users', user_file_name(user_id) + '.json'), body)
+        else:
+            # Shards are appended to in batches and compressed on close
+            shard = shard_for_user(user_id, self.shards)
+            prefix = b',' if self._shard_users.get(shard) else b'{'
+            entry = prefix + dumps(user_id) + b':' + body
+            self._shard_buffers.setdefault(shard, []).append(entry)
+            self._buffered_bytes += len(entry)
+            self._shard_users[shard] = self._shard_users.get(shard, 0) + 1
+            if self._buffered_bytes >= SHARD_BUFFER_BYTES:
+                self._flush_shards()
+        self.users += 1
+
+    def _flush_shards(self):
+        """Append every buffered entry to its shard file, one file open at a time"""
+        for shard, entries in self._shard_buffers.items():
+            with open(os.path.join(self.tmp_directory, 'shards', self._shard_name(shard)), 'ab') as f:
+                f.write(b''.join(entries))
+        self._shard_buffers = {}
+        self._buffered_bytes = 0
+
+    def _finish_shards(self):
+        self._flush_shards()
+        for shard in range(self.shards):
+            relative_path = os.path.join('shards', self._shard_name(shard))
+            if not self._shard_users.get(shard):
+                # Every bucket exists so clients never get a 404 for a valid user
+                self._write_file(relative_path, b'{}')
+                continue
+            path = os.path.join(self.tmp_directory, relative_path)
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.remove(path)
+            self._write_file(relative_path, data + b'}')
+
+    def _manifest(self):
+        manifest = {
+            "version": 1,
+            "layout": self.layout,
+            "users": self.users,
+            "encodings": ['br', 'gz'] if BROTLI_AVAILABLE else ['gz'],
+        }
+        if self.layout == 'users':
+            manifest["path"] = "users/{userId}.json"
+            # IDs with other characters are stored under user_file_name()
+            manifest["userIdChars"] = "A-Za-z0-9_.-"
+        else:
+            manifest["path"] = "shards/{shard}.json"
+            manifest["shards"] = self.shards
+            manifest["shardHash"] = "fnv1a32"
+            # {shard} is the bucket in lowercase hex, zero-padded to shardDigits
+            manifest["shardDigits"] = len(format(self.shards - 1, 'x'))
+        return manifest
+
+    def close(self):
+        """Compress, write the manifest and move the directory into place"""
+        if self.layout == 'shards':
+            self._finish_shards()
+        self._write_file('manifest.json', json.dumps(self._manifest(), indent=2).encode())
+
+        # Swap directories; the old one is only removed after the new one is in place
+        old_directory = f"{self.directory}.old"
+        if os.path.exists(old_directory):
+            shutil.rmtree(old_directory)
+        if os.path.exists(self.directory):
+            os.rename(self.directory, old_directory)
+        os.rename(self.tmp_directory, self.directory)
+        shutil.rmtree(old_directory, ignore_errors=True)
+        logger.info(f"Wrote {self.layout} recommendation files for {self.users} users to {self.directory}")
+
+    def abort(self):
+        """Discard the partial output, leaving any previous directory untouched"""
+        self._shard_buffers = {}
+        shutil.rmtree(self.tmp_directory, ignore_errors=True)
+        logger.warning(f"Discarded partial recommendation files in {self.tmp_directory} after {self.users} users")
+
+    def summary(self):
+        """Return what was written, for endpoint responses"""
+        return {
+            "path": self.directory,
+            "layout": self.layout,
+            "users": self.users,
+            "bytes": self.bytes_written,
+            "compressedBytes": self.compressed_bytes,
+        }
+
+
+def open_writer(path, format=None, layout='single', shards=DEFAULT_SHARDS):
+    """
+    Create the writer for an output layout.
+
+    Args:
+        path (str): File path for the single layout, directory otherwise.
+        format (str): 'json' or 'ndjson' for the single layout.
+        layout (str): 'single', 'users' or 'shards'.
+        shards (int): Number of buckets of the shards layout.
+    """
+    if layout in (None, 'single'):
+        return RecommendationsFileWriter(path, format)
+    return ShardedRecommendationsWriter(path, layout, shards)
@@ -0,0 +1,168 @@
+"""
+JSON encoding and compression of API responses.
+
+Bodies are encoded with orjson when it is installed (falling back to the
+standard library encoder) and compressed with the best encoding the client
+accepts: brotli when installed, otherwise gzip. EncodedResponseCache keeps
+the finished bytes of cacheable responses, keyed by ETag and encoding, so a
+repeat request is answered with the stored bytes without encoding or
+compressing anything again.
+"""
+
+import os
+import gzip
+import json
+import logging
+import time
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger('recommendation_service')
+
+# orjson is several times faster than the standard library encoder
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Brotli is optional; without it only gzip is offered
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', 1024))
+
+# Levels favour speed, since most bodies are compressed on the request path
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def dumps(obj):
+    """Encode obj as compact JSON bytes"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+def supported_encodings():
+    """Content encodings this process can produce, best first"""
+    return ('br', 'gzip') if BROTLI_AVAILABLE else ('gzip',)
+
+
+def negotiate(accept_encoding):
+    """
+    Pick the content encoding for a response.
+
+    Args:
+        accept_encoding (str): The request's Accept-Encoding header.
+
+    Returns:
+        str: 'br', 'gzip', or None for an uncompressed body.
+    """
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding] = quality
+
+    best, best_quality = None, 0.0
+    for coding in supported_encodings():
+        quality = accepted.get(coding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(data, encoding):
+    """Compress data with a content encoding returned by negotiate()"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    return data
+
+
+def encode_response(payload, encoding):
+    """
+    Encode and, if worthwhile, compress a response payload.
+
+    Args:
+        payload: JSON-serializable response.
+        encoding (str): Content encoding from negotiate(), or None.
+
+    Returns:
+        tuple: (body bytes, content encoding actually used or None)
+    """
+    body = dumps(payload)
+    if encoding is None or len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    return compress(body, encoding), encoding
+
+
+class EncodedResponseCache:
+    """
+    Thread-safe LRU + TTL cache of finished response bodies keyed by (ETag, requested encoding).
+    """
+
+    def __init__(self, max_entries=10000, ttl=300):
+        """
+        Args:
+            max_entries (int): Maximum number of bodies kept (0 disables the cache).
+            ttl (float): Seconds a body is served before it is encoded again (0 disables expiry).
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (etag, encoding) -> (body, encoding used, stored at)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "bytes": 0}
+
+    def get(self, etag, encoding):
+        """Return (body, encoding used) stored for this ETag and encoding, or None"""
+        with self._lock:
+            entry = self._entries.get((etag, encoding))
+            if entry is not None and self.ttl > 0 and time.monotonic() - entry[2] > self.ttl:
+                del self._entries[(etag, encoding)]
+                self._stats["bytes"] -= len(entry[0])
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end((etag, encoding))
+            self._stats["hits"] += 1
+            return entry[:2]
+
+    def put(self, etag, encoding, body, used_encoding):
+        if self.max_entries <= 0:
+            return
+        key = (etag, encoding)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._stats["bytes"] -= len(previous[0])
+            self._entries[key] = (body, used_encoding, time.monotonic())
+            self._stats["bytes"] += len(body)
+            while len(self._entries) > self.max_entries:
+                _, (old_body, _, _) = self._entries.popitem(last=False)
+                self._stats["bytes"] -= len(old_body)
+
+    def stats(self):
+        """Return hit/miss counters, the number of entries and their total size"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["maxEntries"] = self.max_entries
+        stats["encoder"] = "orjson" if ORJSON_AVAILABLE else "json"
+        return stats
@@ -0,0 +1,167 @@
+"""
+Bounded cache of generated recommendation responses.
+
+Entries are keyed by a tuple whose first element is the user ID, so all of
+a user's entries can be dropped when they rate something. The cache evicts
+least-recently-used entries past max_entries, expires entries after ttl
+seconds and, for stale_ttl seconds after that, keeps serving the stale
+value while a background thread recomputes it.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger('recommendation_service')
+
+
+class ResultCache:
+    """
+    Thread-safe LRU + TTL cache with stale-while-revalidate.
+    """
+
+    def __init__(self, max_entries=10000, ttl=300, stale_ttl=600):
+        """
+        Args:
+            max_entries (int): Maximum number of cached results (0 disables caching).
+            ttl (float): Seconds a result is served as fresh.
+            stale_ttl (float): Extra seconds a stale result is served while it is refreshed.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+
+        self._entries = OrderedDict()  # key -> (value, stored at)
+        self._user_keys = {}  # user ID -> set of keys
+        # user ID -> [computations running, invalidations since the first started];
+        # only users with a computation running are kept
+        self._in_flight = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "staleHits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+    def _start(self, user_id):
+        """Register a computation for a user (lock held) and return the epoch it runs in"""
+        flight = self._in_flight.setdefault(user_id, [0, 0])
+        flight[0] += 1
+        return flight[1]
+
+    def _finish(self, key, value, epoch, store):
+        """Store a computed result unless its user was invalidated meanwhile, and unregister it"""
+        with self._lock:
+            flight = self._in_flight[key[0]]
+            # Drop results that were computed before the user's entries were invalidated
+            if store and flight[1] == epoch:
+                self._store(key, value)
+            flight[0] -= 1
+            if not flight[0]:
+                del self._in_flight[key[0]]
+
+    def _store(self, key, value):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        self._user_keys.setdefault(key[0], set()).add(key)
+        while len(self._entries) > self.max_entries:
+            old_key, _ = self._entries.popitem(last=False)
+            self._forget_user_key(old_key)
+            self._stats["evictions"] += 1
+
+    def _forget_user_key(self, key):
+        keys = self._user_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[key[0]]
+
+    def _revalidate(self, key, compute, epoch, cacheable):
+        value, store = None, False
+        try:
+            value = compute()
+            store = cacheable is None or cacheable(value)
+        except Exception as e:
+            logger.error(f"Error refreshing cached result {key}: {e}")
+        finally:
+            self._finish(key, value, epoch, store)
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get_or_compute(self, key, compute, cacheable=None):
+        """
+        Return the cached result for key, computing and caching it on a miss.
+
+        Args:
+            key (tuple): Cache key; key[0] must be the user ID.
+            compute (callable): Produces the result when it is missing or stale.
+            cacheable (callable): Optional predicate; computed results it rejects
+                are returned but not stored.
+
+        Returns:
+            The cached or freshly computed result.
+        """
+        if self.max_entries <= 0:
+            return compute()
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                age = now - stored_at
+                if age <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+                if age <= self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self._stats["staleHits"] += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        epoch = self._start(key[0])
+                        threading.Thread(target=self._revalidate, args=(key, compute, epoch, cacheable), daemon=True).start()
+                    return value
+            self._stats["misses"] += 1
+            epoch = self._start(key[0])
+
+        try:
+            value = compute()
+        except BaseException:
+            self._finish(key, None, epoch, False)
+            raise
+        self._finish(key, value, epoch, cacheable is None or cacheable(value))
+        return value
+
+    def invalidate_user(self, user_id):
+        """
+        Drop every cached result for a user.
+
+        Returns:
+            int: Number of entries removed.
+        """
+        with self._lock:
+            user_id = str(user_id)
+            # Results still being computed were computed from the old data
+            flight = self._in_flight.get(user_id)
+            if flight is not None:
+                flight[1] += 1
+            keys = self._user_keys.pop(user_id, set())
+            for key in keys:
+                self._entries.pop(key, None)
+            self._stats["invalidations"] += len(keys)
+        return len(keys)
+
+    def stats(self):
+        """Return hit/miss counters and the current size"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["maxEntries"] = self.max_entries
+        lookups = stats["hits"] + stats["staleHits"] + stats["misses"]
+        stats["hitRate"] = round((stats["hits"] + stats["staleHits"]) / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,140 @@
+"""
+Server-held scroll lists behind the /recommendations/<user_id>/more cursors.
+
+The first request for a (user, section) ranks a deep, de-duplicated list of
+candidates and keeps it in memory. Every page after that is a slice of the
+same list, addressed by an opaque cursor token, so a page costs the same no
+matter how far the user has scrolled and no title is ever shown twice. When
+a user scrolls past the end, the list is grown by asking the builder for a
+deeper ranking and appending only titles not already in it.
+"""
+
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger('recommendation_service')
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a cursor token cannot be parsed or its list has expired"""
+
+
+class _ScrollList:
+    def __init__(self, list_id):
+        self.list_id = list_id
+        self.items = []
+        self.seen = set()
+        self.depth = 0
+        self.exhausted = False
+        self.created_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def extend(self, candidates):
+        added = 0
+        for show_id in candidates:
+            if show_id not in self.seen:
+                self.seen.add(show_id)
+                self.items.append(show_id)
+                added += 1
+        return added
+
+
+class ScrollCursorStore:
+    """
+    Bounded, TTL-limited map of (user, section) -> ranked candidate list.
+    """
+
+    def __init__(self, ttl=1800, max_lists=10000, initial_depth=100):
+        """
+        Args:
+            ttl (float): Seconds a scroll list lives before it is rebuilt.
+            max_lists (int): Maximum number of lists kept (least recently used are dropped).
+            initial_depth (int): Number of candidates ranked when a list is first built.
+        """
+        self.ttl = ttl
+        self.max_lists = max_lists
+        self.initial_depth = initial_depth
+        self._lists = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _encode(list_id, offset):
+        return f"{list_id}.{offset}"
+
+    @staticmethod
+    def _decode(cursor):
+        try:
+            list_id, offset = cursor.rsplit('.', 1)
+            offset = int(offset)
+            if offset < 0:
+                raise ValueError(offset)
+            return list_id, offset
+        except (AttributeError, ValueError):
+            raise InvalidCursorError(f"Invalid cursor: {cursor!r}")
+
+    def _get_list(self, key):
+        """Return the live list for key, creating a new one if it is missing or expired"""
+        with self._lock:
+            scroll = self._lists.get(key)
+            if scroll is None or time.monotonic() - scroll.created_at > self.ttl:
+                scroll = _ScrollList(secrets.token_urlsafe(12))
+                self._lists[key] = scroll
+            self._lists.move_to_end(key)
+            while len(self._lists) > self.max_lists:
+                self._lists.popitem(last=False)
+            return scroll
+
+    def page(self, user_id, section, build, limit=10, offset=0, cursor=None):
+        """
+        Return one page of a user's scroll list for a section.
+
+        Args:
+            user_id (str): The user scrolling.
+            section (str): 'collaborative', 'contentBased' or a genre name.
+            build (callable): build(depth) returns up to `depth` ranked, valid show IDs.
+            limit (int): Page size.
+            offset (int): Position to start at when no cursor is given.
+            cursor (str): Token returned with the previous page.
+
+        Returns:
+            tuple: (list of show IDs, cursor token for the next page)
+
+        Raises:
+            InvalidCursorError: If the cursor is malformed or its list has expired.
+        """
+        key = (str(user_id), section)
+        list_id = None
+        if cursor:
+            list_id, offset = self._decode(cursor)
+        scroll = self._get_list(key)
+        if list_id is not None and scroll.list_id != list_id:
+            # The list behind the cursor expired (or was dropped after a rating). A fresh
+            # list ranks differently, so the same offset in it could repeat or skip titles
+            logger.info(f"Scroll list for user {user_id}, section {section} expired")
+            raise InvalidCursorError(f"Cursor {cursor!r} has expired, request the section again without a cursor")
+
+        with scroll.lock:
+            while offset + limit > len(scroll.items) and not scroll.exhausted:
+                scroll.depth = max(scroll.depth * 2, self.initial_depth, offset + limit)
+                candidates = build(scroll.depth)
+                added = scroll.extend(candidates)
+                if added == 0:
+                    scroll.exhausted = True
+                logger.info(f"Scroll list for user {user_id}, section {section} grown to {len(scroll.items)} titles")
+            page = scroll.items[offset:offset + limit]
+
+        return page, self._encode(scroll.list_id, offset + len(page))
+
+    def invalidate_user(self, user_id):
+        """Drop every scroll list of a user (e.g. after they rate something)"""
+        user_id = str(user_id)
+        with self._lock:
+            for key in [key for key in self._lists if key[0] == user_id]:
+                del self._lists[key]
+
+    def stats(self):
+        with self._lock:
+            return {"lists": len(self._lists), "maxLists": self.max_lists}
@@ -0,0 +1,91 @@
+"""
+Coalescing of concurrent identical computations.
+
+The first caller with a key computes the result; callers arriving with the
+same key while it is running wait for it and share its result (or its
+exception) instead of computing it again. Nothing is kept once the
+computation finishes, so this only removes duplicate concurrent work, such
+as the frontend firing the same request twice or a cold cache right after a
+deploy; caching across time is result_cache.py's job.
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger('recommendation_service')
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Thread-safe per-key single-flight group.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "calls": 0,
+            "executions": 0,
+            "coalesced": 0,
+            "errors": 0,
+        }
+
+    def do(self, key, compute):
+        """
+        Return compute()'s result, sharing one in-flight computation per key.
+
+        Args:
+            key (hashable): Identifies identical computations.
+            compute (callable): Produces the result.
+
+        Returns:
+            The result of this or a concurrent identical computation.
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._stats["executions"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = compute()
+            return call.result
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.waiters:
+                logger.info(f"Shared result of {key} with {call.waiters} concurrent callers")
+            call.done.set()
+
+    def stats(self):
+        """Return call counters and the number of computations in flight"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["inFlight"] = len(self._calls)
+        stats["coalescedRate"] = round(stats["coalesced"] / stats["calls"], 4) if stats["calls"] else 0.0
+        return stats
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Synthetic movies_titles / movies_users / movies_ratings data for benchmarks.
+
+Generates a catalog, users and ratings at any scale (10k to 10M ratings)
+with the shape of the real tables:
+
+- Title popularity follows a Zipf law, so a few titles collect most ratings
+  and the long tail is rated a handful of times; user activity is heavy-tailed
+  the same way.
+- Titles are movies or TV shows with the genre flag columns of movies_titles,
+  at rates close to the real catalog (dramas and comedies common, TV-only
+  genres only on shows, every title in at least one genre).
+- Ratings are integers 1-5 from a title quality, a user bias and the user's
+  affinity for the title's genres, so the collaborative and content-based
+  queries find real structure.
+
+The data can be written as CSV files, loaded into an (empty, scratch)
+database, or handed to the benchmarks directly:
+
+    python synthetic_data.py --ratings 1000000 --output-dir synthetic
+    python synthetic_data.py --ratings 100000 --load --replace
+"""
+
+import os
+import sys
+import math
+import time
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from notebook_recommendation_service import ALL_GENRE_COLUMNS, CATALOG_GENRE_COLUMNS
+
+logger = logging.getLogger('recommendation_service')
+
+# Share of titles flagged with each genre, separately for movies and TV shows
+MOVIE_GENRE_RATES = {
+    "Action": 0.10, "Adventure": 0.05, "Children": 0.05, "Comedies": 0.18,
+    "ComediesDramasInternationalMovies": 0.04, "ComediesInternationalMovies": 0.04,
+    "ComediesRomanticMovies": 0.03, "Documentaries": 0.09, "DocumentariesInternationalMovies": 0.03,
+    "Dramas": 0.25, "DramasInternationalMovies": 0.06, "DramasRomanticMovies": 0.03,
+    "FamilyMovies": 0.04, "Fantasy": 0.02, "HorrorMovies": 0.06,
+    "InternationalMoviesThrillers": 0.03, "Musicals": 0.02, "Spirituality": 0.01, "Thrillers": 0.07,
+}
+TV_GENRE_RATES = {
+    "AnimeSeriesInternationalTVShows": 0.05, "BritishTVShowsDocuseriesInternationalTVShows": 0.03,
+    "CrimeTVShowsDocuseries": 0.05, "Docuseries": 0.12, "InternationalTVShowsRomanticTVShowsTVDramas": 0.05,
+    "KidsTV": 0.14, "LanguageTVShows": 0.03, "NatureTV": 0.02, "RealityTV": 0.07,
+    "TVAction": 0.05, "TVComedies": 0.15, "TVDramas": 0.14, "TalkShowsTVComedies": 0.02,
+}
+# Share of the catalog that is TV shows
+TV_SHARE = 0.3
+
+STREAMING_SERVICES = ["Netflix", "AmazonPrime", "DisneyPlus", "ParamountPlus", "Max", "Hulu", "AppleTVPlus", "Peacock"]
+CONTENT_RATINGS = ["G", "PG", "PG-13", "R", "TV-Y", "TV-G", "TV-PG", "TV-14", "TV-MA"]
+COUNTRIES = ["United States", "India", "United Kingdom", "Japan", "South Korea", "Canada", "Spain", "France"]
+STATES = ["UT", "CA", "TX", "NY", "FL", "WA", "ID", "AZ"]
+
+# Rows per executemany batch when loading into the database
+LOAD_BATCH_SIZE = 10000
+
+
+def default_titles(num_ratings):
+    """Catalog size for a number of ratings: ~800 titles at 10k ratings, ~25k at 10M"""
+    return int(min(50000, max(500, 8 * math.sqrt(num_ratings))))
+
+
+def default_users(num_ratings):
+    """Number of users for a number of ratings (40 ratings per user on average)"""
+    return max(100, num_ratings // 40)
+
+
+class SyntheticData:
+    """
+    The three tables as DataFrames with the database's column names.
+    """
+
+    def __init__(self, titles, users, ratings):
+        self.titles = titles
+        self.users = users
+        self.ratings = ratings
+
+    def stats(self):
+        return {
+            "titles": len(self.titles),
+            "users": len(self.users),
+            "ratings": len(self.ratings),
+            "ratedTitles": int(self.ratings["show_id"].nunique()),
+            "activeUsers": int(self.ratings["user_id"].nunique()),
+            "meanRating": round(float(self.ratings["rating"].mean()), 3),
+        }
+
+    def user_ids(self):
+        """IDs of users with at least one rating, as strings like the API receives them"""
+        return [str(user_id) for user_id in self.ratings["user_id"].unique()]
+
+    def ratings_store(self, genre_columns=CATALOG_GENRE_COLUMNS):
+        """Build the in-memory RatingsStore the "memory" engine would load from these tables"""
+        from ratings_store import RatingsStore
+        return RatingsStore(
+            self.ratings["user_id"].to_numpy(),
+            self.ratings["show_id"].to_numpy(),
+            self.ratings["rating"].to_numpy(dtype=np.float32),
+            self.titles["show_id"].to_numpy(),
+            self.titles[list(genre_columns)].to_numpy(dtype=np.float32),
+            genre_columns
+        )
+
+    def genre_catalog(self):
+        """(show_id, [genre names]) of every title, as the genre index loads them"""
+        flags = self.titles[ALL_GENRE_COLUMNS].to_numpy() > 0
+        return [
+            (show_id, [genre for genre, flag in zip(ALL_GENRE_COLUMNS, row) if flag])
+            for show_id, row in zip(self.titles["show_id"], flags)
+        ]
+
+    def notebook_frames(self):
+        """(ratings_df, movies_df, users_df) with the columns the notebook service loads"""
+        ratings_df = self.ratings.rename(columns={
+            "user_id": "UserId", "show_id": "ShowId", "rating": "RatingValue"
+        })
+        movies_df = self.titles.rename(columns={
+            "show_id": "ShowId", "title": "Title", "director": "Director", "cast": "Cast",
+            "country": "Country", "release_year": "ReleaseYear", "rating": "Rating",
+            "duration": "Duration", "description": "Description", "poster_url": "PosterUrl"
+        })[["ShowId", "Title", "Director", "Cast", "Country", "ReleaseYear", "Rating", "Duration",
+            "Description", "PosterUrl", "Action", "Adventure", "Comedies", "Dramas", "HorrorMovies",
+            "Thrillers", "Documentaries", "FamilyMovies", "Fantasy", "Children"]]
+        users_df = self.users.rename(columns={
+            "user_id": "UserId", "name": "Name", "email": "Email", "gender": "Gender", "age": "Age"
+        })[["UserId", "Name", "Email", "Gender", "Age"]]
+        return ratings_df, movies_df, users_df
+
+    def to_csv(self, directory):
+        """Write movies_titles.csv, movies_users.csv and movies_ratings.csv to a directory"""
+        os.makedirs(directory, exist_ok=True)
+        for name, frame in (("movies_titles", self.titles), ("movies_users", self.users),
+                            ("movies_ratings", self.ratings)):
+            frame.to_csv(os.path.join(directory, f"{name}.csv"), index=False)
+        logger.info(f"Wrote synthetic tables to {directory}")
+
+    def load_into(self, conn, replace=False):
+        """
+        Insert the tables into a database through a pyodbc connection.
+
+        Meant for a scratch database used for benchmarking the SQL engine;
+        the tables must be empty unless replace is set.
+
+        Args:
+            conn: An open pyodbc connection.
+            replace (bool): Delete every existing row of the three tables first.
+        """
+        cursor = conn.cursor()
+        try:
+            if replace:
+                cursor.execute("DELETE FROM movies_ratings")
+                cursor.execute("DELETE FROM movies_users")
+                cursor.execute("DELETE FROM movies_titles")
+            else:
+                cursor.execute("SELECT COUNT(*) FROM movies_ratings")
+                existing = cursor.fetchone()[0]
+                if existing:
+                    raise ValueError(f"movies_ratings already has {existing} rows; use replace=True on a scratch database")
+            cursor.fast_executemany = True
+            self._insert(cursor, "movies_titles", self.titles)
+            cursor.execute("SET IDENTITY_INSERT movies_users ON")
+            self._insert(cursor, "movies_users", self.users)
+            cursor.execute("SET IDENTITY_INSERT movies_users OFF")
+            self._insert(cursor, "movies_ratings", self.ratings)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _insert(cursor, table, frame):
+        started = time.perf_counter()
+        columns = ", ".join(f"[{column}]" for column in frame.columns)
+        placeholders = ", ".join("?" * len(frame.columns))
+        sql = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+        rows = frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None)
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= LOAD_BATCH_SIZE:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+        logger.info(f"Inserted {len(frame)} rows into {table} in {time.perf_counter() - started:.1f}s")
+
+
+def _genre_flags(rng, is_tv):
+    """titles x ALL_GENRE_COLUMNS 0/1 matrix with movie and TV genre rates"""
+    num_titles = len(is_tv)
+    flags = np.zeros((num_titles, len(ALL_GENRE_COLUMNS)), dtype=np.int8)
+    for rates, rows in ((MOVIE_GENRE_RATES, ~is_tv), (TV_GENRE_RATES, is_tv)):
+        names = list(rates)
+        columns = [ALL_GENRE_COLUMNS.index(name) for name in names]
+        probabilities = np.array([rates[name] for name in names])
+        draws = rng.random((num_titles, len(names))) < probabilities
+        draws[~rows] = False
+        flags[:, columns] = draws
+        # Every title gets at least one genre, picked in proportion to the genre rates
+        missing = rows & ~draws.any(axis=1)
+        picks = rng.choice(len(names), size=int(missing.sum()), p=probabilities / probabilities.sum())
+        flags[np.flatnonzero(missing), np.asarray(columns)[picks]] = 1
+    return flags
+
+
+def _titles(rng, num_titles):
+    is_tv = rng.random(num_titles) < TV_SHARE
+    flags = _genre_flags(rng, is_tv)
+    numbers = np.arange(1, num_titles + 1)
+    seasons = rng.integers(1, 8, num_titles)
+    minutes = rng.integers(75, 180, num_titles)
+    titles = pd.DataFrame({
+        "show_id": [f"s{n}" for n in numbers],
+        "type": np.where(is_tv, "TV Show", "Movie"),
+        "title": [f"Synthetic Title {n}" for n in numbers],
+        "director": [f"Director {n}" for n in rng.integers(1, max(2, num_titles // 3), num_titles)],
+        "cast": [f"Actor {a}, Actor {b}" for a, b in rng.integers(1, max(2, num_titles), (num_titles, 2))],
+        "country": rng.choice(COUNTRIES, num_titles, p=[0.45, 0.12, 0.1, 0.08, 0.07, 0.06, 0.06, 0.06]),
+        # Skewed towards recent years like the real catalog
+        "release_year": (2021 - np.minimum(rng.exponential(8, num_titles), 70)).astype(int),
+        "rating": rng.choice(CONTENT_RATINGS, num_titles),
+        "duration": [f"{s} Seasons" if tv else f"{m} min" for tv, s, m in zip(is_tv, seasons, minutes)],
+        "description": [f"Synthetic description of title {n}." for n in numbers],
+    })
+    for i, genre in enumerate(ALL_GENRE_COLUMNS):
+        titles[genre] = flags[:, i]
+    titles["poster_url"] = None
+    return titles
+
+
+def _users(rng, num_users):
+    numbers = np.arange(1, num_users + 1)
+    users = pd.DataFrame({
+        "user_id": numbers,
+        "name": [f"Synthetic User {n}" for n in numbers],
+        "phone": [f"555-{n % 10000:04d}" for n in numbers],
+        "email": [f"user{n}@example.com" for n in numbers],
+        "age": rng.integers(16, 80, num_users),
+        "gender": rng.choice(["Female", "Male", "Other"], num_users, p=[0.49, 0.49, 0.02]),
+    })
+    for service in STREAMING_SERVICES:
+        users[service] = (rng.random(num_users) < 0.4).astype(int)
+    users["city"] = [f"City {n}" for n in rng.integers(1, 500, num_users)]
+    users["state"] = rng.choice(STATES, num_users)
+    users["zip"] = [f"{n:05d}" for n in rng.integers(10000, 99999, num_users)]
+    users["password_hash"] = None
+    users["role"] = "User"
+    return users
+
+
+def _rating_pairs(rng, num_ratings, num_users, num_titles, zipf_exponent):
+    """Distinct (user index, title index) pairs, titles drawn by Zipf popularity"""
+    ranks = np.arange(1, num_titles + 1, dtype=np.float64)
+    popularity = ranks ** -zipf_exponent
+    popularity /= popularity.sum()
+    # Shuffle which titles are popular so popularity doesn't follow show_id order
+    popularity = popularity[rng.permutation(num_titles)]
+    activity = rng.lognormal(0.0, 1.0, num_users)
+    activity /= activity.sum()
+
+    capacity = num_users * num_titles
+    if num_ratings > capacity // 2:
+        raise ValueError(f"{num_ratings} ratings don't fit {num_users} users x {num_titles} titles; use more users or titles")
+
+    pairs = np.empty(0, dtype=np.int64)
+    while len(pairs) < num_ratings:
+        draw = int((num_ratings - len(pairs)) * 1.2) + 1000
+        users = rng.choice(num_users, draw, p=activity)
+        titles = rng.choice(num_titles, draw, p=popularity)
+        pairs = np.unique(np.concatenate([pairs, users.astype(np.int64) * num_titles + titles]))
+    pairs = rng.permutation(pairs)[:num_ratings]
+    return pairs // num_titles, pairs % num_titles
+
+
+def generate(num_ratings=100000, num_titles=None, num_users=None, zipf_exponent=1.0, seed=0):
+    """
+    Generate the three tables.
+
+    Args:
+        num_ratings (int): Rows of movies_ratings.
+        num_titles (int): Rows of movies_titles (default: grows with sqrt(num_ratings)).
+        num_users (int): Rows of movies_users (default: num_ratings / 40).
+        zipf_exponent (float): Skew of title popularity (1.0 is classic Zipf).
+        seed (int): Random seed; the same arguments always give the same data.
+
+    Returns:
+        SyntheticData: The generated tables.
+    """
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    num_titles = num_titles or default_titles(num_ratings)
+    num_users = num_users or default_users(num_ratings)
+
+    titles = _titles(rng, num_titles)
+    users = _users(rng, num_users)
+    user_index, title_index = _rating_pairs(rng, num_ratings, num_users, num_titles, zipf_exponent)
+
+    # Rating = overall mean + title quality + user bias + genre affinity + noise
+    quality = rng.normal(0.0, 0.6, num_titles).astype(np.float32)
+    bias = rng.normal(0.0, 0.4, num_users).astype(np.float32)
+    flags = titles[ALL_GENRE_COLUMNS].to_numpy(dtype=np.float32)
+    taste = rng.normal(0.0, 0.7, (num_users, len(ALL_GENRE_COLUMNS))).astype(np.float32)
+    genre_counts = np.maximum(flags.sum(axis=1), 1)
+    values = np.empty(num_ratings, dtype=np.float32)
+    chunk = 1000000
+    for start in range(0, num_ratings, chunk):
+        users_chunk = user_index[start:start + chunk]
+        titles_chunk = title_index[start:start + chunk]
+        affinity = np.einsum('ij,ij->i', taste[users_chunk], flags[titles_chunk]) / genre_counts[titles_chunk]
+        values[start:start + chunk] = (
+            3.4 + quality[titles_chunk] + bias[users_chunk] + affinity
+            + rng.normal(0.0, 0.8, len(users_chunk)).astype(np.float32)
+        )
+    ratings = pd.DataFrame({
+        "user_id": users["user_id"].to_numpy()[user_index],
+        "show_id": titles["show_id"].to_numpy()[title_index],
+        "rating": np.clip(np.rint(values), 1, 5).astype(np.int32),
+    })
+
+    data = SyntheticData(titles, users, ratings)
+    logger.info(f"Generated synthetic data in {time.perf_counter() - started:.1f}s: {data.stats()}")
+    return data
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    parser = argparse.ArgumentParser(description='Generate synthetic movies tables for benchmarks')
+    parser.add_argument('--ratings', type=int, default=100000,
+                        help='Number of ratings (default: 100000)')
+    parser.add_argument('--titles', type=int, default=None,
+                        help='Number of titles (default: scaled with the number of ratings)')
+    parser.add_argument('--users', type=int, default=None,
+                        help='Number of users (default: ratings / 40)')
+    parser.add_argument('--zipf', type=float, default=1.0,
+                        help='Zipf exponent of title popularity (default: 1.0)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed (default: 0)')
+    parser.add_argument('--output-dir', default=None,
+                        help='Write the tables as CSV files to this directory')
+    parser.add_argument('--load', action='store_true',
+                        help='Insert the tables into the database configured by the SQL_* variables')
+    parser.add_argument('--replace', action='store_true',
+                        help='With --load, delete the existing rows first (scratch databases only)')
+    args = parser.parse_args()
+
+    if not args.output_dir and not args.load:
+        parser.error('nothing to do: pass --output-dir and/or --load')
+
+    data = generate(args.ratings, args.titles, args.users, args.zipf, args.seed)
+    print(data.stats())
+    if args.output_dir:
+        data.to_csv(args.output_dir)
+    if args.load:
+        from notebook_recommendation_service import get_connection
+        conn = get_connection()
+        if not conn:
+            logger.error("Could not connect to the database")
+            return 1
+        try:
+            data.load_into(conn, replace=args.replace)
+        finally:
+            conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -49,7 +49,7 @@ def test_recommendation_service():
     # Initialize service
     service = NotebookRecommendationService()
     
-    if service.conn:
+    if service.pool:
         logger.info("✅ Recommendation service successfully connected to database")
         
         # Test movie retrieval
@@ -65,11 +65,12 @@ def test_recommendation_service():
         # Test user retrieval
         try:
             # Just testing a sample query to get user IDs
-            if service.conn:
-                cursor = service.conn.cursor()
-                cursor.execute("SELECT TOP 5 user_id FROM movies_users")
-                user_ids = [str(row.user_id) for row in cursor.fetchall()]
-                cursor.close()
+            if service.pool:
+                with service.pool.connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("SELECT TOP 5 user_id FROM movies_users")
+                    user_ids = [str(row.user_id) for row in cursor.fetchall()]
+                    cursor.close()
                 
                 if user_ids:
                     logger.info(f"✅ Retrieved user IDs: {user_ids}")
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Script to test the per-section timeouts of concurrent recommendation requests
+
+Runs without a database: the sections are stand-ins that sleep, so the test
+only exercises the section executor and the timeout accounting.
+"""
+
+import sys
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from notebook_recommendation_service import NotebookRecommendationService
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+
+
+def make_service(workers, timeout):
+    """Service with a small section executor and no database"""
+    service = NotebookRecommendationService(engine='sql', preload=False)
+    service.concurrent_sections = True
+    service.section_timeout = timeout
+    service.section_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='section')
+    return service
+
+
+def sleeping_section(seconds, result):
+    def compute():
+        time.sleep(seconds)
+        return result
+    return compute
+
+
+def test_saturated_executor():
+    """Sections queued behind other requests' sections still get their full timeout"""
+    print("\n=== Testing Concurrent Requests Against A Saturated Executor ===")
+    # 8 requests x 3 sections of 0.2s on 2 workers keep the executor busy for
+    # about 2.4s, far longer than the 0.5s timeout, but no section runs over it
+    service = make_service(workers=2, timeout=0.5)
+    sections = {
+        "collaborative": sleeping_section(0.2, ["a"]),
+        "contentBased": sleeping_section(0.2, ["b"]),
+        "Action": sleeping_section(0.2, ["c"]),
+    }
+    try:
+        with ThreadPoolExecutor(max_workers=8) as clients:
+            responses = list(clients.map(
+                lambda user_id: service._run_sections(user_id, sections, 10, 0), range(8)
+            ))
+    finally:
+        service.section_executor.shutdown()
+
+    degraded = [section for _, sections_degraded in responses for section in sections_degraded]
+    print(f"Degraded sections: {len(degraded)} of {3 * len(responses)}")
+    if degraded or any(results["collaborative"] != ["a"] for results, _ in responses):
+        print("❌ Sections timed out while waiting in the executor queue")
+        return False
+    print("✅ Every section ran to completion")
+    return True
+
+
+def test_slow_section_times_out():
+    """A section that runs longer than the timeout is still replaced by its fallback"""
+    print("\n=== Testing A Section Slower Than The Timeout ===")
+    service = make_service(workers=2, timeout=0.2)
+    sections = {
+        "collaborative": sleeping_section(1.0, ["a"]),
+        "contentBased": sleeping_section(0.0, ["b"]),
+    }
+    try:
+        started = time.monotonic()
+        results, degraded = service._run_sections("1", sections, 10, 0)
+        elapsed = time.monotonic() - started
+    finally:
+        service.section_executor.shutdown(wait=False)
+
+    print(f"Degraded sections: {degraded}, response took {elapsed:.2f}s")
+    if degraded != ["collaborative"] or results["contentBased"] != ["b"] or elapsed > 0.8:
+        print("❌ The slow section was not cut off at the timeout")
+        return False
+    print("✅ The slow section fell back after the timeout")
+    return True
+
+
+def main():
+    """Main function"""
+    saturated_success = test_saturated_executor()
+    timeout_success = test_slow_section_times_out()
+
+    print("\n=== Test Summary ===")
+    print(f"Saturated executor: {'✅ Success' if saturated_success else '❌ Failed'}")
+    print(f"Slow section timeout: {'✅ Success' if timeout_success else '❌ Failed'}")
+
+    if saturated_success and timeout_success:
+        print("\n✅ All tests passed!")
+        return 0
+    print("\n❌ Some tests failed.")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())